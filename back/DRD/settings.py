@@ -64,13 +64,24 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'user.authentication.CachedJWTAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
     'DEFAULT_PAGINATION_CLASS': 'api.pagination.CustomPagination',
     'PAGE_SIZE': 10,
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
     ],
+    # Annotated images are served without authentication, see operation.throttling
+    'DEFAULT_THROTTLE_RATES': {
+        'annotated_image': os.environ.get('ANNOTATED_IMAGE_RATE', '300/min'),
+        'annotated_render': os.environ.get('ANNOTATED_RENDER_RATE', '30/min'),
+    },
+    # Client addresses come from the X-Forwarded-For entry added by nginx
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', '1')),
 }
 
 SIMPLE_JWT = {
@@ -120,6 +131,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',  # Request latency and query metrics, outermost to time everything
     'corsheaders.middleware.CorsMiddleware',  # Added CORS middleware
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Added WhiteNoise for static files
@@ -201,6 +213,91 @@ AUTH_USER_MODEL = 'user.User'
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Damage detection
+DETECTION_ASYNC = os.environ.get('DETECTION_ASYNC', 'True').lower() == 'true'
+DETECTION_JOB_MAX_ATTEMPTS = int(os.environ.get('DETECTION_JOB_MAX_ATTEMPTS', '3'))
+DETECTION_JOB_STALE_AFTER = int(os.environ.get('DETECTION_JOB_STALE_AFTER', '120'))  # seconds without a heartbeat before a running job is reclaimed
+DETECTION_JOB_HEARTBEAT_INTERVAL = float(os.environ.get('DETECTION_JOB_HEARTBEAT_INTERVAL', '15'))  # seconds
+DETECTION_WORKER_POLL_INTERVAL = float(os.environ.get('DETECTION_WORKER_POLL_INTERVAL', '1.0'))  # seconds
+DETECTION_BATCH_SIZE = int(os.environ.get('DETECTION_BATCH_SIZE', '8'))  # images per forward pass
+DETECTION_ENGINE = os.environ.get('DETECTION_ENGINE', 'pytorch')  # pytorch, onnx, onnx-int8 or openvino
+DETECTION_IMAGE_SIZE = int(os.environ.get('DETECTION_IMAGE_SIZE', '640'))  # model input size
+DETECTION_MODEL_VERSION = os.environ.get('DETECTION_MODEL_VERSION', 'train8')  # used while the model registry is empty
+DETECTION_MODEL_POLL_INTERVAL = float(os.environ.get('DETECTION_MODEL_POLL_INTERVAL', '30'))  # seconds between registry checks, 0 disables hot-swap
+UPLOAD_STORAGE_THREADS = int(os.environ.get('UPLOAD_STORAGE_THREADS', '4'))  # parallel writes of uploaded originals
+DETECTION_PIPELINE_QUEUE_SIZE = int(os.environ.get('DETECTION_PIPELINE_QUEUE_SIZE', '2'))  # batches buffered between pipeline stages
+
+# Resumable chunked uploads
+UPLOAD_SESSION_DIR = os.environ.get('UPLOAD_SESSION_DIR', os.path.join(BASE_DIR, 'upload_sessions'))  # partial files, shared by all web workers
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', str(1024 * 1024)))  # bytes, suggested to clients
+UPLOAD_CHUNK_MAX_SIZE = int(os.environ.get('UPLOAD_CHUNK_MAX_SIZE', str(8 * 1024 * 1024)))  # bytes
+UPLOAD_MAX_FILE_SIZE = int(os.environ.get('UPLOAD_MAX_FILE_SIZE', str(50 * 1024 * 1024)))  # bytes
+UPLOAD_SESSION_MAX_FILES = int(os.environ.get('UPLOAD_SESSION_MAX_FILES', '50'))
+UPLOAD_SESSION_TTL = int(os.environ.get('UPLOAD_SESSION_TTL', '86400'))  # seconds before unfinished sessions are cleared
+
+# Map queries of detected damage
+DAMAGE_SEARCH_MAX_RADIUS = float(os.environ.get('DAMAGE_SEARCH_MAX_RADIUS', '50000'))  # meters
+DAMAGE_MAP_MAX_ZOOM = int(os.environ.get('DAMAGE_MAP_MAX_ZOOM', '20'))
+DAMAGE_MAP_CLUSTER_MAX_ZOOM = int(os.environ.get('DAMAGE_MAP_CLUSTER_MAX_ZOOM', '15'))  # tiles up to this zoom return clusters
+DAMAGE_MAP_TILE_MAX_POINTS = int(os.environ.get('DAMAGE_MAP_TILE_MAX_POINTS', '2000'))  # denser tiles stay clustered
+DAMAGE_MAP_TILE_TTL = int(os.environ.get('DAMAGE_MAP_TILE_TTL', '3600'))  # seconds, in case an invalidation was missed
+
+# Merging detections of the same damage into defects
+DEFECT_MERGE_ENABLED = os.environ.get('DEFECT_MERGE_ENABLED', 'True').lower() == 'true'
+DEFECT_MERGE_DISTANCE = float(os.environ.get('DEFECT_MERGE_DISTANCE', '15'))  # meters, about the GPS accuracy of phones
+
+# Detection cache for repeat uploads
+DETECTION_CACHE_ENABLED = os.environ.get('DETECTION_CACHE_ENABLED', 'True').lower() == 'true'
+DETECTION_CACHE_MAX_ENTRIES = int(os.environ.get('DETECTION_CACHE_MAX_ENTRIES', '50000'))
+DETECTION_CACHE_PHASH_ENABLED = os.environ.get('DETECTION_CACHE_PHASH_ENABLED', 'False').lower() == 'true'
+DETECTION_CACHE_PHASH_DISTANCE = int(os.environ.get('DETECTION_CACHE_PHASH_DISTANCE', '3'))  # max differing bits, at most 3
+
+# Sliced inference for high-resolution images (can also be enabled per upload)
+DETECTION_TILING_ENABLED = os.environ.get('DETECTION_TILING_ENABLED', 'False').lower() == 'true'
+DETECTION_TILE_SIZE = int(os.environ.get('DETECTION_TILE_SIZE', '640'))  # pixels
+DETECTION_TILE_OVERLAP = float(os.environ.get('DETECTION_TILE_OVERLAP', '0.2'))  # fraction of the tile size
+DETECTION_TILE_MAX_TILES = int(os.environ.get('DETECTION_TILE_MAX_TILES', '512'))  # per image, larger uploads are rejected
+DETECTION_TILE_BATCH_SIZE = int(os.environ.get('DETECTION_TILE_BATCH_SIZE', '16'))  # tiles per forward pass
+DETECTION_TILE_MERGE_THRESHOLD = float(os.environ.get('DETECTION_TILE_MERGE_THRESHOLD', '0.5'))  # IoU above which same-class boxes across tiles are suppressed
+
+# Cache of dashboard stats, report payloads and authenticated users, shared through Redis.
+# Without REDIS_URL each process has its own in-memory cache that cannot see the
+# invalidations of other processes, so the cache layer is off unless enabled, e.g. in tests.
+REDIS_URL = os.environ.get('REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'drd',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'drd',
+        }
+    }
+CACHE_ENABLED = os.environ.get('CACHE_ENABLED', str(bool(REDIS_URL))).lower() == 'true'
+DASHBOARD_STATS_CACHE_TTL = int(os.environ.get('DASHBOARD_STATS_CACHE_TTL', '300'))  # seconds
+REPORT_CACHE_TTL = int(os.environ.get('REPORT_CACHE_TTL', '300'))  # seconds
+USER_CACHE_TTL = int(os.environ.get('USER_CACHE_TTL', '300'))  # seconds
+
+# On-demand annotated images
+RENDERED_IMAGE_CACHE_MAX_MB = int(os.environ.get('RENDERED_IMAGE_CACHE_MAX_MB', '1024'))
+
+# Shared inference server (leave the socket empty to load the model in every process)
+INFERENCE_SERVER_SOCKET = os.environ.get('INFERENCE_SERVER_SOCKET', '')
+INFERENCE_SERVER_REPLICAS = int(os.environ.get('INFERENCE_SERVER_REPLICAS', '1'))
+INFERENCE_SERVER_MAX_WAIT_MS = int(os.environ.get('INFERENCE_SERVER_MAX_WAIT_MS', '10'))
+INFERENCE_SERVER_TIMEOUT = float(os.environ.get('INFERENCE_SERVER_TIMEOUT', '120'))  # seconds
+
+# Metrics port of detection workers and the inference server (0 disables it).
+# Web workers serve theirs at /api/metrics/ to scrapers sending this bearer token (empty disables it).
+DETECTION_METRICS_PORT = int(os.environ.get('DETECTION_METRICS_PORT', '0'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 
 
 
@@ -230,5 +327,10 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'operation': {
+            'handlers': ['file', 'console'],
+            'level': 'INFO',
+            'propagate': True,
+        },
     },
 }
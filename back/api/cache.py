@@ -0,0 +1,47 @@
+"""
+Cached values keyed by a generation number kept in the shared cache.
+Invalidating bumps the generation once the change commits, which orphans
+every entry computed before, including one a concurrent request is about
+to store from rows it read before the commit. Requests made after the
+change returned always read the new generation.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+def get_generation_key(name):
+    return f'generation:{name}'
+
+def get_generation(name):
+    key = get_generation_key(name)
+    generation = cache.get(key)
+    if generation is None:
+        # Start from the clock, so a generation lost to eviction never repeats an old one
+        cache.add(key, time.time_ns(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+def bump_generation(name):
+    try:
+        cache.incr(get_generation_key(name))
+    except ValueError:
+        # Nothing cached under any generation yet
+        cache.add(get_generation_key(name), time.time_ns(), timeout=None)
+
+def invalidate_on_commit(name):
+    """Invalidate the cached values of name once the current transaction commits."""
+    transaction.on_commit(lambda: bump_generation(name))
+
+def get_or_compute(name, compute, timeout):
+    """Value of compute(), cached until name is invalidated or timeout seconds pass."""
+    if not settings.CACHE_ENABLED:
+        return compute()
+    key = f'{name}:{get_generation(name)}'
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout)
+    return value
@@ -0,0 +1,64 @@
+from django.db import connection
+from prometheus_client import Histogram
+import time
+
+REQUEST_SECONDS = Histogram(
+    'drd_http_request_duration_seconds',
+    'Request latency by endpoint.',
+    ['method', 'endpoint', 'status'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+REQUEST_DB_QUERIES = Histogram(
+    'drd_http_request_db_queries',
+    'Database queries per request.',
+    ['endpoint'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 250),
+)
+REQUEST_DB_SECONDS = Histogram(
+    'drd_http_request_db_seconds',
+    'Database time per request.',
+    ['endpoint'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+
+class QueryTimer:
+    """Database execute wrapper counting and timing the queries of one request."""
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+class MetricsMiddleware:
+    """
+    Records latency, query count and database time of every request,
+    labelled by URL name so the number of series stays bounded.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        start = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        resolver_match = getattr(request, 'resolver_match', None)
+        endpoint = resolver_match.view_name if resolver_match else 'unmatched'
+        REQUEST_SECONDS.labels(
+            method=request.method,
+            endpoint=endpoint,
+            status=str(response.status_code),
+        ).observe(duration)
+        REQUEST_DB_QUERIES.labels(endpoint=endpoint).observe(timer.count)
+        REQUEST_DB_SECONDS.labels(endpoint=endpoint).observe(timer.seconds)
+        return response
@@ -1,13 +1,78 @@
 # your_app/pagination.py
 
-from rest_framework.pagination import PageNumberPagination
+import json
+
+from django.db import connections
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 from rest_framework.response import Response
 
+
+def get_estimated_count(queryset):
+    """
+    Rows the Postgres planner expects a queryset to return, from table
+    statistics and without running it. Other databases count exactly.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Cursor pages in the given ordering, which must end with a unique field.
+    Cursors stay stable while rows are added and need no COUNT.
+    """
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def __init__(self, ordering):
+        self.ordering = ordering
+
+
 class CustomPagination(PageNumberPagination):
+    """
+    Page numbers with totals by default. ?pagination=cursor switches to keyset
+    pages in the view's cursor_ordering, without COUNT(*) or OFFSET scans;
+    ?count=estimate then adds the planner's estimate of the total.
+    """
     page_size_query_param = 'page_size'
     max_page_size = 100
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+    default_cursor_ordering = ('-id',)
+
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if request.query_params.get(self.mode_query_param) != 'cursor':
+            return super().paginate_queryset(queryset, request, view)
+
+        self.keyset = KeysetPagination(getattr(view, 'cursor_ordering', self.default_cursor_ordering))
+        self.estimated_total = None
+        if request.query_params.get(self.count_query_param) == 'estimate':
+            self.estimated_total = get_estimated_count(queryset)
+        page = self.keyset.paginate_queryset(queryset, request, view)
+        self.display_page_controls = self.keyset.display_page_controls
+        return page
 
     def get_paginated_response(self, data):
+        if self.keyset is not None:
+            response_data = {
+                'next': self.keyset.get_next_link(),
+                'previous': self.keyset.get_previous_link(),
+                'results': data,
+            }
+            if self.estimated_total is not None:
+                response_data['estimated_total'] = self.estimated_total
+            return Response(response_data)
+
         return Response({
             'total_items': self.page.paginator.count,
             'total_pages': self.page.paginator.num_pages,
@@ -16,3 +81,9 @@ class CustomPagination(PageNumberPagination):
             'previous': self.get_previous_link(),
             'results': data,
         })
+
+    def to_html(self):
+        if self.keyset is not None:
+            return self.keyset.to_html()
+        return super().to_html()
+
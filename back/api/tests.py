@@ -1,3 +1,71 @@
-from django.test import TestCase
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
 
-# Create your tests here.
+from operation.models import Operation, Report
+from user.models import User
+
+
+class ReportPaginationTests(APITestCase):
+    def setUp(self):
+        self.worker = User.objects.create_user(
+            username='worker', email='worker@example.com', password='password123', is_worker=True
+        )
+        self.citizen = User.objects.create_user(username='citizen', email='citizen@example.com', password='password123')
+        self.client.force_authenticate(self.worker)
+        for _ in range(7):
+            self.create_report()
+
+    def create_report(self):
+        return Report.objects.create(operation=Operation.objects.create(), user=self.citizen)
+
+    def expected_ids(self):
+        return list(Report.objects.order_by('-date', '-id').values_list('id', flat=True))
+
+    def get_ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [report['id'] for report in response.data['results']]
+
+    def test_page_numbers_count_reports(self):
+        response = self.client.get('/api/reports/', {'page_size': 3, 'page': 2, 'fields': 'id'})
+
+        self.assertEqual((response.data['total_items'], response.data['total_pages']), (7, 3))
+        self.assertEqual(len(self.get_ids(response)), 3)
+
+    def test_cursor_pages_run_without_count(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/reports/', {'pagination': 'cursor', 'page_size': 3, 'fields': 'id'})
+
+        self.assertEqual(self.get_ids(response), self.expected_ids()[:3])
+        self.assertNotIn('total_items', response.data)
+        self.assertNotIn('estimated_total', response.data)
+        self.assertFalse(any('COUNT(' in query['sql'].upper() for query in context.captured_queries))
+
+    def test_cursor_pages_are_stable_while_reports_are_added(self):
+        expected = self.expected_ids()
+        seen = []
+        url, params = '/api/reports/', {'pagination': 'cursor', 'page_size': 3, 'fields': 'id'}
+        while url:
+            response = self.client.get(url, params)
+            seen.extend(self.get_ids(response))
+            # Newer reports go before the first page, so later pages neither skip nor repeat any
+            self.create_report()
+            url, params = response.data['next'], None
+
+        self.assertEqual(seen, expected)
+
+    def test_previous_link_returns_to_earlier_page(self):
+        first = self.client.get('/api/reports/', {'pagination': 'cursor', 'page_size': 3, 'fields': 'id'})
+        second = self.client.get(first.data['next'])
+        self.assertIsNone(first.data['previous'])
+
+        self.assertEqual(self.get_ids(self.client.get(second.data['previous'])), self.get_ids(first))
+
+    def test_estimated_count_on_request(self):
+        response = self.client.get(
+            '/api/reports/', {'pagination': 'cursor', 'count': 'estimate', 'page_size': 3, 'fields': 'id'}
+        )
+
+        # Databases other than Postgres count exactly
+        self.assertEqual(response.data['estimated_total'], 7)
+        self.assertEqual(len(self.get_ids(response)), 3)
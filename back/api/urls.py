@@ -1,13 +1,15 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from operation.views import OperationViewSet, ReportViewSet, submit_report, update_report_status, get_dashboard_stats
+from operation.views import OperationViewSet, ReportViewSet, DefectViewSet, submit_report, update_report_status, get_dashboard_stats, get_report_series_stats, get_detection_job_status, get_annotated_image, create_upload_session, get_upload_session, upload_session_chunk, finalize_upload, search_damage, get_damage_map_tile
 from user.views import RegisterView, LoginView, user_detail_view, user_reports_view, update_user_view
 from rest_framework_simplejwt.views import TokenVerifyView, TokenBlacklistView
+from .views import metrics_view
 
 # Create a router for viewsets
 router = DefaultRouter()
 router.register(r'operations', OperationViewSet, basename='operation')
 router.register(r'reports', ReportViewSet, basename='report')
+router.register(r'defects', DefectViewSet, basename='defect')
 
 urlpatterns = [
     # User authentication endpoints
@@ -21,8 +23,26 @@ urlpatterns = [
     path('reports/submit/', submit_report, name='submit-report'),
     path('reports/<int:report_id>/status/', update_report_status, name='update-report-status'),
     path('reports/stats/', get_dashboard_stats, name='reports-stats'),
+    path('reports/stats/series/', get_report_series_stats, name='reports-stats-series'),
+
+    # Resumable uploads of operation images
+    path('uploads/', create_upload_session, name='upload-session-create'),
+    path('uploads/<int:session_id>/', get_upload_session, name='upload-session-detail'),
+    path('uploads/<int:session_id>/files/<int:index>/', upload_session_chunk, name='upload-session-chunk'),
+    path('uploads/<int:session_id>/finalize/', finalize_upload, name='upload-session-finalize'),
+
+    # Detected damage on the map
+    path('damage/', search_damage, name='damage-search'),
+    path('damage/tiles/<int:z>/<int:x>/<int:y>/', get_damage_map_tile, name='damage-map-tile'),
+
+    # Damage detection jobs
+    path('jobs/<int:job_id>/', get_detection_job_status, name='detection-job-status'),
+    path('images/<int:image_id>/annotated/', get_annotated_image, name='annotated-image'),
 
     # Token management
     path('token/verify/', TokenVerifyView.as_view(), name='token_verify'),
     path('logout/', TokenBlacklistView.as_view(), name='token_blacklist'),
+
+    # Prometheus metrics
+    path('metrics/', metrics_view, name='metrics'),
 ] + router.urls
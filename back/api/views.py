@@ -1,3 +1,30 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.views.decorators.http import require_GET
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest, multiprocess
+import hmac
+import os
 
-# Create your views here.
+
+@require_GET
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint, for scrapers sending METRICS_TOKEN as a
+    bearer token. Not found while no token is configured. Under gunicorn the
+    metrics of all workers are aggregated from the shared PROMETHEUS_MULTIPROC_DIR.
+    """
+    if not settings.METRICS_TOKEN:
+        raise Http404
+    # Behind the proxy every request comes from the same address, so only the token is trusted
+    expected = f'Bearer {settings.METRICS_TOKEN}'
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected.encode()):
+        response = HttpResponse('Authentication credentials were not provided or are invalid.', status=401)
+        response['WWW-Authenticate'] = 'Bearer realm="metrics"'
+        return response
+
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
@@ -2,6 +2,7 @@
 
 import multiprocessing
 import os
+import shutil
 
 # Server socket
 bind = "0.0.0.0:8000"
@@ -33,6 +34,17 @@ worker_tmp_dir = "/dev/shm"
 # Preload app for better performance
 preload_app = True
 
+# Prometheus metrics are written by every worker to a shared directory and
+# aggregated by the /api/metrics/ view. Start each run with an empty directory.
+prometheus_multiproc_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/dev/shm/drd_prometheus")
+shutil.rmtree(prometheus_multiproc_dir, ignore_errors=True)
+os.makedirs(prometheus_multiproc_dir, exist_ok=True)
+
+def child_exit(server, worker):
+    # Drop live gauges of workers that exited
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
 # Security
 limit_request_line = 4096
 limit_request_fields = 100
@@ -1,7 +1,16 @@
 from django.contrib import admin
-from operation.models import Operation, OperationImage, OperationResult,Report
+from operation.models import Operation, OperationImage, OperationResult, Report, DetectionJob, DetectionCacheEntry, DetectionModel, ShadowDetectionResult, UploadSession, UploadFile, MapTile, Defect, ReportCounter
 
 admin.site.register(Operation)  
 admin.site.register(OperationImage)
 admin.site.register(OperationResult)
 admin.site.register(Report)
+admin.site.register(DetectionJob)
+admin.site.register(DetectionCacheEntry)
+admin.site.register(DetectionModel)
+admin.site.register(ShadowDetectionResult)
+admin.site.register(UploadSession)
+admin.site.register(UploadFile)
+admin.site.register(MapTile)
+admin.site.register(Defect)
+admin.site.register(ReportCounter)
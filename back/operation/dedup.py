@@ -0,0 +1,159 @@
+from collections import Counter
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+import cv2
+import hashlib
+import logging
+
+from .models import DetectionCacheEntry
+from .registry import get_model_version
+
+logger = logging.getLogger(__name__)
+
+DETECTION_KEYS = ('class_id', 'confidence', 'bbox', 'damage_type', 'model_version')
+# Rows deleted per statement when evicting
+EVICTION_BATCH_SIZE = 1000
+
+
+def compute_content_hash(data):
+    """SHA-256 of the raw uploaded bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+def compute_dhash(image):
+    """64-bit difference hash of a BGR image, robust to re-encoding and small edits."""
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    value = 0
+    for bit in (small[:, 1:] > small[:, :-1]).flatten():
+        value = (value << 1) | int(bit)
+    return value
+
+def split_bands(phash):
+    """Split a 64-bit hash into four 16-bit bands."""
+    return [(phash >> shift) & 0xFFFF for shift in (48, 32, 16, 0)]
+
+def to_signed(phash):
+    """Fit an unsigned 64-bit hash into a signed BigIntegerField."""
+    return phash - (1 << 64) if phash >= (1 << 63) else phash
+
+def to_unsigned(phash):
+    return phash + (1 << 64) if phash < 0 else phash
+
+def hamming_distance(hash_a, hash_b):
+    return bin(hash_a ^ hash_b).count('1')
+
+def fingerprint_image(data, image, model_version=None):
+    """Compute the cache keys of a decoded upload."""
+    return {
+        'content_hash': compute_content_hash(data),
+        'phash': compute_dhash(image),
+        'model_version': model_version or get_model_version(),
+    }
+
+def find_cache_entry(fingerprint):
+    """
+    Look up cached detections by exact content hash, then by perceptual hash
+    when the fingerprint has one. Any two hashes within 3 bits share at least
+    one identical band, so only entries matching a band need their distance checked.
+    Hits are not counted here, pass the ids of hit entries to record_cache_hits.
+    """
+    entries = DetectionCacheEntry.objects.filter(model_version=fingerprint['model_version'])
+
+    entry = entries.filter(content_hash=fingerprint['content_hash']).first()
+    if entry is None and settings.DETECTION_CACHE_PHASH_ENABLED and fingerprint['phash'] is not None:
+        bands = split_bands(fingerprint['phash'])
+        candidates = entries.filter(
+            Q(phash_band0=bands[0]) | Q(phash_band1=bands[1]) |
+            Q(phash_band2=bands[2]) | Q(phash_band3=bands[3])
+        )[:100]
+        best_distance = settings.DETECTION_CACHE_PHASH_DISTANCE + 1
+        for candidate in candidates:
+            distance = hamming_distance(fingerprint['phash'], to_unsigned(candidate.phash))
+            if distance < best_distance:
+                entry, best_distance = candidate, distance
+    return entry
+
+def record_cache_hits(entry_ids):
+    """
+    Count hits on cache entries and mark them as recently used, with one
+    update per distinct number of hits rather than one per lookup.
+    """
+    entry_ids_by_hits = {}
+    for entry_id, hits in Counter(entry_ids).items():
+        entry_ids_by_hits.setdefault(hits, []).append(entry_id)
+
+    now = timezone.now()
+    for hits, ids in entry_ids_by_hits.items():
+        DetectionCacheEntry.objects.filter(id__in=ids).update(
+            hit_count=F('hit_count') + hits,
+            last_used_at=now
+        )
+
+def get_cached_detections(entry, image):
+    """Return an entry's detections, rescaled to the size of image."""
+    height, width = image.shape[:2]
+    scale_x = width / entry.width
+    scale_y = height / entry.height
+    detections = []
+    for detection in entry.detections:
+        x1, y1, x2, y2 = detection['bbox']
+        detections.append({
+            **detection,
+            'bbox': [x1 * scale_x, y1 * scale_y, x2 * scale_x, y2 * scale_y],
+        })
+    return detections
+
+def store_cache_entry(fingerprint, image, detections):
+    """Cache the detections of a freshly processed image."""
+    height, width = image.shape[:2]
+    bands = split_bands(fingerprint['phash'])
+    DetectionCacheEntry.objects.update_or_create(
+        content_hash=fingerprint['content_hash'],
+        model_version=fingerprint['model_version'],
+        defaults={
+            'phash': to_signed(fingerprint['phash']),
+            'phash_band0': bands[0],
+            'phash_band1': bands[1],
+            'phash_band2': bands[2],
+            'phash_band3': bands[3],
+            'width': width,
+            'height': height,
+            'detections': [
+                {key: detection[key] for key in DETECTION_KEYS if key in detection}
+                for detection in detections
+            ],
+            'last_used_at': timezone.now(),
+        }
+    )
+
+def evict_cache_entries(max_entries=None):
+    """
+    Delete the least recently used entries beyond max_entries.
+    The cutoff is read from the single row ranked max_entries, then
+    everything older is deleted in batches.
+    """
+    max_entries = settings.DETECTION_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+    cutoff = list(
+        DetectionCacheEntry.objects
+        .order_by('-last_used_at', '-id')
+        .values_list('last_used_at', 'id')[max_entries:max_entries + 1]
+    )
+    if not cutoff:
+        return 0
+
+    last_used_at, entry_id = cutoff[0]
+    stale = DetectionCacheEntry.objects.filter(
+        Q(last_used_at__lt=last_used_at) | Q(last_used_at=last_used_at, id__lte=entry_id)
+    )
+    deleted = 0
+    while True:
+        stale_ids = list(stale.values_list('id', flat=True)[:EVICTION_BATCH_SIZE])
+        if not stale_ids:
+            break
+        count, _ = DetectionCacheEntry.objects.filter(id__in=stale_ids).delete()
+        deleted += count
+
+    if deleted:
+        logger.info(f"Evicted {deleted} detection cache entries")
+    return deleted
@@ -0,0 +1,161 @@
+import math
+import zlib
+import logging
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .geo import GEOHASH_PRECISION, METERS_PER_DEGREE, encode_geohash, get_cell_size, haversine_distance
+from .etags import touch_reports
+from .models import Defect, OperationResult, Report
+
+logger = logging.getLogger(__name__)
+
+
+def get_merge_precision(latitude, distance):
+    """Finest geohash precision whose cells are at least distance wide and high at a latitude."""
+    cos_lat = max(math.cos(math.radians(float(latitude))), 1e-6)
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        width, height = get_cell_size(precision)
+        if width * METERS_PER_DEGREE * cos_lat >= distance and height * METERS_PER_DEGREE >= distance:
+            return precision
+    return 1
+
+def get_neighbour_cells(latitude, longitude, precision):
+    """
+    The cell of a point and the eight around it. Anything closer to the point
+    than one cell size lies in one of them.
+    """
+    latitude, longitude = float(latitude), float(longitude)
+    width, height = get_cell_size(precision)
+    return sorted({
+        encode_geohash(
+            max(min(latitude + row * height, 90.0), -90.0),
+            (longitude + col * width + 180.0) % 360.0 - 180.0,
+            precision
+        )
+        for row in (-1, 0, 1)
+        for col in (-1, 0, 1)
+    })
+
+def lock_cells(cells):
+    """
+    Serialize merges around the same cells across processes until the
+    transaction ends, so two reports of a new defect do not both create it.
+    """
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        # Cells come sorted, so concurrent merges take the locks in the same order
+        for cell in cells:
+            cursor.execute('SELECT pg_advisory_xact_lock(%s)', [zlib.crc32(f'defect:{cell}'.encode())])
+
+def merge_detection(result, latitude, longitude, seen_at):
+    """
+    Merge a detection into the nearest defect of its damage type within
+    DEFECT_MERGE_DISTANCE, or start a new defect. Only defects in the
+    neighbouring geohash cells are considered. Must run in a transaction.
+    """
+    distance = settings.DEFECT_MERGE_DISTANCE
+    cells = get_neighbour_cells(latitude, longitude, get_merge_precision(latitude, distance))
+    lock_cells(cells)
+
+    cell_filter = Q()
+    for cell in cells:
+        cell_filter |= Q(geohash__startswith=cell)
+    candidates = Defect.objects.select_for_update().filter(cell_filter, damage_type=result.damage_type)
+
+    nearest, nearest_distance = None, None
+    for defect in candidates:
+        defect_distance = haversine_distance(latitude, longitude, defect.latitude, defect.longitude)
+        if defect_distance <= distance and (nearest is None or defect_distance < nearest_distance):
+            nearest, nearest_distance = defect, defect_distance
+
+    if nearest is None:
+        return Defect.objects.create(
+            damage_type=result.damage_type,
+            class_id=result.class_id,
+            latitude=latitude,
+            longitude=longitude,
+            geohash=encode_geohash(latitude, longitude),
+            detection_count=1,
+            first_seen_at=seen_at,
+            last_seen_at=seen_at,
+        )
+
+    # Move the centroid towards the new detection
+    count = nearest.detection_count
+    nearest.latitude = round((float(nearest.latitude) * count + float(latitude)) / (count + 1), 10)
+    nearest.longitude = round((float(nearest.longitude) * count + float(longitude)) / (count + 1), 10)
+    nearest.geohash = encode_geohash(nearest.latitude, nearest.longitude)
+    nearest.detection_count = count + 1
+    nearest.first_seen_at = min(nearest.first_seen_at, seen_at)
+    nearest.last_seen_at = max(nearest.last_seen_at, seen_at)
+    nearest.save(update_fields=['latitude', 'longitude', 'geohash', 'detection_count', 'first_seen_at', 'last_seen_at'])
+    return nearest
+
+def refresh_defect_counts(defect_ids):
+    """
+    Recount detections and reports of defects, deleting defects left without
+    detections. Reports showing the defects get a new version marker.
+    """
+    if not defect_ids:
+        return
+    report_links = Report.defects.through.objects.filter(defect_id=OuterRef('pk'))
+    results = OperationResult.objects.filter(defect_id=OuterRef('pk'))
+    Defect.objects.filter(id__in=defect_ids).update(
+        report_count=Coalesce(Subquery(report_links.values('defect_id').annotate(count=Count('*')).values('count')), 0),
+        detection_count=Coalesce(Subquery(results.values('defect_id').annotate(count=Count('*')).values('count')), 0),
+    )
+    touch_reports(Report.objects.filter(defects__in=defect_ids))
+    Defect.objects.filter(id__in=defect_ids, detection_count=0).delete()
+
+def link_reports(report_ids, defect_ids):
+    """Link reports to defects and update the defects' counts."""
+    Report.defects.through.objects.bulk_create(
+        [
+            Report.defects.through(report_id=report_id, defect_id=defect_id)
+            for report_id in report_ids
+            for defect_id in defect_ids
+        ],
+        ignore_conflicts=True
+    )
+    refresh_defect_counts(defect_ids)
+
+def assign_defects(operation_image, results, seen_at=None):
+    """
+    Merge the detections of an image into defects and link them to the
+    reports of its operation. The location is the one of the photo, so
+    detections of one damage type in one photo end up in the same defect.
+    Returns the ids of the defects involved.
+    """
+    if not settings.DEFECT_MERGE_ENABLED or not results:
+        return []
+
+    seen_at = seen_at or timezone.now()
+    with transaction.atomic():
+        defect_ids = set()
+        for result in results:
+            result.defect = merge_detection(result, operation_image.latitude, operation_image.longitude, seen_at)
+            defect_ids.add(result.defect.id)
+        OperationResult.objects.bulk_update(results, ['defect'])
+
+        report_ids = list(Report.objects.filter(operation_id=operation_image.operation_id).values_list('id', flat=True))
+        link_reports(report_ids, defect_ids)
+
+    return sorted(defect_ids)
+
+def link_report_defects(report):
+    """Link a new report to the defects already detected in its operation."""
+    defect_ids = list(
+        Defect.objects
+        .filter(results__operation_image__operation_id=report.operation_id)
+        .values_list('id', flat=True)
+        .distinct()
+    )
+    if defect_ids:
+        link_reports([report.id], defect_ids)
+    return defect_ids
@@ -0,0 +1,75 @@
+import hashlib
+
+from django.db.models import F, Max
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+from .models import Report, ReportGeneration
+
+
+def touch_reports(reports):
+    """
+    Bump the version marker of reports whose rendered JSON changed without
+    the report being saved, e.g. its images, detections or defects.
+    """
+    return reports.update(updated_at=timezone.now())
+
+def touch_operation_reports(operation_id):
+    return touch_reports(Report.objects.filter(operation_id=operation_id))
+
+def bump_report_generation():
+    """Bump the report generation, in the transaction of the report change."""
+    if not ReportGeneration.objects.filter(pk=1).update(value=F('value') + 1):
+        # Created by the migration, only missing if the table was emptied since
+        ReportGeneration.objects.get_or_create(pk=1, defaults={'value': 1})
+
+def get_report_generation():
+    return ReportGeneration.objects.filter(pk=1).values_list('value', flat=True).first() or 0
+
+def get_report_version(reports, membership=True):
+    """
+    (newest updated_at, report generation) of the reports a response renders,
+    newest updated_at read from its index. The generation catches reports
+    leaving a list, e.g. deleted ones. Responses of a single report leave it
+    out with membership=False, so changes to other reports keep their version.
+    """
+    last_updated = reports.order_by().aggregate(last_updated=Max('updated_at'))['last_updated']
+    return last_updated, get_report_generation() if membership else None
+
+def get_body_parts(request, version):
+    """What a report response body depends on besides the viewer: versions, query, host and format."""
+    last_updated, generation = version
+    renderer = getattr(request, 'accepted_renderer', None)
+    return [
+        last_updated.isoformat() if last_updated else '',
+        '' if generation is None else str(generation),
+        request.build_absolute_uri(),
+        renderer.format if renderer else '',
+    ]
+
+def get_report_etag(request, version):
+    """Strong ETag of a report response, from the version of its reports and what else shapes it."""
+    parts = [str(request.user.id), *get_body_parts(request, version)]
+    return '"%s"' % hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+def get_report_cache_key(request, version):
+    """
+    Cache key of a report payload. Any change to the report bumps its version
+    and so the key, whichever process made it. Payloads are shared by every
+    viewer allowed to see the report.
+    """
+    return 'report:' + hashlib.sha1('|'.join(get_body_parts(request, version)).encode()).hexdigest()
+
+def get_not_modified_response(request, etag):
+    """304 Not Modified when the request's If-None-Match matches the ETag, None otherwise."""
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        set_etag(response, etag)
+    return response
+
+def set_etag(response, etag):
+    """Tag a report response; clients revalidate it on every use and shared caches keep none."""
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    patch_vary_headers(response, ['Authorization'])
+    return response
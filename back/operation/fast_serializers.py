@@ -0,0 +1,170 @@
+"""
+Read-only serialization of reports from values() rows. Renders the same
+JSON as ReportSerializer without model instances or serializer fields, for
+the report list and detail endpoints. Keep the two in step, the golden test
+in operation.tests compares them.
+"""
+import decimal
+from operator import itemgetter
+
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import OperationImage, OperationResult, Report
+
+# Readable ReportSerializer fields, in its order
+REPORT_FIELDS = ['id', 'description', 'status', 'operation', 'user_info', 'date', 'defects']
+USER_COLUMNS = ['user_id', 'user__username', 'user__email', 'user__phone_number', 'user__is_worker']
+# Stand-in image id to split the annotated image URL around
+IMAGE_ID_PLACEHOLDER = 987654321
+# As DRF's DecimalField renders the coordinates, decimal_places=10 and max_digits=20
+COORDINATE_QUANTUM = decimal.Decimal('.1') ** 10
+COORDINATE_CONTEXT = decimal.Context(prec=20)
+
+
+def format_datetime(value):
+    """As DRF's DateTimeField renders it."""
+    value = timezone.localtime(value).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+def format_coordinate(value):
+    return '{:f}'.format(value.quantize(COORDINATE_QUANTUM, context=COORDINATE_CONTEXT))
+
+
+class ImageUrls:
+    """Absolute image URLs for one request, with the host and URL patterns resolved once."""
+    def __init__(self, request):
+        self.request = request
+        self.host = request.build_absolute_uri('/')[:-1]
+        self.original_storage = OperationImage._meta.get_field('original_image').storage
+        self.operated_storage = OperationImage._meta.get_field('operated_image').storage
+        path = reverse('annotated-image', args=[IMAGE_ID_PLACEHOLDER])
+        self.annotated_prefix, self.annotated_suffix = path.split(str(IMAGE_ID_PLACEHOLDER))
+
+    def absolute(self, url):
+        """request.build_absolute_uri() without parsing the URL of every image."""
+        if url.startswith('/') and not url.startswith('//') and '/./' not in url and '/../' not in url:
+            return self.host + url
+        return self.request.build_absolute_uri(url)
+
+    def original(self, name):
+        return self.absolute(self.original_storage.url(name)) if name else None
+
+    def annotated(self, image_id, operated_name, result_ids, size):
+        """As OperationImageSerializer.get_annotated_url."""
+        if operated_name:
+            return self.absolute(self.operated_storage.url(operated_name))
+        if not result_ids:
+            return None
+        return f"{self.host}{self.annotated_prefix}{image_id}{self.annotated_suffix}?size={size}&v={max(result_ids)}"
+
+
+def get_report_values(queryset, fields=None):
+    """Rows of the report columns that rendering the fields needs, all of them when fields is None."""
+    columns = ['id', 'description', 'status', 'date', 'operation_id']
+    if fields is None or 'user_info' in fields:
+        columns += USER_COLUMNS
+    return queryset.prefetch_related(None).values(*columns)
+
+def get_processed_results(operation_ids, urls):
+    """{operation_id: processed_results} as OperationSerializer renders them, in two queries."""
+    results = {}
+    result_rows = (
+        OperationResult.objects
+        .filter(operation_image__operation_id__in=operation_ids)
+        .order_by('id')
+        .values_list(
+            'id', 'operation_image_id', 'damage_description', 'damage_type', 'class_id', 'confidence',
+            'bbox_x1', 'bbox_y1', 'bbox_x2', 'bbox_y2', 'model_version'
+        )
+    )
+    for result_id, image_id, description, damage_type, class_id, confidence, x1, y1, x2, y2, model_version in result_rows:
+        results.setdefault(image_id, []).append({
+            'id': result_id,
+            'damage_description': description,
+            'damage_type': damage_type,
+            'class_id': class_id,
+            'confidence': confidence,
+            'bbox': None if x1 is None else [x1, y1, x2, y2],
+            'model_version': model_version,
+        })
+
+    processed_results = {operation_id: [] for operation_id in operation_ids}
+    image_rows = (
+        OperationImage.objects
+        .filter(operation_id__in=operation_ids)
+        .order_by('id')
+        .values_list('id', 'operation_id', 'longitude', 'latitude', 'original_image', 'operated_image', 'detection_status')
+    )
+    for image_id, operation_id, longitude, latitude, original_name, operated_name, detection_status in image_rows:
+        image_results = results.get(image_id, [])
+        result_ids = [result['id'] for result in image_results]
+        processed_results[operation_id].append({
+            'id': image_id,
+            'longitude': format_coordinate(longitude),
+            'latitude': format_coordinate(latitude),
+            'original_image': urls.original(original_name),
+            'operated_image': urls.annotated(image_id, operated_name, result_ids, 'full'),
+            'operated_thumbnail': urls.annotated(image_id, operated_name, result_ids, 'thumbnail'),
+            'detection_status': detection_status,
+            'results': image_results,
+        })
+    return processed_results
+
+def get_report_defects(report_ids):
+    """{report_id: defects} as DefectSummarySerializer renders them, in one query."""
+    defects = {}
+    rows = (
+        Report.defects.through.objects
+        .filter(report_id__in=report_ids)
+        .order_by('defect_id')
+        .values_list(
+            'report_id', 'defect_id', 'defect__damage_type', 'defect__detection_count',
+            'defect__report_count', 'defect__last_seen_at'
+        )
+    )
+    for report_id, defect_id, damage_type, detection_count, report_count, last_seen_at in rows:
+        defects.setdefault(report_id, []).append({
+            'id': defect_id,
+            'damage_type': damage_type,
+            'detection_count': detection_count,
+            'report_count': report_count,
+            'last_seen_at': format_datetime(last_seen_at),
+        })
+    return defects
+
+def get_user_info(row):
+    return {
+        'id': row['user_id'],
+        'username': row['user__username'],
+        'email': row['user__email'],
+        'phone_number': row['user__phone_number'] or '',
+        'is_worker': row['user__is_worker'],
+    }
+
+def serialize_report_rows(rows, request, fields=None):
+    """
+    Render rows of get_report_values() as ReportSerializer(many=True) would,
+    limited to the given field names as DynamicFieldsMixin does. Related rows
+    take one query per nested field.
+    """
+    fields = REPORT_FIELDS if fields is None else [name for name in REPORT_FIELDS if name in fields]
+    getters = []
+    for name in fields:
+        if name == 'operation':
+            operations = get_processed_results({row['operation_id'] for row in rows}, ImageUrls(request))
+            getter = lambda row: {'id': row['operation_id'], 'processed_results': operations[row['operation_id']]}
+        elif name == 'user_info':
+            getter = get_user_info
+        elif name == 'date':
+            getter = lambda row: format_datetime(row['date'])
+        elif name == 'defects':
+            defects = get_report_defects([row['id'] for row in rows])
+            getter = lambda row: defects.get(row['id'], [])
+        else:
+            getter = itemgetter(name)
+        getters.append((name, getter))
+
+    return [{name: getter(row) for name, getter in getters} for row in rows]
@@ -0,0 +1,78 @@
+import math
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 12
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEGREE = 111320.0
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    """Geohash of a point. Nearby points share a prefix, so a B-tree can range-scan them."""
+    latitude, longitude = float(latitude), float(longitude)
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True  # bits alternate between longitude and latitude, starting with longitude
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+def get_cell_size(precision):
+    """Width and height in degrees of geohash cells of a precision."""
+    lon_bits = math.ceil(5 * precision / 2)
+    lat_bits = math.floor(5 * precision / 2)
+    return 360.0 / 2 ** lon_bits, 180.0 / 2 ** lat_bits
+
+def get_covering_cells(min_lat, min_lon, max_lat, max_lon, max_cells=32):
+    """
+    Geohash prefixes whose cells together cover a bounding box, at the finest
+    precision needing at most max_cells of them. Boxes crossing the
+    antimeridian are not supported.
+    """
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        width, height = get_cell_size(precision)
+        first_col = math.floor((min_lon + 180.0) / width)
+        last_col = math.floor((min(max_lon, 180.0 - 1e-9) + 180.0) / width)
+        first_row = math.floor((min_lat + 90.0) / height)
+        last_row = math.floor((min(max_lat, 90.0 - 1e-9) + 90.0) / height)
+        if (last_col - first_col + 1) * (last_row - first_row + 1) > max_cells and precision > 1:
+            continue
+        return sorted({
+            encode_geohash(-90.0 + (row + 0.5) * height, -180.0 + (col + 0.5) * width, precision)
+            for row in range(first_row, last_row + 1)
+            for col in range(first_col, last_col + 1)
+        })
+
+def get_radius_bbox(latitude, longitude, radius_m):
+    """(min_lat, min_lon, max_lat, max_lon) enclosing a circle, clamped to valid coordinates."""
+    lat_delta = radius_m / METERS_PER_DEGREE
+    # Near the poles a circle spans every longitude
+    cos_lat = math.cos(math.radians(latitude))
+    lon_delta = 180.0 if cos_lat < 1e-6 else min(radius_m / (METERS_PER_DEGREE * cos_lat), 180.0)
+    return (
+        max(latitude - lat_delta, -90.0),
+        max(longitude - lon_delta, -180.0),
+        min(latitude + lat_delta, 90.0),
+        min(longitude + lon_delta, 180.0),
+    )
+
+def haversine_distance(lat1, lon1, lat2, lon2):
+    """Great-circle distance in meters."""
+    lat1, lon1, lat2, lon2 = (math.radians(float(value)) for value in (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
@@ -0,0 +1,214 @@
+from django.conf import settings
+import numpy as np
+import json
+import os
+import socket
+import struct
+import time
+import logging
+
+from .metrics import DETECTION_BATCH_IMAGES, MODEL_LOAD_SECONDS, MODEL_LOADED, observe_stage
+
+logger = logging.getLogger(__name__)
+
+# Constants
+# Default weights, used when the model registry is empty
+MODEL_PATH = os.path.join(os.path.dirname(__file__), '..', 'runs', 'detect', 'train8', 'weights', 'best.pt')
+
+# Inference engines, keyed by DETECTION_ENGINE. Exported weights live next to the .pt
+# weights under the names ultralytics gives them on export. Quantized engines are
+# INT8 copies of an ONNX export.
+ENGINES = {
+    'pytorch': {'export_format': None, 'suffix': '.pt'},
+    'onnx': {'export_format': 'onnx', 'suffix': '.onnx'},
+    'onnx-int8': {'export_format': 'onnx', 'suffix': '_int8.onnx', 'quantized': True},
+    'openvino': {'export_format': 'openvino', 'suffix': '_openvino_model'},
+}
+
+# Stored original uploads, used as the sample corpus by the engine tools
+SAMPLE_IMAGE_GLOB = os.path.join(settings.MEDIA_ROOT, 'operation_images', 'original', '*.jpg')
+
+class_names = {
+    0: "Longitudinal Crack (D00)",
+    1: "Transverse Crack (D10)",
+    2: "Alligator Crack (D20)",
+    3: "Pothole (D40)",
+    4: "Repaired Damage"
+}
+
+# Length prefix of every frame sent over the inference socket
+FRAME_HEADER = struct.Struct('!Q')
+
+
+class InferenceServerError(Exception):
+    """Raised when the inference server fails to process a request."""
+
+
+def get_engine_path(engine, weights_path=None):
+    """Return the path of a .pt weights file exported to an inference engine."""
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown detection engine '{engine}'. Valid options: {list(ENGINES)}")
+    stem = os.path.splitext(weights_path or MODEL_PATH)[0]
+    return f"{stem}{ENGINES[engine]['suffix']}"
+
+def load_yolo_model(engine=None, weights_path=None):
+    """Load a new YOLO model instance of some weights for the configured engine."""
+    engine = engine or settings.DETECTION_ENGINE
+    engine_path = get_engine_path(engine, weights_path)
+    if not os.path.exists(engine_path):
+        message = f"Weights for engine '{engine}' not found at {engine_path}."
+        if ENGINES[engine]['export_format']:
+            message += f" Run 'python manage.py export_detection_model --engine {engine}' for these weights first."
+        raise FileNotFoundError(message)
+    # Imported here so processes that only talk to the inference server never load torch
+    from ultralytics import YOLO
+
+    logger.info(f"Loading {engine} detection model from {engine_path}")
+    start = time.perf_counter()
+    model = YOLO(engine_path, task='detect')
+    MODEL_LOAD_SECONDS.labels(engine=engine).observe(time.perf_counter() - start)
+    MODEL_LOADED.labels(engine=engine).set(1)
+    return model
+
+def extract_detections(result, model_version=None):
+    """Convert a single YOLO result into plain detection dicts."""
+    detections = []
+    if result.boxes is None:
+        return detections
+
+    for box in result.boxes:
+        class_id = int(box.cls)
+        detections.append({
+            'class_id': class_id,
+            'confidence': float(box.conf),
+            'bbox': [float(value) for value in box.xyxy.cpu().numpy()[0]],
+            'damage_type': class_names.get(class_id, "Unknown Damage Type"),
+            'model_version': model_version,
+        })
+    return detections
+
+
+def box_iou(box_a, box_b):
+    """Intersection over union of two xyxy boxes."""
+    inter_w = max(0.0, min(box_a[2], box_b[2]) - max(box_a[0], box_b[0]))
+    inter_h = max(0.0, min(box_a[3], box_b[3]) - max(box_a[1], box_b[1]))
+    intersection = inter_w * inter_h
+    union = (
+        (box_a[2] - box_a[0]) * (box_a[3] - box_a[1])
+        + (box_b[2] - box_b[0]) * (box_b[3] - box_b[1])
+        - intersection
+    )
+    return intersection / union if union > 0 else 0.0
+
+def compare_detections(reference, candidate, iou_threshold=0.5):
+    """
+    Greedily match candidate detections to reference detections of the same class.
+    Returns matched pairs and the unmatched detections from each side.
+    """
+    unmatched = list(candidate)
+    matched = []
+    missing = []
+    for ref in sorted(reference, key=lambda d: d['confidence'], reverse=True):
+        best_index, best_iou = None, iou_threshold
+        for index, cand in enumerate(unmatched):
+            if cand['class_id'] != ref['class_id']:
+                continue
+            iou = box_iou(ref['bbox'], cand['bbox'])
+            if iou >= best_iou:
+                best_index, best_iou = index, iou
+        if best_index is None:
+            missing.append(ref)
+        else:
+            matched.append((ref, unmatched.pop(best_index), best_iou))
+    return matched, missing, unmatched
+
+
+class LocalDetector:
+    """
+    Runs inference with a model loaded in this process.
+    """
+    def __init__(self, model, model_version=None):
+        self.model = model
+        self.model_version = model_version
+
+    def detect(self, images):
+        """Return one list of detections per decoded BGR image."""
+        if not images:
+            return []
+        DETECTION_BATCH_IMAGES.observe(len(images))
+        with observe_stage('inference'):
+            results = self.model(images, verbose=False)
+        return [extract_detections(result, self.model_version) for result in results]
+
+
+class RemoteDetector:
+    """
+    Sends images to the shared inference server over its Unix socket.
+    model_version is the registry's active version; the server stamps
+    each detection with the version that actually produced it.
+    """
+    def __init__(self, socket_path, timeout, model_version=None):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.model_version = model_version
+
+    def detect(self, images):
+        """Return one list of detections per decoded BGR image."""
+        if not images:
+            return []
+        # Includes the wait for the server to fill its batch
+        with observe_stage('remote_inference'), socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            send_images(sock, images)
+            response = recv_json(sock)
+
+        if 'error' in response:
+            raise InferenceServerError(response['error'])
+        return response['detections']
+
+
+# Socket framing helpers
+def send_frame(sock, payload):
+    """Send one length-prefixed frame."""
+    payload = memoryview(payload)
+    sock.sendall(FRAME_HEADER.pack(payload.nbytes))
+    sock.sendall(payload)
+
+def recv_exact(sock, size):
+    """Receive exactly size bytes into a fresh buffer."""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError("Inference socket closed mid-frame")
+        received += count
+    return buffer
+
+def recv_frame(sock):
+    """Receive one length-prefixed frame."""
+    (size,) = FRAME_HEADER.unpack(recv_exact(sock, FRAME_HEADER.size))
+    return recv_exact(sock, size)
+
+def send_json(sock, data):
+    send_frame(sock, json.dumps(data).encode())
+
+def recv_json(sock):
+    return json.loads(recv_frame(sock))
+
+def send_images(sock, images):
+    """Send decoded images as a JSON header frame followed by one raw frame per image."""
+    images = [np.ascontiguousarray(image) for image in images]
+    send_json(sock, {'images': [{'shape': list(image.shape), 'dtype': str(image.dtype)} for image in images]})
+    for image in images:
+        send_frame(sock, image)
+
+def recv_images(sock):
+    """Receive images sent with send_images, without copying their pixel buffers."""
+    header = recv_json(sock)
+    return [
+        np.frombuffer(recv_frame(sock), dtype=spec['dtype']).reshape(spec['shape'])
+        for spec in header['images']
+    ]
@@ -0,0 +1,178 @@
+from django.conf import settings
+from django.db import connections
+import os
+import queue
+import socketserver
+import threading
+import time
+import logging
+
+from .inference import LocalDetector, load_yolo_model, recv_images, send_json
+from .metrics import DETECTION_STAGE_SECONDS
+from .registry import get_model_spec, get_registry_models
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceRequest:
+    """
+    Images sent by one client connection, waiting for their detections.
+    """
+    def __init__(self, images):
+        self.images = images
+        self.submitted_at = time.monotonic()
+        self.detections = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class InferenceRequestHandler(socketserver.BaseRequestHandler):
+    """
+    Reads one batch of images from a client and replies with its detections.
+    """
+    def handle(self):
+        try:
+            images = recv_images(self.request)
+        except (ConnectionError, ValueError) as e:
+            logger.warning(f"Dropping malformed inference request: {str(e)}")
+            return
+
+        request = self.server.inference_server.submit(images)
+        if request.error:
+            send_json(self.request, {'error': request.error})
+        else:
+            send_json(self.request, {'detections': request.detections})
+
+
+class InferenceServer:
+    """
+    Owns the model replicas and batches requests from all clients together.
+    Each replica thread pulls pending requests until it has max_batch_size
+    images or max_wait_ms has passed, then runs them in one forward pass.
+    Replicas are reloaded in the background when the registry activates
+    another model.
+    """
+    def __init__(self, socket_path, replicas=1, max_batch_size=8, max_wait_ms=10, model_loader=load_yolo_model, poll_interval=None):
+        self.socket_path = socket_path
+        self.replicas = replicas
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.model_loader = model_loader
+        self.poll_interval = settings.DETECTION_MODEL_POLL_INTERVAL if poll_interval is None else poll_interval
+        self.pending = queue.Queue()
+        self.detectors = []
+        self.model_version = None
+        self._server = None
+
+    def submit(self, images):
+        """Queue images for the next batch and wait for their detections."""
+        request = InferenceRequest(images)
+        self.pending.put(request)
+        request.done.wait()
+        return request
+
+    def load_detectors(self):
+        """
+        Load every replica of the registry's active model unless already serving it.
+        Returns True if the replicas were swapped.
+        """
+        active, _ = get_registry_models()
+        spec = get_model_spec(active)
+        if spec['version'] == self.model_version:
+            return False
+
+        detectors = []
+        for index in range(self.replicas):
+            logger.info(f"Loading {spec['version']} replica {index + 1}/{self.replicas}")
+            detectors.append(LocalDetector(self.model_loader(weights_path=spec['weights_path']), spec['version']))
+
+        # Swap all replicas at once; batches already running finish on the old model
+        self.detectors = detectors
+        self.model_version = spec['version']
+        return True
+
+    def serve_forever(self):
+        # Load every replica before accepting connections
+        self.load_detectors()
+        for index in range(self.replicas):
+            threading.Thread(
+                target=self._run_replica,
+                args=(index,),
+                name=f"inference-replica-{index}",
+                daemon=True
+            ).start()
+
+        if self.poll_interval > 0:
+            threading.Thread(target=self._watch_registry, name='inference-registry-watcher', daemon=True).start()
+
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+        self._server = socketserver.ThreadingUnixStreamServer(self.socket_path, InferenceRequestHandler)
+        self._server.daemon_threads = True
+        self._server.inference_server = self
+        os.chmod(self.socket_path, 0o660)
+
+        logger.info(f"Inference server listening on {self.socket_path} with {self.replicas} replica(s)")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+    def shutdown(self):
+        if self._server is not None:
+            self._server.shutdown()
+
+    def _collect_batch(self):
+        """Block for one request, then gather more until the batch is full or the wait expires."""
+        batch = [self.pending.get()]
+        image_count = len(batch[0].images)
+        deadline = time.monotonic() + self.max_wait
+
+        while image_count < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self.pending.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            image_count += len(request.images)
+
+        return batch
+
+    def _watch_registry(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.load_detectors()
+            except Exception as e:
+                logger.error(f"Error reloading model replicas: {str(e)}")
+            finally:
+                connections.close_all()
+
+    def _run_replica(self, index):
+        while True:
+            batch = self._collect_batch()
+            detector = self.detectors[index]
+            started_at = time.monotonic()
+            for request in batch:
+                DETECTION_STAGE_SECONDS.labels(stage='queue_wait').observe(started_at - request.submitted_at)
+            images = [image for request in batch for image in request.images]
+            try:
+                detections = detector.detect(images)
+                # Hand each client back its own slice of the batch
+                offset = 0
+                for request in batch:
+                    request.detections = detections[offset:offset + len(request.images)]
+                    offset += len(request.images)
+            except Exception as e:
+                logger.error(f"Error running batched inference on {len(images)} images: {str(e)}")
+                for request in batch:
+                    request.error = str(e)
+
+            for request in batch:
+                request.done.set()
@@ -0,0 +1,146 @@
+from contextlib import contextmanager
+from datetime import timedelta
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import DetectionJob
+from .etags import touch_operation_reports
+from .services import process_operation_images
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue_detection_job(operation, options=None):
+    """Queue damage detection for all images of an operation."""
+    job = DetectionJob.objects.create(operation=operation, options=options or {})
+    logger.info(f"Queued detection job {job.id} for operation {operation.id}")
+    return job
+
+def fail_abandoned_jobs(stale_cutoff, max_attempts):
+    """
+    Fail running jobs whose worker stopped sending heartbeats on their last
+    attempt, e.g. because the job got it killed. Returns how many failed.
+    """
+    jobs = list(
+        DetectionJob.objects
+        .select_for_update(skip_locked=True)
+        .filter(status='RUNNING', heartbeat_at__lt=stale_cutoff, attempts__gte=max_attempts)
+    )
+    for job in jobs:
+        logger.error(f"Detection job {job.id} was abandoned on its last attempt {job.attempts}")
+        job.status = 'FAILED'
+        job.error = f"The worker stopped responding on attempt {job.attempts}"
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        job.operation.images.exclude(detection_status='DONE').update(detection_status='FAILED')
+        touch_operation_reports(job.operation_id)
+    return len(jobs)
+
+def claim_next_job(stale_after=None, max_attempts=None):
+    """
+    Claim the oldest runnable job using SELECT ... FOR UPDATE SKIP LOCKED.
+    Jobs left RUNNING by a crashed worker are reclaimed once their heartbeat
+    is stale, or failed when they have no attempts left.
+    """
+    if stale_after is None:
+        stale_after = settings.DETECTION_JOB_STALE_AFTER
+    if max_attempts is None:
+        max_attempts = settings.DETECTION_JOB_MAX_ATTEMPTS
+    stale_cutoff = timezone.now() - timedelta(seconds=stale_after)
+
+    with transaction.atomic():
+        fail_abandoned_jobs(stale_cutoff, max_attempts)
+        job = (
+            DetectionJob.objects
+            .select_for_update(skip_locked=True)
+            .filter(Q(status='QUEUED') | Q(status='RUNNING', heartbeat_at__lt=stale_cutoff, attempts__lt=max_attempts))
+            .order_by('created_at', 'id')
+            .first()
+        )
+        if job is None:
+            return None
+
+        job.status = 'RUNNING'
+        job.attempts += 1
+        job.started_at = job.heartbeat_at = timezone.now()
+        job.save(update_fields=['status', 'attempts', 'started_at', 'heartbeat_at'])
+        job.operation.images.exclude(detection_status='DONE').update(detection_status='RUNNING')
+        touch_operation_reports(job.operation_id)
+
+    return job
+
+def send_heartbeats(job, stopped, interval):
+    """Refresh the heartbeat of a running job every interval seconds until stopped is set."""
+    try:
+        while not stopped.wait(interval):
+            refreshed = (
+                DetectionJob.objects
+                .filter(id=job.id, status='RUNNING', attempts=job.attempts)
+                .update(heartbeat_at=timezone.now())
+            )
+            if not refreshed:
+                logger.warning(f"Detection job {job.id} was reclaimed while attempt {job.attempts} was running")
+                return
+    except Exception as e:
+        logger.error(f"Heartbeat of detection job {job.id} failed: {str(e)}")
+    finally:
+        # The heartbeat thread opens its own database connection
+        connections.close_all()
+
+@contextmanager
+def keep_alive(job, interval=None):
+    """Send heartbeats for a job from a background thread while the block runs."""
+    interval = interval or settings.DETECTION_JOB_HEARTBEAT_INTERVAL
+    stopped = threading.Event()
+    thread = threading.Thread(
+        target=send_heartbeats,
+        args=(job, stopped, interval),
+        name=f'detection-job-{job.id}-heartbeat',
+        daemon=True,
+    )
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+def run_job(job, max_attempts=None):
+    """Run a claimed job and record its outcome."""
+    if max_attempts is None:
+        max_attempts = settings.DETECTION_JOB_MAX_ATTEMPTS
+
+    operation = job.operation
+    try:
+        operation_images = list(operation.images.exclude(detection_status='DONE'))
+        with keep_alive(job):
+            process_operation_images(operation, operation_images, tiling=job.options.get('tiling'))
+
+        # Images that cannot be read fail on their own without raising, and would fail again on retry
+        statuses = list(operation.images.values_list('detection_status', flat=True))
+        failed = statuses.count('FAILED')
+        if statuses and 'DONE' not in statuses:
+            job.status = 'FAILED'
+            job.error = f"Detection failed on all {len(statuses)} images"
+        else:
+            job.status = 'DONE'
+            job.error = f"Detection failed on {failed} of {len(statuses)} images" if failed else ''
+    except Exception as e:
+        logger.error(f"Detection job {job.id} failed on attempt {job.attempts}: {str(e)}")
+        job.error = str(e)
+        if job.attempts >= max_attempts:
+            job.status = 'FAILED'
+            operation.images.exclude(detection_status='DONE').update(detection_status='FAILED')
+        else:
+            job.status = 'QUEUED'
+            operation.images.exclude(detection_status='DONE').update(detection_status='QUEUED')
+        touch_operation_reports(operation.id)
+
+    job.finished_at = timezone.now() if job.status in ('DONE', 'FAILED') else None
+    job.save(update_fields=['status', 'error', 'finished_at'])
+    return job
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from operation.models import DetectionModel
+from operation.registry import activate_detection_model
+
+
+class Command(BaseCommand):
+    help = (
+        'Point the model registry at another version. Running processes swap '
+        'to it within DETECTION_MODEL_POLL_INTERVAL seconds.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('version', nargs='?', help='Registered model version.')
+        parser.add_argument(
+            '--shadow',
+            type=float,
+            metavar='FRACTION',
+            help='Run the version in shadow mode on a fraction of images instead of activating it.',
+        )
+        parser.add_argument('--stop-shadow', action='store_true', help='Stop running any shadow model.')
+        parser.add_argument('--list', action='store_true', help='List registered versions.')
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for model in DetectionModel.objects.order_by('created_at'):
+                state = 'active' if model.is_active else (
+                    f"shadow {model.shadow_fraction:.0%}" if model.shadow_fraction > 0 else ''
+                )
+                self.stdout.write(f"{model.version}\t{state}\t{model.weights_path}")
+            return
+
+        if options['stop_shadow']:
+            DetectionModel.objects.filter(shadow_fraction__gt=0).update(shadow_fraction=0)
+            self.stdout.write(self.style.SUCCESS('Stopped shadow detection'))
+            return
+
+        if not options['version']:
+            raise CommandError('Pass a version, --stop-shadow or --list.')
+        if options['shadow'] is not None and not 0 < options['shadow'] <= 1:
+            raise CommandError('--shadow must be a fraction between 0 and 1.')
+
+        try:
+            activate_detection_model(options['version'], shadow_fraction=options['shadow'])
+        except DetectionModel.DoesNotExist:
+            raise CommandError(f"No registered detection model '{options['version']}'")
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        if options['shadow'] is None:
+            self.stdout.write(self.style.SUCCESS(f"Activated {options['version']}"))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Running {options['version']} in shadow on {options['shadow']:.0%} of images"
+            ))
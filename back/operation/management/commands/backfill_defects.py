@@ -0,0 +1,60 @@
+from itertools import groupby
+
+from django.core.management.base import BaseCommand
+from django.db.models import Min
+
+from operation.defects import assign_defects
+from operation.models import Defect, OperationResult, Report
+
+
+class Command(BaseCommand):
+    help = (
+        'Merge detections that are not part of a defect yet into defects, in id order '
+        'and in batches so memory stays bounded. Safe to interrupt and run again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Detections loaded at a time.')
+        parser.add_argument('--reset', action='store_true', help='Delete all defects first and merge everything again.')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            OperationResult.objects.exclude(defect=None).update(defect=None)
+            Report.defects.through.objects.all().delete()
+            Defect.objects.all().delete()
+
+        last_id = 0
+        merged = 0
+        while True:
+            results = list(
+                OperationResult.objects
+                .filter(defect__isnull=True, id__gt=last_id)
+                .select_related('operation_image')
+                .order_by('id')[:options['batch_size']]
+            )
+            if not results:
+                break
+            last_id = results[-1].id
+
+            # Existing detections were last seen when they were reported
+            operation_ids = {result.operation_image.operation_id for result in results}
+            reported_at = dict(
+                Report.objects
+                .filter(operation_id__in=operation_ids)
+                .values('operation_id')
+                .annotate(date=Min('date'))
+                .values_list('operation_id', 'date')
+            )
+
+            results.sort(key=lambda result: (result.operation_image_id, result.id))
+            for _, image_results in groupby(results, key=lambda result: result.operation_image_id):
+                image_results = list(image_results)
+                operation_image = image_results[0].operation_image
+                assign_defects(operation_image, image_results, reported_at.get(operation_image.operation_id))
+                merged += len(image_results)
+
+            self.stdout.write(f"Merged {merged} detections")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Merged {merged} detections, {Defect.objects.count()} defects in total"
+        ))
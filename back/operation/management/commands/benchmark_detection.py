@@ -0,0 +1,214 @@
+import glob
+import json
+import os
+import platform
+import subprocess
+import time
+
+import cv2
+import numpy as np
+import torch
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from operation.inference import ENGINES, SAMPLE_IMAGE_GLOB, extract_detections, load_yolo_model
+from operation.models import Operation, OperationImage
+from operation.registry import get_model_version, get_weights_path
+from operation.rendering import draw_detections
+from operation.services import build_operation_result, decode_image_bytes, iter_batches, process_yolo_detections
+
+STAGES = ('decode', 'inference', 'persistence', 'annotation')
+
+
+def parse_list(value, cast=int):
+    """Parse a comma separated option such as '1,4,8'."""
+    return [cast(item) for item in value.split(',') if item.strip()]
+
+def summarize(samples):
+    """Latency percentiles in milliseconds of a list of durations in seconds."""
+    if not samples:
+        return None
+    milliseconds = np.array(samples) * 1000
+    return {
+        'count': len(samples),
+        'mean_ms': round(float(milliseconds.mean()), 3),
+        'p50_ms': round(float(np.percentile(milliseconds, 50)), 3),
+        'p95_ms': round(float(np.percentile(milliseconds, 95)), 3),
+        'p99_ms': round(float(np.percentile(milliseconds, 99)), 3),
+    }
+
+def get_git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmark the detection pipeline on a fixed image corpus over a matrix of '
+        'engines, batch sizes, input sizes and thread counts.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'images',
+            nargs='*',
+            help='Images to benchmark on. Defaults to the stored original uploads.',
+        )
+        parser.add_argument('--limit', type=int, default=32, help='Maximum number of images.')
+        parser.add_argument(
+            '--engines',
+            default=settings.DETECTION_ENGINE,
+            help=f"Comma separated engines out of {', '.join(ENGINES)}.",
+        )
+        parser.add_argument('--batch-sizes', default='1,4,8', help='Comma separated batch sizes.')
+        parser.add_argument(
+            '--image-sizes',
+            default=str(settings.DETECTION_IMAGE_SIZE),
+            help='Comma separated model input sizes.',
+        )
+        parser.add_argument(
+            '--threads',
+            default=str(torch.get_num_threads()),
+            help='Comma separated thread counts for PyTorch and OpenCV.',
+        )
+        parser.add_argument('--rounds', type=int, default=3, help='Passes over the corpus per configuration.')
+        parser.add_argument('--warmup', type=int, default=1, help='Untimed batches before each configuration.')
+        parser.add_argument(
+            '--skip-persistence',
+            action='store_true',
+            help='Do not time database writes, e.g. when no database is available.',
+        )
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        image_paths = (options['images'] or sorted(glob.glob(SAMPLE_IMAGE_GLOB)))[:options['limit']]
+        if not image_paths:
+            raise CommandError('No images to benchmark on.')
+
+        # Read the corpus up front so disk reads are not part of any stage
+        corpus = []
+        for path in image_paths:
+            with open(path, 'rb') as image_file:
+                corpus.append(image_file.read())
+
+        engines = parse_list(options['engines'], str)
+        for engine in engines:
+            if engine not in ENGINES:
+                raise CommandError(f"Unknown engine '{engine}'. Valid options: {list(ENGINES)}")
+
+        results = []
+        for engine in engines:
+            model = load_yolo_model(engine, get_weights_path())
+            for threads in parse_list(options['threads']):
+                torch.set_num_threads(threads)
+                cv2.setNumThreads(threads)
+                for image_size in parse_list(options['image_sizes']):
+                    for batch_size in parse_list(options['batch_sizes']):
+                        result = self.run_configuration(model, corpus, batch_size, image_size, options)
+                        result.update({'engine': engine, 'threads': threads})
+                        results.append(result)
+                        self.stdout.write(
+                            f"{engine} threads={threads} imgsz={image_size} batch={batch_size}: "
+                            f"{result['throughput']['inference_images_per_second']:.2f} img/s inference, "
+                            f"p95 inference {result['stages']['inference']['p95_ms']:.1f} ms/batch"
+                        )
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'git_commit': get_git_commit(),
+            'model_version': get_model_version(),
+            'host': {
+                'platform': platform.platform(),
+                'processor': platform.processor(),
+                'cpu_count': os.cpu_count(),
+                'torch': torch.__version__,
+                'opencv': cv2.__version__,
+            },
+            'corpus': {'images': len(corpus), 'bytes': sum(len(data) for data in corpus)},
+            'rounds': options['rounds'],
+            'results': results,
+        }
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output)
+            self.stdout.write(self.style.SUCCESS(f"Wrote benchmark report to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def run_configuration(self, model, corpus, batch_size, image_size, options):
+        """Time every stage over the corpus for one batch size and input size."""
+        samples = {stage: [] for stage in STAGES}
+
+        warmup_images = [decode_image_bytes(data) for data in corpus[:batch_size]]
+        for _ in range(options['warmup']):
+            model(warmup_images, imgsz=image_size, verbose=False)
+
+        image_count = 0
+        for _ in range(options['rounds']):
+            for batch in iter_batches(corpus, batch_size):
+                images = []
+                for data in batch:
+                    start = time.perf_counter()
+                    images.append(decode_image_bytes(data))
+                    samples['decode'].append(time.perf_counter() - start)
+
+                start = time.perf_counter()
+                results = model(images, imgsz=image_size, verbose=False)
+                detections_per_image = [extract_detections(result) for result in results]
+                samples['inference'].append(time.perf_counter() - start)
+                image_count += len(images)
+
+                for image, detections in zip(images, detections_per_image):
+                    # Same drawing and encoding as the on-demand renderer
+                    start = time.perf_counter()
+                    annotated = draw_detections(
+                        image.copy(),
+                        [build_operation_result(None, detection) for detection in detections]
+                    )
+                    cv2.imencode('.jpg', annotated)
+                    samples['annotation'].append(time.perf_counter() - start)
+
+                if not options['skip_persistence']:
+                    self.time_persistence(detections_per_image, samples)
+
+        inference_seconds = sum(samples['inference'])
+        total_seconds = sum(sum(durations) for durations in samples.values())
+        return {
+            'batch_size': batch_size,
+            'image_size': image_size,
+            'images': image_count,
+            'throughput': {
+                'inference_images_per_second': round(image_count / inference_seconds, 3) if inference_seconds else None,
+                'end_to_end_images_per_second': round(image_count / total_seconds, 3) if total_seconds else None,
+            },
+            # decode, persistence and annotation are per image, inference is per batch
+            'stages': {stage: summarize(durations) for stage, durations in samples.items()},
+        }
+
+    def time_persistence(self, detections_per_image, samples):
+        """Time writing detections per image, rolling every row back afterwards."""
+        with transaction.atomic():
+            operation = Operation.objects.create()
+            operation_image = OperationImage.objects.create(
+                operation=operation,
+                original_image='benchmark.jpg',
+                longitude=0,
+                latitude=0,
+            )
+            for detections in detections_per_image:
+                start = time.perf_counter()
+                process_yolo_detections(operation_image, detections)
+                samples['persistence'].append(time.perf_counter() - start)
+            transaction.set_rollback(True)
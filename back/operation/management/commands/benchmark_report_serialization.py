@@ -0,0 +1,98 @@
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.renderers import JSONRenderer
+
+from api.renderers import ORJSONRenderer
+from operation.fast_serializers import get_report_values, serialize_report_rows
+from operation.models import Report
+from operation.serializers import ReportSerializer
+from operation.views import get_optimized_queryset
+
+
+def summarize(samples):
+    """Percentiles in milliseconds of a list of durations in seconds."""
+    milliseconds = np.array(samples) * 1000
+    return {
+        'mean_ms': round(float(milliseconds.mean()), 3),
+        'p50_ms': round(float(np.percentile(milliseconds, 50)), 3),
+        'p95_ms': round(float(np.percentile(milliseconds, 95)), 3),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare CPU and wall time of rendering a page of reports with ReportSerializer '
+        'and JSONRenderer against the values() read path and the orjson renderer.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=100, help='Reports per page, newest first.')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed renders per path.')
+        parser.add_argument('--warmup', type=int, default=2, help='Untimed renders per path.')
+        parser.add_argument('--fields', help='Comma separated fields, as ?fields= on the endpoint.')
+        parser.add_argument('--host', default='localhost', help='Host the image URLs are built for.')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout.')
+
+    def handle(self, *args, **options):
+        report_ids = list(Report.objects.order_by('-date', '-id').values_list('id', flat=True)[:options['limit']])
+        if not report_ids:
+            raise CommandError('There are no reports to render.')
+
+        request = RequestFactory().get('/api/reports/', HTTP_HOST=options['host'])
+        selection = {}
+        if options['fields']:
+            selection['fields'] = [field.strip() for field in options['fields'].split(',') if field.strip()]
+        fields = set(ReportSerializer(**selection).fields) if selection else None
+        reports = Report.objects.filter(id__in=report_ids).order_by('-date', '-id')
+
+        def render_serializer():
+            serializer = ReportSerializer(
+                get_optimized_queryset(reports.all(), fields), many=True, context={'request': request}, **selection
+            )
+            return JSONRenderer().render(serializer.data)
+
+        def render_fast():
+            rows = list(get_report_values(reports.all(), fields))
+            return ORJSONRenderer().render(serialize_report_rows(rows, request, fields))
+
+        paths = {'serializer': render_serializer, 'fast': render_fast}
+        outputs = {}
+        result = {'reports': len(report_ids), 'repeat': options['repeat'], 'fields': selection.get('fields'), 'paths': {}}
+        for name, render in paths.items():
+            for _ in range(options['warmup']):
+                render()
+            cpu_samples, wall_samples = [], []
+            for _ in range(options['repeat']):
+                with CaptureQueriesContext(connection) as queries:
+                    wall_start, cpu_start = time.perf_counter(), time.process_time()
+                    outputs[name] = render()
+                    cpu_samples.append(time.process_time() - cpu_start)
+                    wall_samples.append(time.perf_counter() - wall_start)
+            result['paths'][name] = {
+                'cpu': summarize(cpu_samples),
+                'wall': summarize(wall_samples),
+                'queries': len(queries.captured_queries),
+                'bytes': len(outputs[name]),
+            }
+            self.stdout.write(f"{name}: {result['paths'][name]['cpu']['mean_ms']} ms CPU per page")
+
+        serializer_cpu = result['paths']['serializer']['cpu']['mean_ms']
+        fast_cpu = result['paths']['fast']['cpu']['mean_ms']
+        result['cpu_speedup'] = round(serializer_cpu / fast_cpu, 2) if fast_cpu else None
+        result['identical'] = json.loads(outputs['serializer']) == json.loads(outputs['fast'])
+        if not result['identical']:
+            self.stderr.write(self.style.WARNING('The two paths rendered different JSON'))
+
+        output = json.dumps(result, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output)
+            self.stdout.write(self.style.SUCCESS(f"Wrote benchmark report to {options['output']}"))
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,84 @@
+import glob
+import os
+
+import cv2
+from django.core.management.base import BaseCommand, CommandError
+
+from operation.inference import ENGINES, SAMPLE_IMAGE_GLOB, LocalDetector, compare_detections, load_yolo_model
+from operation.registry import get_weights_path
+
+
+class Command(BaseCommand):
+    help = 'Compare detections of an exported engine against the PyTorch engine.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--engine',
+            choices=[engine for engine in ENGINES if engine != 'pytorch'],
+            default='onnx',
+            help='Engine to check against PyTorch.',
+        )
+        parser.add_argument(
+            'images',
+            nargs='*',
+            help='Images to compare on. Defaults to the stored original uploads.',
+        )
+        parser.add_argument('--limit', type=int, default=20, help='Maximum number of images.')
+        parser.add_argument('--iou', type=float, default=0.5, help='IoU needed to match two boxes.')
+        parser.add_argument(
+            '--min-match-rate',
+            type=float,
+            default=0.95,
+            help='Fraction of detections that must match on both sides.',
+        )
+        parser.add_argument(
+            '--max-confidence-delta',
+            type=float,
+            default=0.05,
+            help='Largest allowed confidence difference between matched boxes.',
+        )
+
+    def handle(self, *args, **options):
+        image_paths = options['images'] or sorted(glob.glob(SAMPLE_IMAGE_GLOB))
+        image_paths = image_paths[:options['limit']]
+        if not image_paths:
+            raise CommandError('No images to compare on.')
+
+        # Compare on the weights of the active model
+        weights_path = get_weights_path()
+        reference_detector = LocalDetector(load_yolo_model('pytorch', weights_path))
+        candidate_detector = LocalDetector(load_yolo_model(options['engine'], weights_path))
+
+        matched_count = missing_count = extra_count = 0
+        max_confidence_delta = 0.0
+        for path in image_paths:
+            image = cv2.imread(path)
+            if image is None:
+                self.stderr.write(f"Skipping unreadable image {path}")
+                continue
+
+            reference = reference_detector.detect([image])[0]
+            candidate = candidate_detector.detect([image])[0]
+            matched, missing, extra = compare_detections(reference, candidate, options['iou'])
+
+            matched_count += len(matched)
+            missing_count += len(missing)
+            extra_count += len(extra)
+            for ref, cand, _ in matched:
+                max_confidence_delta = max(max_confidence_delta, abs(ref['confidence'] - cand['confidence']))
+
+            if missing or extra:
+                self.stdout.write(f"{os.path.basename(path)}: {len(matched)} matched, {len(missing)} missing, {len(extra)} extra")
+
+        total = matched_count + missing_count + extra_count
+        match_rate = matched_count * 2 / (matched_count * 2 + missing_count + extra_count) if total else 1.0
+
+        self.stdout.write(
+            f"{options['engine']} vs pytorch on {len(image_paths)} images: "
+            f"{matched_count} matched, {missing_count} missing, {extra_count} extra, "
+            f"match rate {match_rate:.3f}, max confidence delta {max_confidence_delta:.3f}"
+        )
+
+        if match_rate < options['min_match_rate'] or max_confidence_delta > options['max_confidence_delta']:
+            raise CommandError(f"{options['engine']} engine is not at parity with pytorch")
+        self.stdout.write(self.style.SUCCESS(f"{options['engine']} engine is at parity with pytorch"))
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from operation.uploads import clear_upload_sessions
+
+
+class Command(BaseCommand):
+    help = 'Delete resumable upload sessions, and their partial files, that have not been touched for a while.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ttl',
+            type=int,
+            default=settings.UPLOAD_SESSION_TTL,
+            help='Seconds since the last chunk after which a session is deleted.',
+        )
+
+    def handle(self, *args, **options):
+        deleted = clear_upload_sessions(options['ttl'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} upload sessions"))
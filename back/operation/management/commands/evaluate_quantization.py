@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from operation.inference import ENGINES, class_names, get_engine_path, load_yolo_model
+from operation.registry import get_model_version, get_weights_path
+
+
+def get_peak_rss_mb():
+    """Peak resident memory of this process in MB. Linux reports ru_maxrss in kilobytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def get_size_on_disk(path):
+    """Size in bytes of exported weights, including external data and model directories."""
+    if os.path.isdir(path):
+        return sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(path)
+            for name in names
+        )
+    size = os.path.getsize(path)
+    if os.path.exists(f"{path}.data"):
+        size += os.path.getsize(f"{path}.data")
+    return size
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare an INT8 engine against a reference engine on a labelled validation split: '
+        'mAP and per-class AP deltas, latency and memory. Memory is the peak RSS of a fresh '
+        'process loading the engine and running one prediction.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--data',
+            default=os.path.join(settings.BASE_DIR, 'rdd2022.yaml'),
+            help='Ultralytics dataset config with the validation split.',
+        )
+        parser.add_argument('--split', default='val', help='Dataset split to evaluate on.')
+        parser.add_argument('--reference', choices=list(ENGINES), default='pytorch', help='Reference engine.')
+        parser.add_argument('--candidate', choices=list(ENGINES), default='onnx-int8', help='Engine to evaluate.')
+        parser.add_argument('--imgsz', type=int, default=settings.DETECTION_IMAGE_SIZE, help='Model input size.')
+        parser.add_argument('--batch', type=int, default=settings.DETECTION_BATCH_SIZE, help='Validation batch size.')
+        parser.add_argument(
+            '--max-map-drop',
+            type=float,
+            default=0.01,
+            help='Largest acceptable drop in mAP50-95.',
+        )
+        parser.add_argument(
+            '--max-class-drop',
+            type=float,
+            default=0.03,
+            help='Largest acceptable drop in mAP50-95 of any single class.',
+        )
+        parser.add_argument('--output', help='Write the JSON report to this file.')
+        # Run by evaluate() in a fresh process to measure the memory of one engine
+        parser.add_argument('--measure-memory', choices=list(ENGINES), help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['measure_memory']:
+            self.measure_memory(options['measure_memory'], get_weights_path(), options['imgsz'])
+            return
+
+        if not os.path.exists(options['data']):
+            raise CommandError(f"Dataset config not found at {options['data']}")
+
+        weights_path = get_weights_path()
+        reference = self.evaluate(options['reference'], weights_path, options)
+        candidate = self.evaluate(options['candidate'], weights_path, options)
+
+        per_class = {}
+        for class_id, name in class_names.items():
+            ref_class = reference['per_class'][name]
+            cand_class = candidate['per_class'][name]
+            per_class[name] = {
+                'reference_map50': ref_class['map50'],
+                'candidate_map50': cand_class['map50'],
+                'delta_map50': round(cand_class['map50'] - ref_class['map50'], 4),
+                'reference_map': ref_class['map'],
+                'candidate_map': cand_class['map'],
+                'delta_map': round(cand_class['map'] - ref_class['map'], 4),
+            }
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'model_version': get_model_version(),
+            'data': options['data'],
+            'split': options['split'],
+            'imgsz': options['imgsz'],
+            'reference': reference,
+            'candidate': candidate,
+            'delta': {
+                'map50': round(candidate['map50'] - reference['map50'], 4),
+                'map': round(candidate['map'] - reference['map'], 4),
+                'inference_ms_per_image': round(
+                    candidate['speed_ms']['inference'] - reference['speed_ms']['inference'], 3
+                ),
+                'peak_rss_mb': round(candidate['peak_rss_mb'] - reference['peak_rss_mb'], 1),
+                'size_on_disk_mb': round(candidate['size_on_disk_mb'] - reference['size_on_disk_mb'], 1),
+            },
+            'per_class': per_class,
+        }
+
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(report, output_file, indent=2)
+
+        self.stdout.write(f"{'class':<28}{'ref mAP':>10}{'int8 mAP':>10}{'delta':>10}")
+        for name, values in per_class.items():
+            self.stdout.write(
+                f"{name:<28}{values['reference_map']:>10.4f}{values['candidate_map']:>10.4f}{values['delta_map']:>+10.4f}"
+            )
+        self.stdout.write(
+            f"{'all':<28}{reference['map']:>10.4f}{candidate['map']:>10.4f}{report['delta']['map']:>+10.4f}\n"
+            f"mAP50 {reference['map50']:.4f} -> {candidate['map50']:.4f}, "
+            f"inference {reference['speed_ms']['inference']:.1f} -> {candidate['speed_ms']['inference']:.1f} ms/image, "
+            f"peak memory {reference['peak_rss_mb']:.0f} -> {candidate['peak_rss_mb']:.0f} MB, "
+            f"on disk {reference['size_on_disk_mb']:.1f} -> {candidate['size_on_disk_mb']:.1f} MB"
+        )
+
+        worst_class_drop = -min(values['delta_map'] for values in per_class.values())
+        if -report['delta']['map'] > options['max_map_drop'] or worst_class_drop > options['max_class_drop']:
+            raise CommandError(
+                f"{options['candidate']} loses too much accuracy: mAP drop {-report['delta']['map']:.4f}, "
+                f"worst class drop {worst_class_drop:.4f}"
+            )
+        self.stdout.write(self.style.SUCCESS(f"{options['candidate']} is within the accuracy budget"))
+
+    def measure_memory(self, engine, weights_path, imgsz):
+        """Load one engine, run one prediction and print the peak RSS of this process as JSON."""
+        model = load_yolo_model(engine, weights_path)
+        # One prediction so lazily created sessions and buffers count towards memory
+        model(np.zeros((imgsz, imgsz, 3), dtype=np.uint8), imgsz=imgsz, verbose=False)
+        self.stdout.write(json.dumps({'peak_rss_mb': round(get_peak_rss_mb(), 1)}))
+
+    def get_engine_memory(self, engine, imgsz):
+        """
+        Peak RSS in MB of a fresh process loading the engine. Measuring both
+        engines in this process would count the libraries and freed pages the
+        first one left behind towards the second.
+        """
+        completed = subprocess.run(
+            [
+                sys.executable, os.path.join(settings.BASE_DIR, 'manage.py'), 'evaluate_quantization',
+                '--measure-memory', engine, '--imgsz', str(imgsz),
+            ],
+            capture_output=True,
+            text=True,
+        )
+        if completed.returncode != 0:
+            raise CommandError(f"Measuring the memory of {engine} failed: {completed.stderr.strip()}")
+        # Libraries may print while loading, the measurement is the last line
+        return json.loads(completed.stdout.strip().splitlines()[-1])['peak_rss_mb']
+
+    def evaluate(self, engine, weights_path, options):
+        """Validate one engine and measure its peak memory and size on disk."""
+        peak_rss_mb = self.get_engine_memory(engine, options['imgsz'])
+        model = load_yolo_model(engine, weights_path)
+
+        self.stdout.write(f"Validating {engine} on {options['data']} ({options['split']})")
+        metrics = model.val(
+            data=options['data'],
+            split=options['split'],
+            imgsz=options['imgsz'],
+            batch=options['batch'],
+            plots=False,
+            verbose=False,
+        )
+
+        # Classes missing from the split have no AP
+        per_class = {name: {'map50': 0.0, 'map': 0.0} for name in class_names.values()}
+        for index, class_id in enumerate(metrics.box.ap_class_index):
+            name = class_names.get(int(class_id))
+            if name is not None:
+                _, _, map50, map_ = metrics.box.class_result(index)
+                per_class[name] = {'map50': round(float(map50), 4), 'map': round(float(map_), 4)}
+
+        result = {
+            'engine': engine,
+            'map50': round(float(metrics.box.map50), 4),
+            'map': round(float(metrics.box.map), 4),
+            'per_class': per_class,
+            'speed_ms': {stage: round(float(value), 3) for stage, value in metrics.speed.items()},
+            'peak_rss_mb': peak_rss_mb,
+            'size_on_disk_mb': round(get_size_on_disk(get_engine_path(engine, weights_path)) / (1024 * 1024), 1),
+        }
+        del model
+        return result
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from operation.dedup import evict_cache_entries
+
+
+class Command(BaseCommand):
+    help = 'Delete the least recently used detection cache entries beyond the configured maximum.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-entries',
+            type=int,
+            default=settings.DETECTION_CACHE_MAX_ENTRIES,
+            help='Number of most recently used entries to keep.',
+        )
+
+    def handle(self, *args, **options):
+        deleted = evict_cache_entries(options['max_entries'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} detection cache entries"))
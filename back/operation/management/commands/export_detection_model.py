@@ -0,0 +1,80 @@
+import glob
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from ultralytics import YOLO
+
+from operation.inference import ENGINES, SAMPLE_IMAGE_GLOB, get_engine_path
+from operation.models import DetectionModel
+from operation.quantization import QUANTIZATION_MODES, quantize_onnx_model
+from operation.registry import get_weights_path
+
+
+class Command(BaseCommand):
+    help = 'Export the PyTorch detection weights to a CPU inference engine.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--engine',
+            choices=[engine for engine, config in ENGINES.items() if config['export_format']],
+            default='onnx',
+            help='Engine to export to.',
+        )
+        parser.add_argument(
+            '--imgsz',
+            type=int,
+            default=settings.DETECTION_IMAGE_SIZE,
+            help='Model input size.',
+        )
+        parser.add_argument(
+            '--model-version',
+            help='Registered model version to export. Defaults to the active model.',
+        )
+        parser.add_argument(
+            '--quantization',
+            choices=QUANTIZATION_MODES,
+            default='dynamic',
+            help='INT8 quantization for quantized engines. Static calibrates on sample images.',
+        )
+        parser.add_argument(
+            '--calibration-images',
+            type=int,
+            default=100,
+            help='Number of stored uploads to calibrate static quantization on.',
+        )
+
+    def handle(self, *args, **options):
+        engine = options['engine']
+        config = ENGINES[engine]
+        try:
+            weights_path = get_weights_path(options['model_version'])
+        except DetectionModel.DoesNotExist:
+            raise CommandError(f"No registered detection model '{options['model_version']}'")
+
+        self.stdout.write(f"Exporting {weights_path} to {engine}")
+        try:
+            # Dynamic axes keep batched inference working on the exported model
+            exported_path = YOLO(weights_path).export(
+                format=config['export_format'],
+                imgsz=options['imgsz'],
+                dynamic=True,
+            )
+        except Exception as e:
+            raise CommandError(f"Export to {engine} failed: {str(e)}")
+
+        if config.get('quantized'):
+            calibration_images = sorted(glob.glob(SAMPLE_IMAGE_GLOB))[:options['calibration_images']]
+            self.stdout.write(f"Quantizing {exported_path} to INT8 ({options['quantization']})")
+            try:
+                exported_path = quantize_onnx_model(
+                    exported_path,
+                    get_engine_path(engine, weights_path),
+                    mode=options['quantization'],
+                    calibration_images=calibration_images,
+                    imgsz=options['imgsz'],
+                )
+            except Exception as e:
+                raise CommandError(f"Quantization to {engine} failed: {str(e)}")
+
+        self.stdout.write(self.style.SUCCESS(f"Exported {engine} model to {exported_path}"))
+        self.stdout.write(f"Select it with DETECTION_ENGINE={engine}")
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from operation.stats import reconcile_report_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the dashboard report counters from scratch and list the ones that drifted '
+        'from the incrementally maintained values.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Rewrite the counters with the recomputed values.')
+        parser.add_argument('--fail-on-drift', action='store_true', help='Exit with an error if any counter drifted.')
+
+    def handle(self, *args, **options):
+        drift = reconcile_report_counters(fix=options['fix'])
+        for (bucket, period_start, dimension, key), (stored, expected) in sorted(drift.items()):
+            self.stdout.write(f"{bucket}\t{period_start}\t{dimension}={key}\tstored {stored}, expected {expected}")
+
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('Report counters match the reports'))
+        elif options['fix']:
+            self.stdout.write(self.style.SUCCESS(f"Fixed {len(drift)} drifted counters"))
+        elif options['fail_on_drift']:
+            raise CommandError(f"{len(drift)} report counters drifted")
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(drift)} report counters drifted, run with --fix to rewrite them"))
@@ -0,0 +1,50 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from operation.models import DetectionModel
+from operation.registry import activate_detection_model, resolve_weights_path
+
+
+class Command(BaseCommand):
+    help = 'Register versioned detection weights in the model registry.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('version', help='Unique version name, e.g. train9.')
+        parser.add_argument('weights_path', help='Path of the .pt weights, absolute or relative to BASE_DIR.')
+        parser.add_argument('--description', default='', help='What changed in these weights.')
+        parser.add_argument(
+            '--activate',
+            action='store_true',
+            help='Serve all detections with this version right away.',
+        )
+        parser.add_argument(
+            '--shadow',
+            type=float,
+            metavar='FRACTION',
+            help='Run this version in shadow mode on a fraction of images instead.',
+        )
+
+    def handle(self, *args, **options):
+        if options['activate'] and options['shadow'] is not None:
+            raise CommandError('Use either --activate or --shadow.')
+        if options['shadow'] is not None and not 0 < options['shadow'] <= 1:
+            raise CommandError('--shadow must be a fraction between 0 and 1.')
+        if not os.path.exists(resolve_weights_path(options['weights_path'])):
+            raise CommandError(f"Weights not found at {options['weights_path']}")
+        if DetectionModel.objects.filter(version=options['version']).exists():
+            raise CommandError(f"Detection model '{options['version']}' is already registered")
+
+        model = DetectionModel.objects.create(
+            version=options['version'],
+            weights_path=options['weights_path'],
+            description=options['description'],
+        )
+        self.stdout.write(self.style.SUCCESS(f"Registered detection model {model.version}"))
+
+        if options['activate'] or options['shadow'] is not None:
+            activate_detection_model(model.version, shadow_fraction=options['shadow'])
+            self.stdout.write(self.style.SUCCESS(
+                f"Activated {model.version}" if options['activate']
+                else f"Running {model.version} in shadow on {options['shadow']:.0%} of images"
+            ))
@@ -0,0 +1,57 @@
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from operation.jobs import claim_next_job, run_job
+from operation.metrics import start_metrics_server
+
+
+class Command(BaseCommand):
+    help = 'Pull queued damage-detection jobs and run them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Exit once the queue is empty instead of polling.',
+        )
+        parser.add_argument(
+            '--poll-interval',
+            type=float,
+            default=settings.DETECTION_WORKER_POLL_INTERVAL,
+            help='Seconds to sleep when no job is available.',
+        )
+        parser.add_argument(
+            '--metrics-port',
+            type=int,
+            default=settings.DETECTION_METRICS_PORT,
+            help='Port to serve Prometheus metrics on. 0 disables it.',
+        )
+
+    def handle(self, *args, **options):
+        self._stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        start_metrics_server(options['metrics_port'])
+
+        self.stdout.write('Detection worker started')
+        while not self._stopping:
+            close_old_connections()
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            job = run_job(job)
+            self.stdout.write(f'Job {job.id} for operation {job.operation_id}: {job.status}')
+
+        self.stdout.write('Detection worker stopped')
+
+    def _stop(self, signum, frame):
+        # Finish the current job before exiting
+        self._stopping = True
@@ -0,0 +1,83 @@
+import os
+import signal
+import threading
+
+import torch
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from operation.inference_server import InferenceServer
+from operation.metrics import start_metrics_server
+
+
+class Command(BaseCommand):
+    help = 'Run the shared damage-detection inference server on a Unix socket.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--socket',
+            default=settings.INFERENCE_SERVER_SOCKET,
+            help='Path of the Unix socket to listen on.',
+        )
+        parser.add_argument(
+            '--replicas',
+            type=int,
+            default=settings.INFERENCE_SERVER_REPLICAS,
+            help='Number of model replicas serving batches in parallel.',
+        )
+        parser.add_argument(
+            '--max-batch-size',
+            type=int,
+            default=settings.DETECTION_BATCH_SIZE,
+            help='Maximum number of images per forward pass.',
+        )
+        parser.add_argument(
+            '--max-wait-ms',
+            type=int,
+            default=settings.INFERENCE_SERVER_MAX_WAIT_MS,
+            help='How long a replica waits for more requests to fill a batch.',
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=None,
+            help='Torch intra-op threads. Defaults to CPU count divided by replicas.',
+        )
+        parser.add_argument(
+            '--metrics-port',
+            type=int,
+            default=settings.DETECTION_METRICS_PORT,
+            help='Port to serve Prometheus metrics on. 0 disables it.',
+        )
+
+    def handle(self, *args, **options):
+        if not options['socket']:
+            raise CommandError('Set INFERENCE_SERVER_SOCKET or pass --socket.')
+        if options['replicas'] < 1:
+            raise CommandError('--replicas must be at least 1.')
+
+        # Split the cores between replicas instead of oversubscribing them
+        threads = options['threads'] or max(1, (os.cpu_count() or 1) // options['replicas'])
+        torch.set_num_threads(threads)
+        start_metrics_server(options['metrics_port'])
+
+        server = InferenceServer(
+            options['socket'],
+            replicas=options['replicas'],
+            max_batch_size=options['max_batch_size'],
+            max_wait_ms=options['max_wait_ms'],
+        )
+
+        def stop(signum, frame):
+            # shutdown() blocks until serve_forever returns, so it cannot run on this thread
+            threading.Thread(target=server.shutdown).start()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(
+            f"Starting inference server on {options['socket']} "
+            f"({options['replicas']} replica(s), {threads} thread(s) each)"
+        )
+        server.serve_forever()
+        self.stdout.write('Inference server stopped')
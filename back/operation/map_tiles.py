@@ -0,0 +1,192 @@
+from datetime import timedelta
+import json
+import math
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F, FloatField, Q, Sum
+from django.db.models.functions import Cast, Substr
+from django.utils import timezone
+
+from .geo import get_cell_size
+from .models import MapTile, OperationImage, OperationResult
+from .spatial import filter_in_bbox
+
+logger = logging.getLogger(__name__)
+
+MAX_MERCATOR_LATITUDE = 85.0511287798
+# Clusters are geohash cells at most this fraction of a tile wide
+CLUSTER_CELLS_PER_TILE = 8
+
+
+def get_tile_bbox(z, x, y):
+    """(min_lat, min_lon, max_lat, max_lon) of a web mercator (slippy map) tile."""
+    n = 2 ** z
+    min_lon = x / n * 360.0 - 180.0
+    max_lon = (x + 1) / n * 360.0 - 180.0
+    max_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    min_lat = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return min_lat, min_lon, max_lat, max_lon
+
+def get_tile(latitude, longitude, z):
+    """(x, y) of the tile containing a point at a zoom level."""
+    n = 2 ** z
+    latitude = max(min(float(latitude), MAX_MERCATOR_LATITUDE), -MAX_MERCATOR_LATITUDE)
+    x = int((float(longitude) + 180.0) / 360.0 * n)
+    y = int((1 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def get_tile_scope(user):
+    """Workers share tiles of all damage, users get tiles of their own reports."""
+    return 'all' if user.is_worker else f'user:{user.id}'
+
+def get_scoped_results(user):
+    queryset = OperationResult.objects.all()
+    if not user.is_worker:
+        queryset = queryset.filter(operation_image__operation__reports__user=user)
+    return queryset
+
+def get_cluster_precision(z):
+    """Finest geohash precision whose cells are still several to a tile side."""
+    tile_width = 360.0 / 2 ** z
+    for precision in range(1, 13):
+        if get_cell_size(precision)[0] <= tile_width / CLUSTER_CELLS_PER_TILE:
+            return precision
+    return 12
+
+def build_cluster_features(queryset, z):
+    """One point per occupied geohash cell, at the centroid of its detections."""
+    rows = (
+        queryset
+        .annotate(cell=Substr('operation_image__geohash', 1, get_cluster_precision(z)))
+        .values('cell', 'class_id')
+        .annotate(
+            count=Count('id'),
+            latitude_sum=Sum(Cast(F('operation_image__latitude'), FloatField())),
+            longitude_sum=Sum(Cast(F('operation_image__longitude'), FloatField())),
+        )
+        .order_by()
+    )
+    clusters = {}
+    for row in rows:
+        cluster = clusters.setdefault(row['cell'], {'count': 0, 'latitude': 0.0, 'longitude': 0.0, 'classes': {}})
+        cluster['count'] += row['count']
+        cluster['latitude'] += row['latitude_sum']
+        cluster['longitude'] += row['longitude_sum']
+        cluster['classes'][str(row['class_id'])] = row['count']
+
+    return [
+        {
+            'type': 'Feature',
+            'geometry': {
+                'type': 'Point',
+                'coordinates': [
+                    round(cluster['longitude'] / cluster['count'], 6),
+                    round(cluster['latitude'] / cluster['count'], 6),
+                ],
+            },
+            'properties': {'count': cluster['count'], 'classes': cluster['classes']},
+        }
+        for cluster in clusters.values()
+    ]
+
+def build_point_features(rows):
+    return [
+        {
+            'type': 'Feature',
+            'id': row['id'],
+            'geometry': {
+                'type': 'Point',
+                'coordinates': [
+                    round(float(row['operation_image__longitude']), 6),
+                    round(float(row['operation_image__latitude']), 6),
+                ],
+            },
+            'properties': {
+                'class_id': row['class_id'],
+                'confidence': round(row['confidence'], 2) if row['confidence'] is not None else None,
+                'image_id': row['operation_image_id'],
+                'status': row['operation_image__operation__reports__status'],
+            },
+        }
+        for row in rows
+    ]
+
+def build_tile(user, z, x, y):
+    """
+    GeoJSON of the damage in a tile. Low zooms get clusters with counts per
+    class, from DAMAGE_MAP_CLUSTER_MAX_ZOOM on individual detections are
+    returned, unless there are too many of them for one tile.
+    """
+    queryset = filter_in_bbox(get_scoped_results(user), *get_tile_bbox(z, x, y), prefix='operation_image__')
+
+    features = None
+    if z > settings.DAMAGE_MAP_CLUSTER_MAX_ZOOM:
+        limit = settings.DAMAGE_MAP_TILE_MAX_POINTS
+        rows = list(
+            queryset.values(
+                'id', 'class_id', 'confidence', 'operation_image_id',
+                'operation_image__latitude', 'operation_image__longitude',
+                'operation_image__operation__reports__status',
+            ).order_by('id')[:limit + 1]
+        )
+        if len(rows) <= limit:
+            features = build_point_features(rows)
+
+    clustered = features is None
+    if clustered:
+        features = build_cluster_features(queryset, z)
+
+    return json.dumps(
+        {'type': 'FeatureCollection', 'clustered': clustered, 'features': features},
+        separators=(',', ':')
+    )
+
+def get_map_tile(user, z, x, y):
+    """Return the GeoJSON of a tile, from the tile cache when it is fresh."""
+    scope = get_tile_scope(user)
+    fresh_after = timezone.now() - timedelta(seconds=settings.DAMAGE_MAP_TILE_TTL)
+    tile = MapTile.objects.filter(z=z, x=x, y=y, scope=scope, created_at__gte=fresh_after).only('content').first()
+    if tile is not None:
+        return tile.content
+
+    content = build_tile(user, z, x, y)
+    MapTile.objects.bulk_create(
+        [MapTile(z=z, x=x, y=y, scope=scope, content=content, created_at=timezone.now())],
+        update_conflicts=True,
+        unique_fields=['z', 'x', 'y', 'scope'],
+        update_fields=['content', 'created_at'],
+    )
+    return content
+
+def invalidate_tiles(points):
+    """Drop cached tiles of every zoom and scope containing any of the (latitude, longitude) points."""
+    tiles = {
+        (z, *get_tile(latitude, longitude, z))
+        for latitude, longitude in points
+        for z in range(settings.DAMAGE_MAP_MAX_ZOOM + 1)
+    }
+    if not tiles:
+        return 0
+    tile_filter = Q()
+    for z, x, y in tiles:
+        tile_filter |= Q(z=z, x=x, y=y)
+    deleted, _ = MapTile.objects.filter(tile_filter).delete()
+    return deleted
+
+def invalidate_image_tiles(operation_images):
+    """Invalidate the tiles showing images, once the current transaction commits."""
+    points = {(operation_image.latitude, operation_image.longitude) for operation_image in operation_images}
+    transaction.on_commit(lambda: invalidate_tiles(points))
+
+def invalidate_operation_tiles(operation_ids):
+    """Invalidate the tiles showing the images of operations, e.g. when their reports change."""
+    points = set(
+        OperationImage.objects
+        .filter(operation_id__in=operation_ids)
+        .values_list('latitude', 'longitude')
+        .distinct()
+    )
+    # Read before the transaction commits, deleted operations no longer have images afterwards
+    transaction.on_commit(lambda: invalidate_tiles(points))
@@ -0,0 +1,62 @@
+from contextlib import contextmanager
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+import os
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Stage latencies from a millisecond decode up to a minute-long CPU batch
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+DETECTION_STAGE_SECONDS = Histogram(
+    'drd_detection_stage_seconds',
+    'Time spent in each stage of the damage-detection pipeline.',
+    ['stage'],
+    buckets=STAGE_BUCKETS,
+)
+DETECTION_BATCH_IMAGES = Histogram(
+    'drd_detection_batch_images',
+    'Number of inputs per batched detector call.',
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+DETECTION_IMAGES = Counter(
+    'drd_detection_images_total',
+    'Images that finished detection, by outcome.',
+    ['outcome'],
+)
+MODEL_LOAD_SECONDS = Histogram(
+    'drd_detection_model_load_seconds',
+    'Time spent loading detection weights.',
+    ['engine'],
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+MODEL_LOADED = Gauge(
+    'drd_detection_model_loaded',
+    'Processes with detection weights loaded.',
+    ['engine'],
+    multiprocess_mode='livesum',
+)
+
+
+@contextmanager
+def observe_stage(stage):
+    """Time the enclosed block as one observation of a pipeline stage."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        DETECTION_STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - start)
+
+def start_metrics_server(port):
+    """
+    Expose this process's metrics on their own port, for long-running
+    processes outside gunicorn such as detection workers.
+    """
+    if not port:
+        return
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        logger.warning("PROMETHEUS_MULTIPROC_DIR is set, metrics are only served through the web app")
+        return
+    start_http_server(port)
+    logger.info(f"Serving metrics on port {port}")
@@ -0,0 +1,42 @@
+# Generated by Django 5.1 on 2026-10-18 01:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def mark_existing_images_done(apps, schema_editor):
+    # Images uploaded before the job queue existed were processed inline.
+    OperationImage = apps.get_model('operation', 'OperationImage')
+    OperationImage.objects.update(detection_status='DONE')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='operationimage',
+            name='detection_status',
+            field=models.CharField(choices=[('QUEUED', 'Queued'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='QUEUED', max_length=20),
+        ),
+        migrations.RunPython(mark_existing_images_done, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='DetectionJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('QUEUED', 'Queued'), ('RUNNING', 'Running'), ('DONE', 'Done'), ('FAILED', 'Failed')], default='QUEUED', max_length=20)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('operation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='detection_jobs', to='operation.operation')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='operation_d_status_277025_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1 on 2026-10-18 01:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operation', '0002_detection_jobs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DetectionCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('content_hash', models.CharField(max_length=64)),
+                ('model_version', models.CharField(max_length=100)),
+                ('phash', models.BigIntegerField()),
+                ('phash_band0', models.IntegerField(db_index=True)),
+                ('phash_band1', models.IntegerField(db_index=True)),
+                ('phash_band2', models.IntegerField(db_index=True)),
+                ('phash_band3', models.IntegerField(db_index=True)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('detections', models.JSONField(default=list)),
+                ('operated_image', models.CharField(blank=True, default='', max_length=255)),
+                ('hit_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_used_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('content_hash', 'model_version'), name='unique_cache_entry_per_model')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1 on 2026-10-18 01:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operation', '0003_detection_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='operationresult',
+            name='bbox_x1',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='operationresult',
+            name='bbox_x2',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='operationresult',
+            name='bbox_y1',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='operationresult',
+            name='bbox_y2',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='operationresult',
+            name='class_id',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='operationresult',
+            name='confidence',
+            field=models.FloatField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,42 @@
+import re
+
+from django.db import migrations
+
+# Frozen copy of operation.inference.class_names at the time of this migration
+CLASS_IDS = {
+    "Longitudinal Crack (D00)": 0,
+    "Transverse Crack (D10)": 1,
+    "Alligator Crack (D20)": 2,
+    "Pothole (D40)": 3,
+    "Repaired Damage": 4,
+}
+CONFIDENCE_PATTERN = re.compile(r"Confidence:\s*([0-9]*\.?[0-9]+)")
+BATCH_SIZE = 1000
+
+
+def backfill_result_columns(apps, schema_editor):
+    """Parse class id and confidence out of the legacy text columns."""
+    OperationResult = apps.get_model('operation', 'OperationResult')
+    batch = []
+    queryset = OperationResult.objects.filter(confidence__isnull=True).only('id', 'damage_type', 'damage_description')
+    for result in queryset.iterator(chunk_size=BATCH_SIZE):
+        match = CONFIDENCE_PATTERN.search(result.damage_description or '')
+        result.confidence = float(match.group(1)) if match else None
+        result.class_id = CLASS_IDS.get(result.damage_type)
+        batch.append(result)
+        if len(batch) >= BATCH_SIZE:
+            OperationResult.objects.bulk_update(batch, ['confidence', 'class_id'])
+            batch = []
+    if batch:
+        OperationResult.objects.bulk_update(batch, ['confidence', 'class_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operation', '0004_structured_results'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_result_columns, migrations.RunPython.noop),
+    ]
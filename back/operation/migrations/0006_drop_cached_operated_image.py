@@ -0,0 +1,17 @@
+# Generated by Django 5.1 on 2026-10-18 01:41
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operation', '0005_backfill_result_columns'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='detectioncacheentry',
+            name='operated_image',
+        ),
+    ]
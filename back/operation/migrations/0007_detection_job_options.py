@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 01:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operation', '0006_drop_cached_operated_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectionjob',
+            name='options',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
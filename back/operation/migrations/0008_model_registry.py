@@ -0,0 +1,68 @@
+# Generated by Django 5.1 on 2026-10-18 01:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def register_initial_model(apps, schema_editor):
+    # Results so far all came from the hardcoded train8 weights, mostly on PyTorch.
+    DetectionModel = apps.get_model('operation', 'DetectionModel')
+    OperationResult = apps.get_model('operation', 'OperationResult')
+    DetectionCacheEntry = apps.get_model('operation', 'DetectionCacheEntry')
+    DetectionModel.objects.create(
+        version='train8',
+        weights_path='runs/detect/train8/weights/best.pt',
+        description='Initial model',
+        is_active=True,
+    )
+    OperationResult.objects.filter(model_version='').update(model_version='train8:pytorch')
+    # Cached detections stored before now do not record their model version
+    DetectionCacheEntry.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operation', '0007_detection_job_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='operationresult',
+            name='model_version',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=100),
+        ),
+        migrations.CreateModel(
+            name='DetectionModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.CharField(max_length=50, unique=True)),
+                ('weights_path', models.CharField(max_length=500)),
+                ('description', models.TextField(blank=True, default='')),
+                ('is_active', models.BooleanField(default=False)),
+                ('shadow_fraction', models.FloatField(default=0.0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('activated_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('is_active', True)), fields=('is_active',), name='single_active_detection_model')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ShadowDetectionResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model_version', models.CharField(db_index=True, max_length=100)),
+                ('primary_model_version', models.CharField(max_length=100)),
+                ('detections', models.JSONField(default=list)),
+                ('matched', models.PositiveIntegerField(default=0)),
+                ('missing', models.PositiveIntegerField(default=0)),
+                ('extra', models.PositiveIntegerField(default=0)),
+                ('mean_iou', models.FloatField(blank=True, null=True)),
+                ('inference_ms', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('operation_image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shadow_results', to='operation.operationimage')),
+            ],
+        ),
+        migrations.RunPython(register_initial_model, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.1 on 2026-10-18 02:04
+
+from django.db import migrations, models
+
+# Frozen copy of operation.geo.encode_geohash at the time of this migration
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+GEOHASH_PRECISION = 12
+BATCH_SIZE = 1000
+
+
+def encode_geohash(latitude, longitude, precision=GEOHASH_PRECISION):
+    latitude, longitude = float(latitude), float(longitude)
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True  # bits alternate between longitude and latitude, starting with longitude
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = 0
+            value = 0
+    return ''.join(chars)
+
+
+def backfill_geohash(apps, schema_editor):
+    """Compute the geohash of existing images."""
+    OperationImage = apps.get_model('operation', 'OperationImage')
+    batch = []
+    queryset = OperationImage.objects.filter(geohash='').only('id', 'latitude', 'longitude')
+    for operation_image in queryset.iterator(chunk_size=BATCH_SIZE):
+        operation_image.geohash = encode_geohash(operation_image.latitude, operation_image.longitude)
+        batch.append(operation_image)
+        if len(batch) >= BATCH_SIZE:
+            OperationImage.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    if batch:
+        OperationImage.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operation', '0009_upload_sessions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='operationimage',
+            name='geohash',
+            field=models.CharField(blank=True, default='', max_length=12),
+        ),
+        # Fill the column before indexing it
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='operationimage',
+            index=models.Index(fields=['geohash'], name='operation_image_geohash_idx', opclasses=['varchar_pattern_ops']),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1 on 2026-10-18 02:09
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operation', '0011_map_tiles'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Defect',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('damage_type', models.CharField(max_length=100)),
+                ('class_id', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('longitude', models.DecimalField(decimal_places=10, max_digits=20)),
+                ('latitude', models.DecimalField(decimal_places=10, max_digits=20)),
+                ('geohash', models.CharField(max_length=12)),
+                ('detection_count', models.PositiveIntegerField(default=0)),
+                ('report_count', models.PositiveIntegerField(default=0)),
+                ('first_seen_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_seen_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['geohash'], name='defect_geohash_idx', opclasses=['varchar_pattern_ops'])],
+            },
+        ),
+        migrations.AddField(
+            model_name='operationresult',
+            name='defect',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='results', to='operation.defect'),
+        ),
+        migrations.AddField(
+            model_name='report',
+            name='defects',
+            field=models.ManyToManyField(blank=True, related_name='reports', to='operation.defect'),
+        ),
+    ]
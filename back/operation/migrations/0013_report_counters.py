@@ -0,0 +1,65 @@
+# Generated by Django 5.1 on 2026-10-18 02:10
+
+from collections import defaultdict
+from datetime import date, timedelta
+
+from django.db import migrations, models
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+
+# Frozen copy of operation.stats.EPOCH at the time of this migration
+EPOCH = date(1970, 1, 1)
+
+
+def seed_report_counters(apps, schema_editor):
+    """Count existing reports per day, week and in total, by status and damage type."""
+    Report = apps.get_model('operation', 'Report')
+    ReportCounter = apps.get_model('operation', 'ReportCounter')
+    counters = defaultdict(int)
+    rows = [
+        ('status', row['day'], row['status'], row['count'])
+        for row in Report.objects.annotate(day=TruncDate('date')).values('day', 'status').annotate(count=Count('id')).order_by()
+    ] + [
+        ('damage_type', row['day'], row['damage_type'], row['count'])
+        for row in (
+            Report.objects
+            .annotate(day=TruncDate('date'), damage_type=F('operation__images__results__damage_type'))
+            .exclude(damage_type=None)
+            .values('day', 'damage_type')
+            .annotate(count=Count('id', distinct=True))
+            .order_by()
+        )
+    ]
+    for dimension, day, key, count in rows:
+        for bucket, period_start in (('total', EPOCH), ('day', day), ('week', day - timedelta(days=day.weekday()))):
+            counters[(bucket, period_start, dimension, key)] += count
+
+    ReportCounter.objects.bulk_create([
+        ReportCounter(bucket=bucket, period_start=period_start, dimension=dimension, key=key, count=count)
+        for (bucket, period_start, dimension, key), count in counters.items()
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operation', '0012_defects'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.CharField(choices=[('total', 'Total'), ('day', 'Day'), ('week', 'Week')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('dimension', models.CharField(choices=[('status', 'Status'), ('damage_type', 'Damage type')], max_length=20)),
+                ('key', models.CharField(max_length=100)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('bucket', 'dimension', 'period_start', 'key'), name='unique_report_counter')],
+            },
+        ),
+        migrations.RunPython(seed_report_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1 on 2026-10-18 02:40
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_report_dates(apps, schema_editor):
+    """Start the version marker of existing reports at their creation date."""
+    Report = apps.get_model('operation', 'Report')
+    Report.objects.update(updated_at=F('date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operation', '0014_report_pagination_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='report',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.RunPython(copy_report_dates, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['updated_at'], name='report_updated_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['user', 'updated_at'], name='report_user_updated_at_idx'),
+        ),
+    ]
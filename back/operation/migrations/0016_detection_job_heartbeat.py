@@ -0,0 +1,26 @@
+# Generated by Django 5.1 on 2026-10-18 03:10
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_start_dates(apps, schema_editor):
+    """Running jobs last showed signs of life when they started."""
+    DetectionJob = apps.get_model('operation', 'DetectionJob')
+    DetectionJob.objects.filter(status='RUNNING').update(heartbeat_at=F('started_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operation', '0015_report_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detectionjob',
+            name='heartbeat_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(copy_start_dates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1 on 2026-10-18 02:46
+
+from django.db import migrations, models
+
+
+def create_generation(apps, schema_editor):
+    ReportGeneration = apps.get_model('operation', 'ReportGeneration')
+    ReportGeneration.objects.create(pk=1, value=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('operation', '0016_detection_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_generation, migrations.RunPython.noop),
+    ]
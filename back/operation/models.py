@@ -1,5 +1,14 @@
 from django.db import models
 from django.conf import settings
+from django.utils import timezone
+
+
+DETECTION_STATUS_CHOICES = [
+    ('QUEUED', 'Queued'),
+    ('RUNNING', 'Running'),
+    ('DONE', 'Done'),
+    ('FAILED', 'Failed'),
+]
 
 
 class Operation(models.Model):
@@ -23,13 +32,52 @@ class OperationImage(models.Model):
     )
     longitude = models.DecimalField(decimal_places=10, max_digits=20)
     latitude = models.DecimalField(decimal_places=10, max_digits=20)
+    # Geohash of the location, see operation.geo. Area queries scan it by prefix.
+    geohash = models.CharField(max_length=12, blank=True, default='')
     original_image = models.ImageField(upload_to="operation_images/original/")
+    # Only set on images annotated before rendering moved on demand, see operation.rendering
     operated_image = models.ImageField(upload_to="operation_images/operated/", blank=True, null=True)
+    detection_status = models.CharField(
+        max_length=20,
+        choices=DETECTION_STATUS_CHOICES,
+        default='QUEUED'
+    )
+
+    class Meta:
+        indexes = [
+            # Pattern ops so LIKE 'prefix%' uses the index whatever the database collation
+            models.Index(fields=['geohash'], name='operation_image_geohash_idx', opclasses=['varchar_pattern_ops']),
+        ]
     
     def __str__(self):
         return f"Images for Operation {self.operation.id}"
 
 
+class Defect(models.Model):
+    """
+    A single physical defect, e.g. one pothole, that detections of the same
+    damage type close to each other are merged into, see operation.defects.
+    """
+    damage_type = models.CharField(max_length=100)
+    class_id = models.PositiveSmallIntegerField(blank=True, null=True)
+    # Centroid of the merged detections
+    longitude = models.DecimalField(decimal_places=10, max_digits=20)
+    latitude = models.DecimalField(decimal_places=10, max_digits=20)
+    geohash = models.CharField(max_length=12)
+    detection_count = models.PositiveIntegerField(default=0)
+    report_count = models.PositiveIntegerField(default=0)
+    first_seen_at = models.DateTimeField(default=timezone.now)
+    last_seen_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['geohash'], name='defect_geohash_idx', opclasses=['varchar_pattern_ops']),
+        ]
+
+    def __str__(self):
+        return f"Defect {self.id}: {self.damage_type} ({self.report_count} reports)"
+
+
 class OperationResult(models.Model):
     """
     Contains results of an operation including damage description and type.
@@ -41,6 +89,27 @@ class OperationResult(models.Model):
     )
     damage_description = models.TextField()
     damage_type = models.CharField(max_length=100)
+    class_id = models.PositiveSmallIntegerField(blank=True, null=True)
+    confidence = models.FloatField(blank=True, null=True, db_index=True)
+    bbox_x1 = models.FloatField(blank=True, null=True)
+    bbox_y1 = models.FloatField(blank=True, null=True)
+    bbox_x2 = models.FloatField(blank=True, null=True)
+    bbox_y2 = models.FloatField(blank=True, null=True)
+    model_version = models.CharField(max_length=100, blank=True, default='', db_index=True)
+    defect = models.ForeignKey(
+        Defect,
+        on_delete=models.SET_NULL,
+        related_name="results",
+        blank=True,
+        null=True
+    )
+
+    @property
+    def bbox(self):
+        """Bounding box as [x1, y1, x2, y2], or None for legacy rows."""
+        if self.bbox_x1 is None:
+            return None
+        return [self.bbox_x1, self.bbox_y1, self.bbox_x2, self.bbox_y2]
 
     def __str__(self):
         return f"Result for Operation {self.operation_image.operation.id}: {self.damage_type}"
@@ -48,6 +117,254 @@ class OperationResult(models.Model):
 
 
 
+class DetectionJob(models.Model):
+    """
+    Queued damage-detection work for an operation, claimed by detection workers.
+    """
+    operation = models.ForeignKey(
+        Operation,
+        on_delete=models.CASCADE,
+        related_name="detection_jobs"
+    )
+    status = models.CharField(
+        max_length=20,
+        choices=DETECTION_STATUS_CHOICES,
+        default='QUEUED'
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True, default='')
+    options = models.JSONField(default=dict, blank=True)  # per-request detection options, e.g. tiling
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    heartbeat_at = models.DateTimeField(blank=True, null=True)  # refreshed by the worker running the job
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Detection job {self.id} for Operation {self.operation_id} - {self.status}"
+
+
+class UploadSession(models.Model):
+    """
+    A resumable upload of operation images. Files arrive in chunks and are
+    turned into an operation once the session is finalized.
+    """
+    UPLOAD_STATUS_CHOICES = [
+        ('OPEN', 'Open'),
+        ('FINALIZED', 'Finalized'),
+    ]
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="upload_sessions"
+    )
+    longitude = models.DecimalField(decimal_places=10, max_digits=20)
+    latitude = models.DecimalField(decimal_places=10, max_digits=20)
+    options = models.JSONField(default=dict, blank=True)  # detection options applied on finalize, e.g. tiling
+    status = models.CharField(
+        max_length=20,
+        choices=UPLOAD_STATUS_CHOICES,
+        default='OPEN'
+    )
+    operation = models.ForeignKey(
+        Operation,
+        on_delete=models.SET_NULL,
+        related_name="upload_sessions",
+        blank=True,
+        null=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at']),
+        ]
+
+    def __str__(self):
+        return f"Upload session {self.id} by {self.user_id} - {self.status}"
+
+
+class UploadFile(models.Model):
+    """
+    One file of an upload session and how many of its bytes have arrived.
+    """
+    session = models.ForeignKey(
+        UploadSession,
+        on_delete=models.CASCADE,
+        related_name="files"
+    )
+    index = models.PositiveIntegerField()
+    name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    received = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['index']
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'index'], name='unique_upload_file_index'),
+        ]
+
+    @property
+    def is_complete(self):
+        return self.received >= self.size
+
+    def __str__(self):
+        return f"File {self.index} of upload session {self.session_id} ({self.received}/{self.size})"
+
+
+class DetectionCacheEntry(models.Model):
+    """
+    Detections of a previously processed image, reused for repeat uploads.
+    Keyed by exact content hash, with a 64-bit perceptual hash split into
+    four indexed 16-bit bands for near-duplicate lookups.
+    """
+    content_hash = models.CharField(max_length=64)
+    model_version = models.CharField(max_length=100)
+    phash = models.BigIntegerField()
+    phash_band0 = models.IntegerField(db_index=True)
+    phash_band1 = models.IntegerField(db_index=True)
+    phash_band2 = models.IntegerField(db_index=True)
+    phash_band3 = models.IntegerField(db_index=True)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    detections = models.JSONField(default=list)
+    hit_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['content_hash', 'model_version'], name='unique_cache_entry_per_model'),
+        ]
+
+    def __str__(self):
+        return f"Cached detections {self.content_hash[:12]} ({self.model_version})"
+
+
+class ReportCounter(models.Model):
+    """
+    Count of reports in a period for one value of a dimension, e.g. reports
+    created on a day that are now COMPLETED. Kept up to date in the same
+    transaction as the reports, see operation.stats.
+    """
+    BUCKET_CHOICES = [
+        ('total', 'Total'),
+        ('day', 'Day'),
+        ('week', 'Week'),
+    ]
+    DIMENSION_CHOICES = [
+        ('status', 'Status'),
+        ('damage_type', 'Damage type'),
+    ]
+
+    bucket = models.CharField(max_length=10, choices=BUCKET_CHOICES)
+    period_start = models.DateField()  # report date, or the Monday of its week; 1970-01-01 for totals
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)
+    key = models.CharField(max_length=100)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['bucket', 'dimension', 'period_start', 'key'],
+                name='unique_report_counter'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.bucket} {self.period_start} {self.dimension}={self.key}: {self.count}"
+
+
+class ReportGeneration(models.Model):
+    """
+    Single row bumped in the transaction of every report save and delete.
+    Report list ETags include it, so reports entering or leaving a filtered
+    list change them without counting the list, see operation.etags.
+    """
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Report generation {self.value}"
+
+
+class MapTile(models.Model):
+    """
+    Cached GeoJSON of a damage map tile, per scope of visible reports.
+    Deleted when detections or reports inside the tile change.
+    """
+    z = models.PositiveSmallIntegerField()
+    x = models.PositiveIntegerField()
+    y = models.PositiveIntegerField()
+    scope = models.CharField(max_length=50)  # 'all' for workers, 'user:<id>' for users
+    content = models.TextField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['z', 'x', 'y', 'scope'], name='unique_map_tile_per_scope'),
+        ]
+
+    def __str__(self):
+        return f"Map tile {self.z}/{self.x}/{self.y} ({self.scope})"
+
+
+class DetectionModel(models.Model):
+    """
+    Versioned detection weights. The active version serves all detections and
+    a candidate with a shadow fraction also runs on that share of images for comparison.
+    """
+    version = models.CharField(max_length=50, unique=True)
+    # .pt weights, relative to BASE_DIR or absolute. Exported engines live next to them.
+    weights_path = models.CharField(max_length=500)
+    description = models.TextField(blank=True, default='')
+    is_active = models.BooleanField(default=False)
+    shadow_fraction = models.FloatField(default=0.0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    activated_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['is_active'],
+                condition=models.Q(is_active=True),
+                name='single_active_detection_model'
+            ),
+        ]
+
+    def __str__(self):
+        return f"Detection model {self.version}{' (active)' if self.is_active else ''}"
+
+
+class ShadowDetectionResult(models.Model):
+    """
+    Detections of a shadow candidate model on an image, next to how they
+    compare with the detections served by the active model.
+    """
+    operation_image = models.ForeignKey(
+        OperationImage,
+        on_delete=models.CASCADE,
+        related_name="shadow_results"
+    )
+    model_version = models.CharField(max_length=100, db_index=True)
+    primary_model_version = models.CharField(max_length=100)
+    detections = models.JSONField(default=list)
+    matched = models.PositiveIntegerField(default=0)
+    missing = models.PositiveIntegerField(default=0)
+    extra = models.PositiveIntegerField(default=0)
+    mean_iou = models.FloatField(blank=True, null=True)
+    inference_ms = models.FloatField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Shadow detections of {self.model_version} for image {self.operation_image_id}"
+
+
 class Report(models.Model):
     """
     Represents a report containing metadata about an operation.
@@ -72,12 +389,25 @@ class Report(models.Model):
     )
     description = models.TextField(blank=True, null=True)
     date = models.DateTimeField(auto_now_add=True)
+    # Version marker for ETags, also bumped when anything the report renders changes, see operation.etags
+    updated_at = models.DateTimeField(auto_now=True)
+    # Defects detected in the report's images, shared by reports of the same defect
+    defects = models.ManyToManyField(Defect, related_name="reports", blank=True)
     status = models.CharField(
         max_length=20,
         choices=REPORT_STATUS_CHOICES,
         default='RECEIVED'
     )
 
+    class Meta:
+        indexes = [
+            # Keyset pagination, newest first
+            models.Index(fields=['date', 'id'], name='report_date_id_idx'),
+            models.Index(fields=['user', 'date', 'id'], name='report_user_date_id_idx'),
+            models.Index(fields=['updated_at'], name='report_updated_at_idx'),
+            models.Index(fields=['user', 'updated_at'], name='report_user_updated_at_idx'),
+        ]
+
     def __str__(self):
         return f"Report by {self.user.username} on {self.date} - Status: {self.get_status_display()}"
 
@@ -0,0 +1,106 @@
+from django.conf import settings
+from django.db import connections
+import queue
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of the stream between stages
+_END = object()
+
+# Seconds a blocked stage waits before checking whether another stage failed
+_POLL_INTERVAL = 0.1
+
+
+def _put(outbox, item, failed):
+    """Put an item on a bounded queue, giving up once any stage has failed."""
+    while not failed.is_set():
+        try:
+            outbox.put(item, timeout=_POLL_INTERVAL)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+def _get(inbox, failed):
+    """Take the next item from a queue, or _END once any stage has failed."""
+    while not failed.is_set():
+        try:
+            return inbox.get(timeout=_POLL_INTERVAL)
+        except queue.Empty:
+            continue
+    return _END
+
+def _feed(items, outbox, failed):
+    """Put every item on the first queue, followed by the end marker."""
+    for item in items:
+        if not _put(outbox, item, failed):
+            return
+    _put(outbox, _END, failed)
+
+def _run_stage(stage, inbox, outbox, failed, errors):
+    """Apply stage to every item of inbox in this thread, passing results to outbox."""
+    try:
+        while True:
+            item = _get(inbox, failed)
+            if item is _END:
+                break
+            if not _put(outbox, stage(item), failed):
+                break
+    except Exception as e:
+        logger.error(f"Pipeline stage {stage.__name__} failed: {str(e)}")
+        errors.append(e)
+        failed.set()
+    finally:
+        _put(outbox, _END, failed)
+        # Stage threads open their own database connections
+        connections.close_all()
+
+def run_pipeline(items, stages, queue_size=None):
+    """
+    Run items through stages, each in its own thread, connected by bounded
+    queues so one item can be decoded while the previous one is in inference
+    and the one before is written to the database. Each stage takes one item
+    and returns the input of the next stage. Returns the outputs of the last
+    stage in order, and re-raises the first error of any stage.
+    """
+    queue_size = queue_size or settings.DETECTION_PIPELINE_QUEUE_SIZE
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    failed = threading.Event()
+    errors = []
+
+    threads = [
+        threading.Thread(
+            target=_run_stage,
+            args=(stage, queues[index], queues[index + 1], failed, errors),
+            name=f"pipeline-{stage.__name__}",
+            daemon=True,
+        )
+        for index, stage in enumerate(stages)
+    ]
+    for thread in threads:
+        thread.start()
+
+    # Feed the first stage from a thread too, so the last queue can be drained here
+    feeder = threading.Thread(
+        target=_feed,
+        args=(items, queues[0], failed),
+        name='pipeline-feeder',
+        daemon=True,
+    )
+    feeder.start()
+
+    outputs = []
+    while True:
+        item = _get(queues[-1], failed)
+        if item is _END:
+            break
+        outputs.append(item)
+
+    feeder.join()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return outputs
@@ -0,0 +1,77 @@
+import cv2
+import numpy as np
+import onnx
+import logging
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static
+
+logger = logging.getLogger(__name__)
+
+QUANTIZATION_MODES = ('dynamic', 'static')
+
+
+def preprocess_for_model(image, imgsz):
+    """
+    Letterbox a BGR image into the NCHW float input of an exported YOLO
+    model, the same way ultralytics prepares images for prediction.
+    """
+    height, width = image.shape[:2]
+    scale = min(imgsz / height, imgsz / width)
+    resized = cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top = (imgsz - resized.shape[0]) // 2
+    left = (imgsz - resized.shape[1]) // 2
+    canvas[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+    tensor = canvas[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+    return tensor[np.newaxis]
+
+
+class ImageCalibrationReader(CalibrationDataReader):
+    """
+    Feeds sample road images to static quantization to calibrate activation ranges.
+    """
+    def __init__(self, input_name, image_paths, imgsz):
+        self.input_name = input_name
+        self.image_paths = iter(image_paths)
+        self.imgsz = imgsz
+
+    def get_next(self):
+        for path in self.image_paths:
+            image = cv2.imread(path)
+            if image is not None:
+                return {self.input_name: preprocess_for_model(image, self.imgsz)}
+        return None
+
+
+def quantize_onnx_model(onnx_path, output_path, mode='dynamic', calibration_images=None, imgsz=640):
+    """
+    Quantize an exported ONNX detection model to INT8.
+    Dynamic mode quantizes weights only and computes activation ranges at
+    runtime. Static mode also fixes activation ranges from calibration images.
+    """
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode '{mode}'. Valid options: {list(QUANTIZATION_MODES)}")
+
+    if mode == 'dynamic':
+        quantize_dynamic(onnx_path, output_path, weight_type=QuantType.QUInt8)
+    else:
+        if not calibration_images:
+            raise ValueError('Static quantization needs calibration images')
+        input_name = onnx.load(onnx_path, load_external_data=False).graph.input[0].name
+        quantize_static(
+            onnx_path,
+            output_path,
+            ImageCalibrationReader(input_name, calibration_images, imgsz),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+        )
+
+    # Keep the class names, stride and input size ultralytics stored on export
+    source = onnx.load(onnx_path, load_external_data=False)
+    quantized = onnx.load(output_path)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(source.metadata_props)
+    onnx.save(quantized, output_path)
+    logger.info(f"Quantized {onnx_path} to {output_path} ({mode} INT8)")
+    return output_path
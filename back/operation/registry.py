@@ -0,0 +1,178 @@
+from django.conf import settings
+from django.db import DatabaseError, connections, transaction
+from django.utils import timezone
+import os
+import threading
+import time
+import logging
+
+from .inference import MODEL_PATH, LocalDetector, RemoteDetector, load_yolo_model
+from .models import DetectionModel
+
+logger = logging.getLogger(__name__)
+
+# Detectors of this process. Each is replaced as a whole when the registry
+# changes, so detection already running keeps the detector it started with.
+_detector = None
+_shadow = None  # (detector, fraction) once shadow detection has been requested
+_shadow_requested = False
+_watcher = None
+_lock = threading.Lock()
+
+
+def resolve_weights_path(weights_path):
+    """Registry weights paths may be relative to BASE_DIR."""
+    if os.path.isabs(weights_path):
+        return weights_path
+    return os.path.join(settings.BASE_DIR, weights_path)
+
+def get_model_spec(model=None):
+    """
+    Version and weights path of a registered model, or of the default
+    weights when there is none. Versions include the engine, since
+    detections differ between engines.
+    """
+    if model is None:
+        return {
+            'version': f"{settings.DETECTION_MODEL_VERSION}:{settings.DETECTION_ENGINE}",
+            'weights_path': MODEL_PATH,
+        }
+    return {
+        'version': f"{model.version}:{settings.DETECTION_ENGINE}",
+        'weights_path': resolve_weights_path(model.weights_path),
+    }
+
+def get_registry_models():
+    """
+    Return the active model and the shadow candidate, either may be None.
+    A registry that cannot be read falls back to the default weights.
+    """
+    try:
+        active = DetectionModel.objects.filter(is_active=True).first()
+        shadow = (
+            DetectionModel.objects
+            .filter(is_active=False, shadow_fraction__gt=0)
+            .order_by('-created_at')
+            .first()
+        )
+    except DatabaseError as e:
+        logger.warning(f"Could not read the model registry, using default weights: {str(e)}")
+        return None, None
+    return active, shadow
+
+def get_weights_path(version=None):
+    """
+    Weights path of a registered version, or of the active model by default.
+    Raises DetectionModel.DoesNotExist for unknown versions.
+    """
+    if version is None:
+        active, _ = get_registry_models()
+        return get_model_spec(active)['weights_path']
+    return resolve_weights_path(DetectionModel.objects.get(version=version).weights_path)
+
+def activate_detection_model(version, shadow_fraction=None):
+    """
+    Make a registered version the active model, or with shadow_fraction the
+    only shadow candidate. Processes pick the change up on their next poll.
+    """
+    with transaction.atomic():
+        model = DetectionModel.objects.select_for_update().get(version=version)
+        if shadow_fraction is None:
+            DetectionModel.objects.filter(is_active=True).exclude(id=model.id).update(is_active=False)
+            model.is_active = True
+            model.shadow_fraction = 0
+            model.activated_at = timezone.now()
+        else:
+            if model.is_active:
+                raise ValueError(f"Detection model {version} is active and cannot run in shadow")
+            DetectionModel.objects.filter(shadow_fraction__gt=0).exclude(id=model.id).update(shadow_fraction=0)
+            model.shadow_fraction = shadow_fraction
+        model.save(update_fields=['is_active', 'shadow_fraction', 'activated_at'])
+    logger.info(f"Detection model {version} {'activated' if shadow_fraction is None else 'set as shadow'}")
+    return model
+
+def build_detector(spec):
+    """Detector serving a model spec in this process."""
+    if settings.INFERENCE_SERVER_SOCKET:
+        # The inference server loads and swaps the weights itself
+        return RemoteDetector(settings.INFERENCE_SERVER_SOCKET, settings.INFERENCE_SERVER_TIMEOUT, spec['version'])
+    return LocalDetector(load_yolo_model(weights_path=spec['weights_path']), spec['version'])
+
+def refresh_detectors():
+    """
+    Load models the registry points at but this process does not serve yet,
+    then swap them in. Returns True if anything was swapped.
+    """
+    global _detector, _shadow
+    active, shadow = get_registry_models()
+    swapped = False
+
+    with _lock:
+        spec = get_model_spec(active)
+        if _detector is None or _detector.model_version != spec['version']:
+            # Load before swapping, so requests keep being served by the old model meanwhile
+            detector = build_detector(spec)
+            if _detector is not None:
+                logger.info(f"Swapping detection model {_detector.model_version} for {spec['version']}")
+            _detector = detector
+            swapped = True
+
+        if _shadow_requested:
+            if shadow is None:
+                _shadow = None
+            elif _shadow is None or _shadow[0].model_version != get_model_spec(shadow)['version']:
+                shadow_spec = get_model_spec(shadow)
+                logger.info(f"Loading shadow detection model {shadow_spec['version']}")
+                model = load_yolo_model(weights_path=shadow_spec['weights_path'])
+                _shadow = (LocalDetector(model, shadow_spec['version']), shadow.shadow_fraction)
+                swapped = True
+            else:
+                _shadow = (_shadow[0], shadow.shadow_fraction)
+
+    return swapped
+
+def _watch_registry(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            refresh_detectors()
+        except Exception as e:
+            logger.error(f"Error refreshing detection models: {str(e)}")
+        finally:
+            # Do not hold a database connection between polls
+            connections.close_all()
+
+def start_model_watcher(interval=None):
+    """Poll the registry in a background thread of this process and hot-swap models."""
+    global _watcher
+    interval = settings.DETECTION_MODEL_POLL_INTERVAL if interval is None else interval
+    if _watcher is not None or interval <= 0:
+        return
+    _watcher = threading.Thread(target=_watch_registry, args=(interval,), name='model-registry-watcher', daemon=True)
+    _watcher.start()
+
+def get_detector():
+    """
+    Get the detector of the active model for this process.
+    Uses the shared inference server when INFERENCE_SERVER_SOCKET is set.
+    """
+    if _detector is None:
+        refresh_detectors()
+        start_model_watcher()
+    return _detector
+
+def get_shadow_detector():
+    """Return (detector, fraction) of the shadow candidate, or None if there is none."""
+    global _shadow_requested
+    if not _shadow_requested:
+        _shadow_requested = True
+        refresh_detectors()
+        start_model_watcher()
+    return _shadow
+
+def get_model_version():
+    """Identify the weights and engine producing detections, e.g. for cache keys."""
+    if _detector is not None:
+        return _detector.model_version
+    active, _ = get_registry_models()
+    return get_model_spec(active)['version']
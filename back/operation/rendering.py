@@ -0,0 +1,153 @@
+from django.conf import settings
+import cv2
+import numpy as np
+import os
+import tempfile
+import time
+import logging
+
+from .metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+# Longest side in pixels of each rendered variant (None keeps the original size)
+RENDER_SIZES = {
+    'thumbnail': 320,
+    'full': None,
+}
+
+# Seconds between cache eviction sweeps in each process
+EVICTION_INTERVAL = 60
+# Seconds after which a temporary file of a render is considered abandoned
+TEMP_FILE_MAX_AGE = 3600
+
+_last_eviction = 0.0
+
+
+def get_render_dir():
+    return os.path.join(settings.MEDIA_ROOT, 'operation_images', 'rendered')
+
+def get_render_path(operation_image, detections, size):
+    """
+    Path of a rendered variant. The newest result id is part of the name,
+    so re-running detection renders a fresh file instead of serving a stale one.
+    """
+    version = max((detection.id for detection in detections), default=0)
+    return os.path.join(get_render_dir(), size, f"{operation_image.id}_{version}.jpg")
+
+def draw_detections(image, detections, scale=1.0):
+    """Draw labelled boxes for stored detections onto a BGR image."""
+    for detection in detections:
+        if detection.bbox is None:
+            continue
+        x1, y1, x2, y2 = (int(value * scale) for value in detection.bbox)
+        cv2.rectangle(image, (x1, y1), (x2, y2), (255, 0, 0), 2)
+        label = f"{detection.damage_type} ({detection.confidence:.2f})"
+        cv2.putText(
+            image,
+            label,
+            (x1, y1 - 10),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            0.5,
+            (255, 0, 0),
+            1,
+            lineType=cv2.LINE_AA
+        )
+    return image
+
+def write_annotated_image(operation_image, detections, size, output_path):
+    """Draw detections onto the original image and write the variant to output_path."""
+    with operation_image.original_image.open('rb') as image_file:
+        data = image_file.read()
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError(f"Could not decode {operation_image.original_image.name}")
+
+    # Downscale before drawing so labels stay legible in small variants
+    scale = 1.0
+    max_side = RENDER_SIZES[size]
+    if max_side and max(image.shape[:2]) > max_side:
+        scale = max_side / max(image.shape[:2])
+        image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    draw_detections(image, detections, scale)
+
+    ok, encoded = cv2.imencode('.jpg', image)
+    if not ok:
+        raise ValueError(f"Could not encode annotated image {operation_image.id}")
+
+    # Write to a temp file and rename, so concurrent renders never serve a partial file
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(output_path), suffix='.tmp')
+    with os.fdopen(fd, 'wb') as temp_file:
+        temp_file.write(encoded.tobytes())
+    os.replace(temp_path, output_path)
+
+def is_rendered(operation_image, size):
+    """Whether the annotated variant of an image is in the cache."""
+    return os.path.exists(get_render_path(operation_image, list(operation_image.results.all()), size))
+
+def render_annotated_image(operation_image, size='full'):
+    """
+    Return the path of the annotated variant of an image, rendering and
+    caching it on first request.
+    """
+    if size not in RENDER_SIZES:
+        raise ValueError(f"Invalid size. Valid options: {list(RENDER_SIZES)}")
+
+    detections = list(operation_image.results.all())
+    output_path = get_render_path(operation_image, detections, size)
+    if os.path.exists(output_path):
+        # Mark as recently used for eviction
+        os.utime(output_path)
+        return output_path
+
+    with observe_stage('annotation'):
+        write_annotated_image(operation_image, detections, size, output_path)
+
+    maybe_evict_rendered_images()
+    return output_path
+
+def maybe_evict_rendered_images():
+    """Run an eviction sweep at most once per EVICTION_INTERVAL in this process."""
+    global _last_eviction
+    now = time.monotonic()
+    if now - _last_eviction < EVICTION_INTERVAL:
+        return
+    _last_eviction = now
+    evict_rendered_images()
+
+def evict_rendered_images(max_bytes=None):
+    """Delete least recently used rendered images until the cache fits in max_bytes."""
+    if max_bytes is None:
+        max_bytes = settings.RENDERED_IMAGE_CACHE_MAX_MB * 1024 * 1024
+
+    files = []
+    total = 0
+    now = time.time()
+    for root, _, names in os.walk(get_render_dir()):
+        for name in names:
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if name.endswith('.tmp') and now - stat.st_mtime < TEMP_FILE_MAX_AGE:
+                # Being written by a render, deleting it would fail its rename
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+    deleted = 0
+    for _, file_size, path in sorted(files):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= file_size
+        deleted += 1
+
+    if deleted:
+        logger.info(f"Evicted {deleted} rendered images")
+    return deleted
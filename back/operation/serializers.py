@@ -1,36 +1,148 @@
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.validators import validate_image_file_extension
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
 from rest_framework import serializers
-from .models import Operation, OperationImage, OperationResult, Report
-from .services import process_damage_detection
+import os
+from datetime import timedelta
+from .models import Operation, OperationImage, OperationResult, Report, DetectionJob, UploadSession, UploadFile, Defect
+from .services import read_upload, decode_image_bytes
+from .uploads import create_operation, validate_upload_name
+from .map_tiles import invalidate_operation_tiles
+from .defects import link_report_defects
+from .stats import count_report
+from .tiling import check_tile_count, get_tiling_options
+import cv2
+
+
+def pop_tiling_options(validated_data):
+    """Take the per-upload tiling fields out of validated data, leaving settings defaults for the rest."""
+    tiling = {
+        'enabled': validated_data.pop('tiled', None),
+        'tile_size': validated_data.pop('tile_size', None),
+        'overlap': validated_data.pop('tile_overlap', None),
+    }
+    return {key: value for key, value in tiling.items() if value is not None}
+
+def get_field_selection(request):
+    """
+    Serializer arguments from the ?fields= and ?expand= query parameters,
+    comma separated field names. Empty when neither is given.
+    """
+    selection = {}
+    for name in ('fields', 'expand'):
+        value = request.query_params.get(name)
+        if value is not None:
+            selection[name] = [field.strip() for field in value.split(',') if field.strip()]
+    return selection
+
+class DynamicFieldsMixin:
+    """
+    Serializer taking `fields` and `expand` arguments to prune what it
+    renders. Without either, every field is rendered. With `fields`, only
+    the listed ones are; otherwise fields in Meta.expandable_fields are left
+    out unless named in `expand`. Write-only fields are never pruned.
+    """
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is None and expand is None:
+            return
+
+        if fields is not None:
+            keep = set(fields)
+        else:
+            keep = set(self.fields) - set(getattr(self.Meta, 'expandable_fields', []))
+        keep |= set(expand or [])
+        for name in list(self.fields):
+            if name not in keep and not self.fields[name].write_only:
+                self.fields.pop(name)
+
+class DecodedImageField(serializers.ImageField):
+    """
+    Image field that validates an upload by decoding it once with OpenCV
+    straight from its in-memory or temporary buffer, instead of parsing it
+    with Pillow. The bytes and array are kept on the file as `encoded_data`
+    and `decoded_image` for inline detection. When detection runs in the
+    background only a reduced-scale decode is needed to validate.
+    """
+    def to_internal_value(self, data):
+        # FileField checks name and size; the decode below replaces Pillow validation
+        file_object = serializers.FileField.to_internal_value(self, data)
+        # Stored originals are served as they are named, so only image extensions are accepted
+        try:
+            validate_image_file_extension(file_object)
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.messages)
+        encoded_data = read_upload(file_object)
+        flags = cv2.IMREAD_REDUCED_COLOR_4 if settings.DETECTION_ASYNC else cv2.IMREAD_COLOR
+        decoded_image = decode_image_bytes(encoded_data, flags)
+        if decoded_image is None:
+            self.fail('invalid_image')
+
+        scale = 4 if settings.DETECTION_ASYNC else 1
+        file_object.image_shape = (decoded_image.shape[0] * scale, decoded_image.shape[1] * scale)
+        file_object.encoded_data = encoded_data
+        file_object.decoded_image = None if settings.DETECTION_ASYNC else decoded_image
+        return file_object
 
 class OperationResultSerializer(serializers.ModelSerializer):
+    bbox = serializers.ListField(child=serializers.FloatField(), read_only=True, allow_null=True)
+
     class Meta:
         model = OperationResult
-        fields = ['id', 'damage_description', 'damage_type']
+        fields = ['id', 'damage_description', 'damage_type', 'class_id', 'confidence', 'bbox', 'model_version']
 
 class OperationImageSerializer(serializers.ModelSerializer):
     results = OperationResultSerializer(many=True, read_only=True)
     operated_image = serializers.SerializerMethodField()
+    operated_thumbnail = serializers.SerializerMethodField()
 
     class Meta:
         model = OperationImage
-        fields = ['id', 'longitude', 'latitude', 'original_image', 'operated_image', 'results']
+        fields = ['id', 'longitude', 'latitude', 'original_image', 'operated_image', 'operated_thumbnail', 'detection_status', 'results']
 
     def get_operated_image(self, obj):
+        return self.get_annotated_url(obj, 'full')
+
+    def get_operated_thumbnail(self, obj):
+        return self.get_annotated_url(obj, 'thumbnail')
+
+    def get_annotated_url(self, obj, size):
+        """
+        Return the URL of the on-demand annotated image, or of the file
+        annotated at upload time for older images.
+        """
         request = self.context.get('request')
-        if obj.operated_image and request:
+        if not request:
+            return None
+        if obj.operated_image:
             return request.build_absolute_uri(obj.operated_image.url)
-        return None
 
-class OperationSerializer(serializers.ModelSerializer):
+        results = obj.results.all()
+        if not results:
+            return None
+        # The newest result id versions the URL so clients can cache it forever
+        version = max(result.id for result in results)
+        url = reverse('annotated-image', args=[obj.id])
+        return request.build_absolute_uri(f"{url}?size={size}&v={version}")
+
+class OperationSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     images = serializers.ListField(
-        child=serializers.ImageField(),
+        child=DecodedImageField(),
         write_only=True
     )
     processed_results = serializers.SerializerMethodField(read_only=True)
+    # Sliced inference for high-resolution images, defaults come from settings
+    tiled = serializers.BooleanField(required=False, allow_null=True, default=None, write_only=True)
+    tile_size = serializers.IntegerField(required=False, min_value=128, max_value=4096, write_only=True)
+    tile_overlap = serializers.FloatField(required=False, min_value=0.0, max_value=0.5, write_only=True)
 
     class Meta:
         model = Operation
-        fields = ['id', 'images', 'processed_results']
+        fields = ['id', 'images', 'processed_results', 'tiled', 'tile_size', 'tile_overlap']
+        expandable_fields = ['processed_results']
 
     def validate(self, data):
         """
@@ -45,19 +157,24 @@ class OperationSerializer(serializers.ModelSerializer):
         
         self.context['longitude'] = float(longitude)
         self.context['latitude'] = float(latitude)
+
+        # Refuse images that sliced inference would cut into too many tiles
+        tiling = get_tiling_options({
+            'enabled': data.get('tiled'), 'tile_size': data.get('tile_size'), 'overlap': data.get('tile_overlap')
+        })
+        for image in data['images']:
+            try:
+                check_tile_count(*image.image_shape, tiling)
+            except ValueError as e:
+                raise serializers.ValidationError({'images': [str(e)]})
         return data
 
     def create(self, validated_data):
         images = validated_data.pop('images')
-        longitude = self.context.get('longitude')
-        latitude = self.context.get('latitude')
-
-        # Create the operation
-        operation = Operation.objects.create()
-
-        # Process images using the service
-        process_damage_detection(operation, images, longitude, latitude)
-
+        tiling = pop_tiling_options(validated_data)
+        operation, job = create_operation(images, self.context.get('longitude'), self.context.get('latitude'), tiling)
+        if job is not None:
+            self.context['detection_job'] = job
         return operation
 
     def get_processed_results(self, obj):
@@ -67,15 +184,170 @@ class OperationSerializer(serializers.ModelSerializer):
         images = obj.images.all()
         return OperationImageSerializer(images, many=True, context=self.context).data
 
-class ReportSerializer(serializers.ModelSerializer):
+class UploadFileSerializer(serializers.ModelSerializer):
+    complete = serializers.BooleanField(source='is_complete', read_only=True)
+
+    class Meta:
+        model = UploadFile
+        fields = ['index', 'name', 'size', 'received', 'complete']
+        read_only_fields = ['index', 'received']
+        extra_kwargs = {'size': {'min_value': 1}}
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    files = UploadFileSerializer(many=True)
+    chunk_size = serializers.SerializerMethodField()
+    # Applied to detection when the session is finalized, as for direct uploads
+    tiled = serializers.BooleanField(required=False, allow_null=True, default=None, write_only=True)
+    tile_size = serializers.IntegerField(required=False, min_value=128, max_value=4096, write_only=True)
+    tile_overlap = serializers.FloatField(required=False, min_value=0.0, max_value=0.5, write_only=True)
+
+    class Meta:
+        model = UploadSession
+        fields = [
+            'id', 'longitude', 'latitude', 'status', 'operation', 'files', 'chunk_size', 'created_at',
+            'tiled', 'tile_size', 'tile_overlap'
+        ]
+        read_only_fields = ['status', 'operation', 'created_at']
+
+    def get_chunk_size(self, obj):
+        return settings.UPLOAD_CHUNK_SIZE
+
+    def validate_files(self, value):
+        if not value:
+            raise serializers.ValidationError("At least one file is required.")
+        if len(value) > settings.UPLOAD_SESSION_MAX_FILES:
+            raise serializers.ValidationError(f"At most {settings.UPLOAD_SESSION_MAX_FILES} files can be uploaded at once.")
+        for file_data in value:
+            if file_data['size'] > settings.UPLOAD_MAX_FILE_SIZE:
+                raise serializers.ValidationError(f"{file_data['name']} is larger than {settings.UPLOAD_MAX_FILE_SIZE} bytes.")
+            # Clients may send paths, only the file name is stored
+            file_data['name'] = os.path.basename(file_data['name'].replace('\\', '/')) or 'image.jpg'
+            try:
+                validate_upload_name(file_data['name'])
+            except DjangoValidationError as e:
+                raise serializers.ValidationError(f"{file_data['name']}: {' '.join(e.messages)}")
+        return value
+
+    def create(self, validated_data):
+        files = validated_data.pop('files')
+        tiling = pop_tiling_options(validated_data)
+        session = UploadSession.objects.create(
+            user=self.context['request'].user,
+            options={'tiling': tiling} if tiling else {},
+            **validated_data
+        )
+        UploadFile.objects.bulk_create([
+            UploadFile(session=session, index=index, name=file_data['name'], size=file_data['size'])
+            for index, file_data in enumerate(files)
+        ])
+        return session
+
+class DamageSearchSerializer(serializers.Serializer):
+    """
+    Query parameters of the damage search: either a radius around a point or
+    a bbox of 'min_lon,min_lat,max_lon,max_lat', plus optional filters.
+    """
+    lat = serializers.FloatField(required=False, min_value=-90, max_value=90)
+    lon = serializers.FloatField(required=False, min_value=-180, max_value=180)
+    radius = serializers.FloatField(required=False, min_value=1, max_value=settings.DAMAGE_SEARCH_MAX_RADIUS)
+    bbox = serializers.CharField(required=False)
+    damage_type = serializers.ListField(child=serializers.CharField(), required=False)
+    class_id = serializers.ListField(child=serializers.IntegerField(min_value=0), required=False)
+    status = serializers.ListField(
+        child=serializers.ChoiceField(choices=Report.REPORT_STATUS_CHOICES), required=False
+    )
+    min_confidence = serializers.FloatField(required=False, min_value=0, max_value=1)
+    cursor = serializers.IntegerField(required=False, min_value=1)
+    page_size = serializers.IntegerField(required=False, min_value=1, max_value=500, default=100)
+
+    def to_internal_value(self, data):
+        # Lists may be repeated parameters or comma separated
+        data = {
+            key: [item for value in data.getlist(key) for item in value.split(',') if item]
+            if key in ('class_id', 'status') else
+            data.getlist(key) if key == 'damage_type' else data.get(key)
+            for key in data.keys()
+        }
+        return super().to_internal_value(data)
+
+    def validate_bbox(self, value):
+        try:
+            min_lon, min_lat, max_lon, max_lat = (float(part) for part in value.split(','))
+        except ValueError:
+            raise serializers.ValidationError("Use 'min_lon,min_lat,max_lon,max_lat'.")
+        if not (-180 <= min_lon <= max_lon <= 180 and -90 <= min_lat <= max_lat <= 90):
+            raise serializers.ValidationError("Invalid bounding box, boxes crossing the antimeridian are not supported.")
+        return min_lat, min_lon, max_lat, max_lon
+
+    def validate(self, data):
+        has_radius = all(key in data for key in ('lat', 'lon', 'radius'))
+        if has_radius == ('bbox' in data):
+            raise serializers.ValidationError("Provide either lat, lon and radius, or bbox.")
+        return data
+
+class ReportSeriesSerializer(serializers.Serializer):
+    """Query parameters of the report time series."""
+    MAX_PERIODS = 366
+
+    bucket = serializers.ChoiceField(choices=['day', 'week'], default='day')
+    dimension = serializers.ChoiceField(choices=['status', 'damage_type'], default='status')
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+
+    def validate(self, data):
+        days_per_period = 7 if data['bucket'] == 'week' else 1
+        data.setdefault('end', timezone.localdate())
+        # Default to the last 30 days or 12 weeks
+        data.setdefault('start', data['end'] - timedelta(days=days_per_period * (30 if days_per_period == 1 else 12) - 1))
+        if data['start'] > data['end']:
+            raise serializers.ValidationError("start must not be after end.")
+        if (data['end'] - data['start']).days // days_per_period >= self.MAX_PERIODS:
+            raise serializers.ValidationError(f"At most {self.MAX_PERIODS} periods can be requested at once.")
+        return data
+
+class DetectionJobSerializer(serializers.ModelSerializer):
+    job_id = serializers.IntegerField(source='id', read_only=True)
+    images = serializers.SerializerMethodField()
+
+    class Meta:
+        model = DetectionJob
+        fields = ['job_id', 'operation', 'status', 'attempts', 'created_at', 'started_at', 'finished_at', 'images']
+
+    def get_images(self, obj):
+        """
+        Return the detection status of each image in the job's operation.
+        """
+        return [
+            {'id': image.id, 'detection_status': image.detection_status}
+            for image in obj.operation.images.all()
+        ]
+
+class DefectSummarySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Defect
+        fields = ['id', 'damage_type', 'detection_count', 'report_count', 'last_seen_at']
+
+class DefectSerializer(serializers.ModelSerializer):
+    reports = serializers.PrimaryKeyRelatedField(many=True, read_only=True)
+
+    class Meta:
+        model = Defect
+        fields = [
+            'id', 'damage_type', 'class_id', 'latitude', 'longitude', 'detection_count', 'report_count',
+            'first_seen_at', 'last_seen_at', 'reports'
+        ]
+
+class ReportSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     operation = OperationSerializer(read_only=True)  # used for display
     operation_id = serializers.IntegerField(write_only=True)  # used for POST
     user_info = serializers.SerializerMethodField(read_only=True)  # Add user information
+    defects = DefectSummarySerializer(many=True, read_only=True)  # other reports of the same damage
 
     class Meta:
         model = Report
-        fields = ['id', 'description', 'status', 'operation', 'operation_id', 'user_info', 'date']
+        fields = ['id', 'description', 'status', 'operation', 'operation_id', 'user_info', 'date', 'defects']
         read_only_fields = ['user', 'date', 'status']
+        expandable_fields = ['operation', 'user_info', 'defects']
 
     def get_user_info(self, obj):
         """
@@ -97,4 +369,10 @@ class ReportSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         user = self.context['request'].user
         operation_id = validated_data.pop('operation_id')
-        return Report.objects.create(user=user, operation_id=operation_id, **validated_data)
+        with transaction.atomic():
+            report = Report.objects.create(user=user, operation_id=operation_id, **validated_data)
+            link_report_defects(report)
+            count_report(report)
+        # The reporter's map now shows this operation's damage
+        invalidate_operation_tiles([operation_id])
+        return report
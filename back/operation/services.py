@@ -1,148 +1,423 @@
-from .models import Operation, OperationImage, OperationResult
-from ultralytics import YOLO
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import transaction
+from .models import Operation, OperationImage, OperationResult, ShadowDetectionResult
+from .inference import compare_detections
+from .metrics import DETECTION_IMAGES, observe_stage
+from .pipeline import run_pipeline
+from .registry import get_shadow_detector
+from .tiling import get_tiling_options, get_detection_version, get_tiled_detector
+from .geo import encode_geohash
+from .map_tiles import invalidate_image_tiles
+from .defects import assign_defects
+from .stats import count_new_damage_types
+from .etags import touch_operation_reports
+from .dedup import compute_content_hash, fingerprint_image, find_cache_entry, get_cached_detections, record_cache_hits, store_cache_entry
+import numpy as np
 import cv2
-import os
+import random
+import time
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Constants
-MODEL_PATH = os.path.join(os.path.dirname(__file__), '..', 'runs', 'detect', 'train8', 'weights', 'best.pt')
-OUTPUT_DIR = os.path.join(os.path.dirname(__file__), '..', 'media', 'operation_images', 'output')
-
-class_names = {
-    0: "Longitudinal Crack (D00)",
-    1: "Transverse Crack (D10)",
-    2: "Alligator Crack (D20)",
-    3: "Pothole (D40)",
-    4: "Repaired Damage"
-}
-
-# Model cache for better performance
-_yolo_model = None
-
-def get_yolo_model():
-    """Get cached YOLO model instance."""
-    global _yolo_model
-    if _yolo_model is None:
-        _yolo_model = YOLO(MODEL_PATH)
-    return _yolo_model
-
 def create_operation_image(operation, image_file, longitude, latitude):
     """Create OperationImage database record."""
     return OperationImage.objects.create(
         operation=operation,
         original_image=image_file,
         longitude=longitude,
-        latitude=latitude
+        latitude=latitude,
+        geohash=encode_geohash(latitude, longitude)
+    )
+
+def build_operation_result(operation_image, detection_data):
+    """Build an unsaved OperationResult from a detection dict."""
+    x1, y1, x2, y2 = detection_data['bbox']
+    return OperationResult(
+        operation_image=operation_image,
+        damage_description=f"Confidence: {detection_data['confidence']:.2f}",
+        damage_type=detection_data['damage_type'],
+        class_id=detection_data['class_id'],
+        confidence=detection_data['confidence'],
+        bbox_x1=x1,
+        bbox_y1=y1,
+        bbox_x2=x2,
+        bbox_y2=y2,
+        model_version=detection_data.get('model_version') or ''
     )
 
-def process_yolo_detections(operation_image, results):
-    """Process YOLO detection results and save to database."""
-    detections = []
-    
-    for result in results:
-        if result.boxes is not None:
-            for box in result.boxes:
-                class_id = int(box.cls)
-                confidence = float(box.conf)
-                bbox = box.xyxy.cpu().numpy()[0]
-
-                # Map damage type and description
-                damage_type = class_names.get(class_id, "Unknown Damage Type")
-                description = f"Confidence: {confidence:.2f}"
-
-                # Save result to database
-                detection = OperationResult.objects.create(
-                    operation_image=operation_image,
-                    damage_description=description,
-                    damage_type=damage_type
-                )
-                
-                detections.append({
-                    'detection': detection,
-                    'bbox': bbox,
-                    'confidence': confidence,
-                    'damage_type': damage_type
-                })
-    
+def process_yolo_detections(operation_image, detections):
+    """Save detections of a single image to database in one INSERT."""
+    results = OperationResult.objects.bulk_create([
+        build_operation_result(operation_image, detection_data)
+        for detection_data in detections
+    ])
+    for detection_data, detection in zip(detections, results):
+        detection_data['detection'] = detection
+
     return detections
 
-def annotate_and_save_image(operation_image, result_img, detections):
-    """Annotate image with detections and save to file."""
+def decode_image_bytes(data, flags=cv2.IMREAD_COLOR):
+    """Decode encoded image bytes into a BGR array, or None if they are not an image."""
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flags)
+
+def read_upload(image_file):
+    """Read the bytes of an upload from its in-memory or temporary file buffer."""
+    if hasattr(image_file, 'temporary_file_path'):
+        data = np.fromfile(image_file.temporary_file_path(), dtype=np.uint8)
+    else:
+        image_file.seek(0)
+        data = np.frombuffer(image_file.read(), dtype=np.uint8)
+    image_file.seek(0)
+    return data
+
+def get_decoded_upload(image_file):
+    """
+    Return (bytes, image) of an upload, reusing the array decoded during
+    validation when there is one.
+    """
+    data = getattr(image_file, 'encoded_data', None)
+    if data is None:
+        data = read_upload(image_file)
+    image = getattr(image_file, 'decoded_image', None)
+    if image is None:
+        with observe_stage('decode'):
+            image = decode_image_bytes(data)
+        if image is None:
+            raise ValueError(f"Could not decode {image_file.name}")
+    return data, image
+
+def store_upload(image_file):
+    """Stream an upload's original bytes to storage and return the stored name."""
+    field = OperationImage._meta.get_field('original_image')
+    name = field.generate_filename(None, image_file.name)
+    with observe_stage('storage_write'):
+        return field.storage.save(name, image_file, max_length=field.max_length)
+
+def store_uploads(images):
+    """Write uploads to storage in parallel, returning their stored names in order."""
+    with ThreadPoolExecutor(max_workers=settings.UPLOAD_STORAGE_THREADS) as pool:
+        return list(pool.map(store_upload, images))
+
+def build_operation_images(operation, stored_names, longitude, latitude):
+    """Create OperationImage records for already stored files in one INSERT."""
+    geohash = encode_geohash(latitude, longitude)
+    return OperationImage.objects.bulk_create([
+        OperationImage(
+            operation=operation,
+            original_image=name,
+            longitude=longitude,
+            latitude=latitude,
+            geohash=geohash
+        )
+        for name in stored_names
+    ])
+
+def create_operation_images(operation, images, longitude, latitude):
+    """Store uploaded images for an operation, queued for detection."""
+    return build_operation_images(operation, store_uploads(images), longitude, latitude)
+
+def set_detection_status(operation_image, detection_status):
+    """Persist the detection status of a single image."""
+    operation_image.detection_status = detection_status
+    operation_image.save(update_fields=['detection_status'])
+    touch_operation_reports(operation_image.operation_id)
+    if detection_status in ('DONE', 'FAILED'):
+        DETECTION_IMAGES.labels(outcome=detection_status.lower()).inc()
+
+def load_image(operation_image):
+    """Read a stored image and decode it into a BGR array. Returns (bytes, image)."""
+    with observe_stage('storage_read'), operation_image.original_image.open('rb') as image_file:
+        data = image_file.read()
+    with observe_stage('decode'):
+        image = decode_image_bytes(data)
+    if image is None:
+        raise ValueError(f"Could not decode {operation_image.original_image.name}")
+    return data, image
+
+def iter_batches(items, batch_size):
+    """Split items into consecutive batches of at most batch_size."""
+    for start in range(0, len(items), batch_size):
+        yield items[start:start + batch_size]
+
+def save_image_results(operation_image, detections):
+    """
+    Persist the detections of a single image.
+    The annotated image is rendered on demand from these rows.
+    """
     try:
-        # Annotate image with all detections
-        for detection_data in detections:
-            bbox = detection_data['bbox']
-            confidence = detection_data['confidence']
-            damage_type = detection_data['damage_type']
-            
-            x1, y1, x2, y2 = map(int, bbox)
-            cv2.rectangle(result_img, (x1, y1), (x2, y2), (255, 0, 0), 2)
-            label = f"{damage_type} ({confidence:.2f})"
-            cv2.putText(
-                result_img,
-                label,
-                (x1, y1 - 10),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.5,
-                (255, 0, 0),
-                1,
-                lineType=cv2.LINE_AA
-            )
-
-        # Save the annotated image
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
-        output_image_path = os.path.join(OUTPUT_DIR, f"{operation_image.id}_labeled.jpg")
-        cv2.imwrite(output_image_path, result_img)
-
-        # Update the operated_image field
-        operation_image.operated_image = f"operation_images/output/{operation_image.id}_labeled.jpg"
-        operation_image.save()
-        
+        with observe_stage('persistence'), transaction.atomic():
+            # Process detections and save to database
+            detections = process_yolo_detections(operation_image, detections)
+            results = [detection_data['detection'] for detection_data in detections]
+            assign_defects(operation_image, results)
+            count_new_damage_types(operation_image, results)
+            set_detection_status(operation_image, 'DONE')
+        if detections:
+            invalidate_image_tiles([operation_image])
         return True
     except Exception as e:
-        logger.error(f"Error annotating image {operation_image.id}: {str(e)}")
+        logger.error(f"Error processing image {operation_image.id} for operation {operation_image.operation_id}: {str(e)}")
+        set_detection_status(operation_image, 'FAILED')
         return False
 
-def process_single_image(operation, image_file, longitude, latitude, model):
-    """Process a single image through the YOLO pipeline."""
+def lookup_cached_detections(data, image, model_version, hits):
+    """
+    Return (detections, fingerprint) for a decoded image, appending the id of
+    a hit entry to hits. Detections are None on a cache miss; the fingerprint
+    is None when caching is off.
+    """
+    if not settings.DETECTION_CACHE_ENABLED:
+        return None, None
+
+    with observe_stage('cache_lookup'):
+        fingerprint = fingerprint_image(data, image, model_version)
+        entry = find_cache_entry(fingerprint)
+    if entry is None:
+        return None, fingerprint
+
+    hits.append(entry.id)
+    exact_hit = entry.content_hash == fingerprint['content_hash']
+    logger.info(f"Detection cache {'hit' if exact_hit else 'near-duplicate hit'}")
+    return get_cached_detections(entry, image), fingerprint
+
+def detect_decoded_images(detector, decoded, model_version):
+    """
+    Detect damage in a batch of (bytes, image) pairs, reusing cached
+    detections and running the misses in one batched detector call.
+    Returns one list of detections per image.
+    """
+    detections_per_image = [None] * len(decoded)
+    pending = []
+    hits = []
+    for index, (data, image) in enumerate(decoded):
+        detections, fingerprint = lookup_cached_detections(data, image, model_version, hits)
+        if detections is None:
+            pending.append((index, image, fingerprint))
+        else:
+            detections_per_image[index] = detections
+    if hits:
+        record_cache_hits(hits)
+
+    if pending:
+        # One forward pass for the whole batch
+        results = detector.detect([image for _, image, _ in pending])
+        for (index, image, fingerprint), detections in zip(pending, results):
+            detections_per_image[index] = detections
+            # Skip caching detections of a model swapped in on the inference server meanwhile
+            if fingerprint is not None and all(
+                detection.get('model_version') in (None, detector.model_version) for detection in detections
+            ):
+                store_cache_entry(fingerprint, image, detections)
+
+    return detections_per_image
+
+def decode_image_batch(operation_images):
+    """
+    Decode a batch of stored images, marking unreadable ones as failed.
+    Returns the readable images and their (bytes, image) pairs.
+    """
+    loaded = []
+    decoded = []
+    for operation_image in operation_images:
+        try:
+            decoded.append(load_image(operation_image))
+            loaded.append(operation_image)
+        except Exception as e:
+            logger.error(f"Error decoding image {operation_image.id}: {str(e)}")
+            set_detection_status(operation_image, 'FAILED')
+    return loaded, decoded
+
+def detect_image_batch(loaded, decoded, detector, model_version):
+    """
+    Run a single batched detector call over decoded images.
+    Returns one list of detections per image, or None if inference failed.
+    """
+    if not decoded:
+        return []
     try:
-        # Create database record
-        operation_image = create_operation_image(operation, image_file, longitude, latitude)
-        
-        # Run YOLO inference
-        input_image_path = operation_image.original_image.path
-        results = model(input_image_path)
-        
-        # Process detections and save to database
-        detections = process_yolo_detections(operation_image, results)
-        
-        # Annotate and save image if there are detections
-        if detections and results:
-            annotate_and_save_image(operation_image, results[0].orig_img, detections)
-        
-        return True
+        return detect_decoded_images(detector, decoded, model_version)
     except Exception as e:
-        logger.error(f"Error processing image for operation {operation.id}: {str(e)}")
-        return False
+        logger.error(f"Error running batched inference on {len(decoded)} images: {str(e)}")
+        for operation_image in loaded:
+            set_detection_status(operation_image, 'FAILED')
+        return None
+
+def save_image_batch(loaded, detections_per_image):
+    """
+    Persist the detections of a batch of images.
+    Returns the number of images processed successfully.
+    """
+    if detections_per_image is None:
+        return 0
+
+    # Fan the results back out to their images
+    success_count = 0
+    for operation_image, detections in zip(loaded, detections_per_image):
+        if save_image_results(operation_image, detections):
+            success_count += 1
+    return success_count
+
+def run_shadow_batch(loaded, decoded, detections_per_image, shadow_detector, primary_model_version, fraction):
+    """
+    Run the shadow candidate on a sampled share of a batch and store how its
+    detections compare with the served ones. Errors are logged, never raised.
+    Returns the number of images compared.
+    """
+    if detections_per_image is None:
+        return 0
+    sampled = [index for index in range(len(loaded)) if random.random() < fraction]
+    if not sampled:
+        return 0
+
+    try:
+        start = time.perf_counter()
+        shadow_detections = shadow_detector.detect([decoded[index][1] for index in sampled])
+        inference_ms = (time.perf_counter() - start) * 1000 / len(sampled)
+
+        shadow_results = []
+        for index, candidate in zip(sampled, shadow_detections):
+            matched, missing, extra = compare_detections(detections_per_image[index], candidate)
+            shadow_results.append(ShadowDetectionResult(
+                operation_image=loaded[index],
+                model_version=shadow_detector.model_version,
+                primary_model_version=primary_model_version,
+                detections=candidate,
+                matched=len(matched),
+                missing=len(missing),
+                extra=len(extra),
+                mean_iou=sum(iou for _, _, iou in matched) / len(matched) if matched else None,
+                inference_ms=inference_ms
+            ))
+        ShadowDetectionResult.objects.bulk_create(shadow_results)
+        return len(shadow_results)
+    except Exception as e:
+        logger.error(f"Error running shadow model {shadow_detector.model_version}: {str(e)}")
+        return 0
+
+def process_operation_images(operation, operation_images, batch_size=None, tiling=None):
+    """
+    Run damage detection over stored images of an operation.
+    Batches flow through decode, inference and database stages running in
+    their own threads, so the stages of consecutive batches overlap. A shadow
+    candidate model, if registered, runs on a sample in a final stage.
+    tiling holds per-request overrides of the sliced-inference settings.
+    Returns the number of images processed successfully.
+    """
+    batch_size = batch_size or settings.DETECTION_BATCH_SIZE
+    tiling = get_tiling_options(tiling)
+
+    # Local model or shared inference server, sliced into tiles if enabled.
+    # The detector is kept for the whole job even if a new model is swapped in.
+    detector = get_tiled_detector(tiling)
+    model_version = get_detection_version(tiling, detector.model_version)
+    shadow = get_shadow_detector()
+
+    def decode(batch):
+        return decode_image_batch(batch)
+
+    def detect(decoded_batch):
+        loaded, decoded = decoded_batch
+        return loaded, decoded, detect_image_batch(loaded, decoded, detector, model_version)
+
+    def persist(detected_batch):
+        loaded, _, detections_per_image = detected_batch
+        success_count = save_image_batch(loaded, detections_per_image)
+        # Only keep the decoded images around for the shadow stage
+        return success_count, detected_batch if shadow else None
+
+    stages = [decode, detect, persist]
+    if shadow is not None:
+        shadow_detector = get_tiled_detector(tiling, shadow[0])
+
+        def compare(persisted_batch):
+            success_count, detected_batch = persisted_batch
+            run_shadow_batch(*detected_batch, shadow_detector, detector.model_version, shadow[1])
+            return success_count, None
+
+        stages.append(compare)
+
+    batches = iter_batches(list(operation_images), batch_size)
+    success_count = sum(count for count, _ in run_pipeline(batches, stages))
+
+    logger.info(f"Successfully processed {success_count}/{len(operation_images)} images for operation {operation.id}")
+    return success_count
+
+def apply_cached_detections(operation_images, images, tiling=None):
+    """
+    Complete images whose exact upload bytes hit the detection cache.
+    Near-duplicate lookups need the full-size image and are left to the worker.
+    Returns the images still needing inference.
+    """
+    if not settings.DETECTION_CACHE_ENABLED:
+        return list(operation_images)
+
+    model_version = get_detection_version(get_tiling_options(tiling))
+    remaining = []
+    hits = []
+    for operation_image, image_file in zip(operation_images, images):
+        data = getattr(image_file, 'encoded_data', None)
+        if data is None:
+            data = read_upload(image_file)
+        entry = find_cache_entry({
+            'content_hash': compute_content_hash(data),
+            'phash': None,
+            'model_version': model_version,
+        })
+
+        if entry is None or not save_image_results(operation_image, list(entry.detections)):
+            remaining.append(operation_image)
+        else:
+            hits.append(entry.id)
+            logger.info(f"Detection cache hit for image {operation_image.id} at upload")
+    if hits:
+        record_cache_hits(hits)
+    return remaining
+
+def process_uploaded_images(operation, images, longitude, latitude, batch_size=None, tiling=None):
+    """
+    Run detection inline on the arrays decoded during validation, while the
+    original bytes are written to storage in parallel.
+    Returns the created OperationImage records.
+    """
+    batch_size = batch_size or settings.DETECTION_BATCH_SIZE
+    tiling = get_tiling_options(tiling)
+    detector = get_tiled_detector(tiling)
+    model_version = get_detection_version(tiling, detector.model_version)
+
+    with ThreadPoolExecutor(max_workers=settings.UPLOAD_STORAGE_THREADS) as pool:
+        stored_names = [pool.submit(store_upload, image_file) for image_file in images]
+        try:
+            detections_per_image = []
+            for batch in iter_batches(list(images), batch_size):
+                decoded = [get_decoded_upload(image_file) for image_file in batch]
+                detections_per_image.extend(detect_decoded_images(detector, decoded, model_version))
+        except Exception as e:
+            logger.error(f"Error running inline detection for operation {operation.id}: {str(e)}")
+            detections_per_image = None
+        stored_names = [future.result() for future in stored_names]
+
+    operation_images = build_operation_images(operation, stored_names, longitude, latitude)
+    if detections_per_image is None:
+        for operation_image in operation_images:
+            set_detection_status(operation_image, 'FAILED')
+        return operation_images
+
+    success_count = 0
+    for operation_image, detections in zip(operation_images, detections_per_image):
+        if save_image_results(operation_image, detections):
+            success_count += 1
+
+    logger.info(f"Successfully processed {success_count}/{len(operation_images)} images for operation {operation.id}")
+    return operation_images
 
 def process_damage_detection(operation, images, longitude, latitude):
     """
     Process images for damage detection using YOLO model.
     """
     try:
-        # Get cached YOLO model
-        model = get_yolo_model()
-        
-        # Process each image
-        success_count = 0
-        for image_file in images:
-            if process_single_image(operation, image_file, longitude, latitude, model):
-                success_count += 1
-        
-        logger.info(f"Successfully processed {success_count}/{len(images)} images for operation {operation.id}")
-        
+        process_uploaded_images(operation, images, longitude, latitude)
     except Exception as e:
         logger.error(f"Error in damage detection process for operation {operation.id}: {str(e)}")
         # Continue without processing - the operation will still be created
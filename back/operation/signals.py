@@ -0,0 +1,12 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .etags import bump_report_generation
+from .models import Report
+
+
+@receiver(post_save, sender=Report)
+@receiver(post_delete, sender=Report)
+def report_changed(sender, **kwargs):
+    """Saved and deleted reports, cascades included, may enter or leave report lists."""
+    bump_report_generation()
@@ -0,0 +1,43 @@
+import math
+
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cast, Cos, Power, Radians, Sin, Sqrt
+
+from .geo import EARTH_RADIUS_M, get_covering_cells, get_radius_bbox
+
+
+def filter_in_bbox(queryset, min_lat, min_lon, max_lat, max_lon, prefix=''):
+    """
+    Keep rows located inside a bounding box. Geohash prefixes of the covering
+    cells narrow the scan to the index, the coordinates then trim the cell edges.
+    prefix is the lookup path to the OperationImage, e.g. 'operation_image__'.
+    """
+    cell_filter = Q()
+    for cell in get_covering_cells(min_lat, min_lon, max_lat, max_lon):
+        cell_filter |= Q(**{f'{prefix}geohash__startswith': cell})
+    return queryset.filter(
+        cell_filter,
+        **{
+            f'{prefix}latitude__range': (min_lat, max_lat),
+            f'{prefix}longitude__range': (min_lon, max_lon),
+        }
+    )
+
+def get_distance_expression(latitude, longitude, prefix=''):
+    """Haversine distance in meters from a point, computed by the database."""
+    row_lat = Radians(Cast(F(f'{prefix}latitude'), FloatField()))
+    row_lon = Radians(Cast(F(f'{prefix}longitude'), FloatField()))
+    lat = math.radians(latitude)
+    lon = math.radians(longitude)
+    a = (
+        Power(Sin((row_lat - Value(lat)) / Value(2.0)), 2)
+        + Value(math.cos(lat)) * Cos(row_lat) * Power(Sin((row_lon - Value(lon)) / Value(2.0)), 2)
+    )
+    return Value(2 * EARTH_RADIUS_M) * ASin(Sqrt(a))
+
+def filter_in_radius(queryset, latitude, longitude, radius_m, prefix=''):
+    """Keep rows within radius_m of a point, annotated with their `distance` in meters."""
+    queryset = filter_in_bbox(queryset, *get_radius_bbox(latitude, longitude, radius_m), prefix=prefix)
+    return queryset.annotate(
+        distance=get_distance_expression(latitude, longitude, prefix)
+    ).filter(distance__lte=radius_m)
@@ -0,0 +1,199 @@
+from collections import defaultdict
+from datetime import date, timedelta
+import logging
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from api.cache import get_or_compute, invalidate_on_commit
+from .models import OperationResult, Report, ReportCounter
+
+logger = logging.getLogger(__name__)
+
+# period_start of the all-time counters
+EPOCH = date(1970, 1, 1)
+STATUS_KEYS = [status for status, _ in Report.REPORT_STATUS_CHOICES]
+DASHBOARD_CACHE = 'dashboard-counts'
+
+
+def get_week_start(day):
+    return day - timedelta(days=day.weekday())
+
+def get_periods(day):
+    """(bucket, period_start) of every counter a report created on a day counts towards."""
+    return [('total', EPOCH), ('day', day), ('week', get_week_start(day))]
+
+def get_report_day(report):
+    return timezone.localdate(report.date)
+
+def apply_counter_changes(changes):
+    """
+    Add deltas to counters, creating missing ones. Counters are updated in
+    key order so concurrent transactions cannot deadlock on them. Cached
+    dashboard counts are invalidated once the transaction commits.
+    """
+    for (bucket, period_start, dimension, key), delta in sorted(changes.items()):
+        if not delta:
+            continue
+        counter = ReportCounter.objects.filter(bucket=bucket, period_start=period_start, dimension=dimension, key=key)
+        if counter.update(count=F('count') + delta):
+            continue
+        try:
+            with transaction.atomic():
+                ReportCounter.objects.create(
+                    bucket=bucket, period_start=period_start, dimension=dimension, key=key, count=delta
+                )
+        except IntegrityError:
+            # Created concurrently
+            counter.update(count=F('count') + delta)
+    if any(changes.values()):
+        invalidate_on_commit(DASHBOARD_CACHE)
+
+def add_changes(changes, day, dimension, keys, delta):
+    for bucket, period_start in get_periods(day):
+        for key in keys:
+            changes[(bucket, period_start, dimension, key)] += delta
+
+def get_report_damage_types(operation_id):
+    return set(
+        OperationResult.objects
+        .filter(operation_image__operation_id=operation_id)
+        .values_list('damage_type', flat=True)
+        .distinct()
+    )
+
+def count_report(report, delta=1):
+    """Add a report to the counters of its status and damage types, or remove it with delta=-1."""
+    day = get_report_day(report)
+    changes = defaultdict(int)
+    add_changes(changes, day, 'status', [report.status], delta)
+    add_changes(changes, day, 'damage_type', get_report_damage_types(report.operation_id), delta)
+    with transaction.atomic():
+        apply_counter_changes(changes)
+
+def count_status_change(report, old_status, new_status):
+    """Move a report from the counters of its old status to those of the new one."""
+    if old_status == new_status:
+        return
+    day = get_report_day(report)
+    changes = defaultdict(int)
+    add_changes(changes, day, 'status', [old_status], -1)
+    add_changes(changes, day, 'status', [new_status], 1)
+    with transaction.atomic():
+        apply_counter_changes(changes)
+
+def count_new_damage_types(operation_image, results):
+    """
+    Count damage types that new detections of an image add to the reports of
+    its operation, for reports submitted before detection finished.
+    """
+    reports = list(Report.objects.filter(operation_id=operation_image.operation_id).only('id', 'date'))
+    if not reports or not results:
+        return
+    known_types = set(
+        OperationResult.objects
+        .filter(operation_image__operation_id=operation_image.operation_id)
+        .exclude(id__in=[result.id for result in results])
+        .values_list('damage_type', flat=True)
+    )
+    new_types = {result.damage_type for result in results} - known_types
+    if not new_types:
+        return
+
+    changes = defaultdict(int)
+    for report in reports:
+        add_changes(changes, get_report_day(report), 'damage_type', new_types, 1)
+    with transaction.atomic():
+        apply_counter_changes(changes)
+
+def compute_report_counters():
+    """Recompute every counter from the reports, as {(bucket, period_start, dimension, key): count}."""
+    counters = defaultdict(int)
+    daily_statuses = (
+        Report.objects
+        .annotate(day=TruncDate('date'))
+        .values('day', 'status')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+    for row in daily_statuses:
+        add_changes(counters, row['day'], 'status', [row['status']], row['count'])
+
+    daily_damage_types = (
+        Report.objects
+        .annotate(day=TruncDate('date'), damage_type=F('operation__images__results__damage_type'))
+        .exclude(damage_type=None)
+        .values('day', 'damage_type')
+        .annotate(count=Count('id', distinct=True))
+        .order_by()
+    )
+    for row in daily_damage_types:
+        add_changes(counters, row['day'], 'damage_type', [row['damage_type']], row['count'])
+    return counters
+
+def reconcile_report_counters(fix=False):
+    """
+    Compare stored counters with a recomputation from scratch and return the
+    drifted ones as {key: (stored, expected)}. With fix, the counters are
+    rewritten while report counting waits on a table lock.
+    """
+    with transaction.atomic():
+        if fix and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(f'LOCK TABLE {ReportCounter._meta.db_table} IN EXCLUSIVE MODE')
+
+        expected = compute_report_counters()
+        stored = {
+            (counter.bucket, counter.period_start, counter.dimension, counter.key): counter.count
+            for counter in ReportCounter.objects.all()
+        }
+        drift = {
+            key: (stored.get(key, 0), expected.get(key, 0))
+            for key in set(stored) | set(expected)
+            if stored.get(key, 0) != expected.get(key, 0)
+        }
+
+        if fix and drift:
+            ReportCounter.objects.all().delete()
+            ReportCounter.objects.bulk_create([
+                ReportCounter(bucket=bucket, period_start=period_start, dimension=dimension, key=key, count=count)
+                for (bucket, period_start, dimension, key), count in expected.items()
+                if count
+            ])
+            invalidate_on_commit(DASHBOARD_CACHE)
+            logger.warning(f"Rewrote report counters, {len(drift)} had drifted")
+    return drift
+
+def read_dashboard_counts():
+    counts = dict(
+        ReportCounter.objects
+        .filter(bucket='total', period_start=EPOCH, dimension='status')
+        .values_list('key', 'count')
+    )
+    return {status: counts.get(status, 0) for status in STATUS_KEYS}
+
+def get_dashboard_counts():
+    """Report counts per status from the all-time counters, cached until a counter changes."""
+    return get_or_compute(DASHBOARD_CACHE, read_dashboard_counts, settings.DASHBOARD_STATS_CACHE_TTL)
+
+def get_report_series(bucket, dimension, start, end):
+    """Counters of each day or week between start and end, including empty periods."""
+    if bucket == 'week':
+        start, end = get_week_start(start), get_week_start(end)
+    step = timedelta(days=7 if bucket == 'week' else 1)
+
+    series = {}
+    period_start = start
+    while period_start <= end:
+        series[period_start] = {}
+        period_start += step
+
+    counters = ReportCounter.objects.filter(
+        bucket=bucket, dimension=dimension, period_start__range=(start, end)
+    ).exclude(count=0)
+    for counter in counters:
+        series[counter.period_start][counter.key] = counter.count
+    return [{'period_start': period_start, 'counts': counts} for period_start, counts in series.items()]
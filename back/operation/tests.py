@@ -1,3 +1,760 @@
-from django.test import TestCase
+import io
+import json
+import random
+import shutil
+import tempfile
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+import cv2
+import numpy as np
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase
+
+from api.renderers import ORJSONRenderer
+from user.models import User
+from .dedup import evict_cache_entries
+from .defects import link_reports
+from .geo import encode_geohash
+from .jobs import claim_next_job, enqueue_detection_job, run_job
+from .models import (
+    Defect, DetectionCacheEntry, DetectionJob, Operation, OperationImage, OperationResult, Report, ReportCounter,
+    UploadSession
+)
+from .pipeline import run_pipeline
+from .serializers import ReportSerializer
+from .services import detect_decoded_images
+from .stats import EPOCH, compute_report_counters, reconcile_report_counters
+from .tiling import TiledDetector, check_tile_count, count_tiles, merge_detections, slice_image
+from .views import get_optimized_queryset
+
+
+def load_ordered(content):
+    """Parse JSON keeping key order, so comparisons catch reordered fields."""
+    return json.loads(content, object_pairs_hook=list)
+
+
+class ReportFastPathGoldenTests(APITestCase):
+    """The values() read path renders exactly what ReportSerializer does."""
+
+    def setUp(self):
+        self.worker = User.objects.create_user(
+            username='worker', email='worker@example.com', password='password123', is_worker=True
+        )
+        self.citizen = User.objects.create_user(
+            username='citizen', email='citizen@example.com', password='password123', phone_number='0555 12 34 56'
+        )
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='password123')
+
+        detected = self.create_report(self.citizen, 'Pothole near the school ')
+        first_image = self.create_image(detected.operation, '36.7525000001', '3.0420000000')
+        self.create_result(first_image, confidence=0.87654321, bbox=(10.5, 20.25, 300.0, 400.125))
+        self.create_result(first_image, confidence=None, bbox=None, class_id=None)
+        self.create_image(detected.operation, '-33.8688000000', '151.2093000000', status='QUEUED')
+        legacy_image = self.create_image(detected.operation, '0.0000000000', '-0.5000000000')
+        legacy_image.operated_image = 'operation_images/operated/legacy image é.jpg'
+        legacy_image.save()
+        self.create_result(legacy_image, confidence=0.5, bbox=(1, 2, 3, 4))
+
+        defect = Defect.objects.create(
+            damage_type='Pothole (D40)', class_id=3, latitude='36.7525000001', longitude='3.0420000000',
+            geohash='sn8r', detection_count=2,
+            last_seen_at=datetime(2026, 1, 2, 3, 4, 5, 123456, tzinfo=dt_timezone.utc),
+        )
+        link_reports([detected.id], [defect.id])
+
+        empty = self.create_report(self.other, None)
+        Report.objects.filter(id=empty.id).update(status='COMPLETED')
+        self.create_report(self.citizen, 'Crack')
+
+    def create_report(self, user, description):
+        return Report.objects.create(operation=Operation.objects.create(), user=user, description=description)
+
+    def create_image(self, operation, latitude, longitude, status='DONE'):
+        return OperationImage.objects.create(
+            operation=operation,
+            original_image=f'operation_images/original/{operation.id} photo.jpg',
+            latitude=Decimal(latitude),
+            longitude=Decimal(longitude),
+            detection_status=status,
+        )
+
+    def create_result(self, operation_image, confidence, bbox, class_id=3):
+        x1, y1, x2, y2 = bbox or (None, None, None, None)
+        return OperationResult.objects.create(
+            operation_image=operation_image,
+            damage_description='Type: Pothole (D40)',
+            damage_type='Pothole (D40)',
+            class_id=class_id,
+            confidence=confidence,
+            bbox_x1=x1, bbox_y1=y1, bbox_x2=x2, bbox_y2=y2,
+            model_version='yolov8-rdd:7',
+        )
+
+    def render_legacy(self, response, reports, **selection):
+        serializer = ReportSerializer(
+            get_optimized_queryset(reports), many=True, context={'request': response.wsgi_request}, **selection
+        )
+        return load_ordered(JSONRenderer().render(serializer.data))
+
+    def assert_list_matches(self, user, url, key, reports, params=None, **selection):
+        self.client.force_authenticate(user)
+        response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(dict(load_ordered(response.content))[key], self.render_legacy(response, reports, **selection))
+
+    def test_report_list_matches_serializer(self):
+        reports = Report.objects.order_by('-date', '-id')
+        self.assert_list_matches(self.worker, '/api/reports/', 'results', reports, {'pagination': 'cursor'})
+        self.assert_list_matches(
+            self.citizen, '/api/reports/', 'results', reports.filter(user=self.citizen), {'pagination': 'cursor'}
+        )
+
+    def test_user_reports_match_serializer(self):
+        self.assert_list_matches(
+            self.citizen, reverse('user-reports'), 'data', Report.objects.filter(user=self.citizen).order_by('-date', '-id')
+        )
+
+    def test_field_selection_matches_serializer(self):
+        reports = Report.objects.order_by('-date', '-id')
+        for selection in ({'fields': ['id', 'status', 'date']}, {'expand': []}, {'fields': ['id'], 'expand': ['defects']},
+                          {'fields': ['operation', 'user_info']}):
+            params = {'pagination': 'cursor', **{name: ','.join(value) for name, value in selection.items()}}
+            self.assert_list_matches(self.worker, '/api/reports/', 'results', reports, params, **selection)
+
+    def test_report_detail_matches_serializer(self):
+        self.client.force_authenticate(self.worker)
+        for report in Report.objects.all():
+            response = self.client.get(f'/api/reports/{report.id}/')
+            self.assertEqual(response.status_code, 200)
+            legacy = self.render_legacy(response, Report.objects.filter(id=report.id))
+            self.assertEqual(load_ordered(response.content), legacy[0])
+
+        self.client.force_authenticate(self.other)
+        response = self.client.get(f'/api/reports/{Report.objects.filter(user=self.citizen).first().id}/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_orjson_renderer_matches_json_renderer(self):
+        data = {
+            'text': 'Route nationale\u2028n°5\u2029 – 道路',
+            'lazy': gettext_lazy('Pending'),
+            'decimal': Decimal('3.0420000000'),
+            'datetime': datetime(2026, 1, 2, 3, 4, 5, 123456, tzinfo=dt_timezone.utc),
+            'date': datetime(2026, 1, 2).date(),
+            'numbers': [0, -1, 0.1, 0.87654321, 0.0005, 12345678.5, True, None],
+            'nested': {'empty': [], 'object': {}},
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(ORJSONRenderer().render(None), b'')
+
+
+class DetectionJobTests(TestCase):
+    def create_job(self, images=2):
+        operation = Operation.objects.create()
+        for _ in range(images):
+            OperationImage.objects.create(
+                operation=operation,
+                original_image='operation_images/original/test.jpg',
+                longitude=3.05,
+                latitude=36.75,
+                detection_status='QUEUED',
+            )
+        return enqueue_detection_job(operation)
+
+    def make_stale(self, job):
+        DetectionJob.objects.filter(id=job.id).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+
+    def statuses(self, job):
+        return set(job.operation.images.values_list('detection_status', flat=True))
+
+    def test_claims_oldest_queued_job(self):
+        first, second = self.create_job(), self.create_job()
+
+        claimed = claim_next_job()
+        self.assertEqual(claimed.id, first.id)
+        self.assertEqual((claimed.status, claimed.attempts), ('RUNNING', 1))
+        self.assertEqual(self.statuses(claimed), {'RUNNING'})
+
+        # A running job with a fresh heartbeat belongs to its worker
+        self.assertEqual(claim_next_job().id, second.id)
+        self.assertIsNone(claim_next_job())
+
+    def test_reclaims_stale_job(self):
+        job = self.create_job()
+        claim_next_job()
+        self.make_stale(job)
+
+        claimed = claim_next_job(max_attempts=3)
+        self.assertEqual((claimed.id, claimed.attempts), (job.id, 2))
+
+    def test_fails_stale_job_without_attempts_left(self):
+        job = self.create_job()
+        claim_next_job()
+        self.make_stale(job)
+
+        self.assertIsNone(claim_next_job(max_attempts=1))
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'FAILED')
+        self.assertEqual(self.statuses(job), {'FAILED'})
+
+    def test_retries_until_max_attempts(self):
+        job = self.create_job()
+        with mock.patch('operation.jobs.process_operation_images', side_effect=RuntimeError('inference down')):
+            job = run_job(claim_next_job(), max_attempts=2)
+            self.assertEqual((job.status, job.error), ('QUEUED', 'inference down'))
+            self.assertEqual(self.statuses(job), {'QUEUED'})
+            self.assertIsNone(job.finished_at)
+
+            job = run_job(claim_next_job(), max_attempts=2)
+        self.assertEqual((job.status, job.attempts), ('FAILED', 2))
+        self.assertEqual(self.statuses(job), {'FAILED'})
+        self.assertIsNotNone(job.finished_at)
+
+    def test_fails_job_when_no_image_is_done(self):
+        def fail_images(operation, operation_images, tiling=None):
+            operation.images.update(detection_status='FAILED')
+
+        job = self.create_job()
+        with mock.patch('operation.jobs.process_operation_images', side_effect=fail_images):
+            job = run_job(claim_next_job())
+        self.assertEqual((job.status, job.attempts), ('FAILED', 1))
+
+    def test_partial_failure_completes_job(self):
+        def fail_one_image(operation, operation_images, tiling=None):
+            operation.images.update(detection_status='DONE')
+            operation.images.filter(id=operation_images[0].id).update(detection_status='FAILED')
+
+        job = self.create_job()
+        with mock.patch('operation.jobs.process_operation_images', side_effect=fail_one_image):
+            job = run_job(claim_next_job())
+        self.assertEqual(job.status, 'DONE')
+        self.assertEqual(job.error, 'Detection failed on 1 of 2 images')
+
+
+class FakeDetector:
+    """Detector finding one pothole in every image, counting its calls."""
+    model_version = 'test:1'
+
+    def __init__(self):
+        self.calls = []
+
+    def detect(self, images):
+        self.calls.append(len(images))
+        return [
+            [{'class_id': 3, 'confidence': 0.9, 'bbox': [10.0, 20.0, 110.0, 120.0], 'damage_type': 'Pothole (D40)'}]
+            for _ in images
+        ]
+
+
+def make_image(seed=0, width=640, height=480):
+    """A BGR test picture with a few shapes, different for each seed."""
+    image = np.zeros((480, 640, 3), dtype=np.uint8)
+    image[:] = (40 + seed * 10, 90, 140)
+    cv2.rectangle(image, (100 + seed * 30, 100), (300, 200), (50, 50, 200), -1)
+    cv2.circle(image, (450, 320 - seed * 20), 90, (90, 200, 20), -1)
+    return cv2.resize(image, (width, height))
+
+def encode_image(image, quality=90):
+    """JPEG bytes of an image and the image decoded back from them."""
+    _, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    data = encoded.tobytes()
+    return data, cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+class DetectionCacheTests(TestCase):
+    def setUp(self):
+        self.detector = FakeDetector()
+
+    def detect(self, *decoded):
+        return detect_decoded_images(self.detector, list(decoded), self.detector.model_version)
+
+    def test_exact_duplicate_hits_cache(self):
+        upload = encode_image(make_image())
+        [first] = self.detect(upload)
+        second, third = self.detect(upload, upload)
+
+        self.assertEqual(self.detector.calls, [1])
+        self.assertEqual(second, first)
+        self.assertEqual(third, first)
+        self.assertEqual(DetectionCacheEntry.objects.get().hit_count, 2)
+
+    def test_other_image_misses_cache(self):
+        self.detect(encode_image(make_image(seed=0)))
+        self.detect(encode_image(make_image(seed=3)))
+
+        self.assertEqual(self.detector.calls, [1, 1])
+        self.assertEqual(DetectionCacheEntry.objects.count(), 2)
+
+    @override_settings(DETECTION_CACHE_PHASH_ENABLED=True)
+    def test_near_duplicate_hits_cache_rescaled(self):
+        self.detect(encode_image(make_image()))
+        [detections] = self.detect(encode_image(make_image(width=1280, height=960), quality=70))
+
+        self.assertEqual(self.detector.calls, [1])
+        self.assertEqual(detections[0]['bbox'], [20.0, 40.0, 220.0, 240.0])
+        self.assertEqual(DetectionCacheEntry.objects.get().hit_count, 1)
+
+    def test_near_duplicate_misses_without_perceptual_hash(self):
+        self.detect(encode_image(make_image()))
+        self.detect(encode_image(make_image(), quality=70))
+
+        self.assertEqual(self.detector.calls, [1, 1])
+
+    def test_evicts_least_recently_used_entries(self):
+        uploads = [encode_image(make_image(seed=seed)) for seed in range(5)]
+        for upload in uploads:
+            self.detect(upload)
+        now = timezone.now()
+        for age, entry in enumerate(DetectionCacheEntry.objects.order_by('-id')):
+            DetectionCacheEntry.objects.filter(id=entry.id).update(last_used_at=now - timedelta(minutes=age))
+        # Using the oldest entry keeps it
+        self.detect(uploads[0])
+
+        self.assertEqual(evict_cache_entries(max_entries=2), 3)
+        self.assertEqual(evict_cache_entries(max_entries=2), 0)
+        self.detect(uploads[0], uploads[4])
+        self.assertEqual(self.detector.calls, [1] * 5)
+
+
+class TilingTests(APITestCase):
+    def detection(self, bbox, confidence=0.9, class_id=3):
+        return {'class_id': class_id, 'confidence': confidence, 'bbox': bbox}
+
+    def test_tiles_cover_image(self):
+        image = np.zeros((600, 1000, 3), dtype=np.uint8)
+        tiles = slice_image(image, 640, 0.2)
+
+        self.assertEqual([(x, y) for x, y, _ in tiles], [(0, 0), (360, 0)])
+        self.assertEqual([tile.shape[:2] for _, _, tile in tiles], [(600, 640), (600, 640)])
+        self.assertEqual(count_tiles(600, 1000, 640, 0.2), len(tiles))
+
+    def test_merge_suppresses_overlapping_boxes_of_same_class(self):
+        kept = merge_detections([
+            self.detection([0, 0, 100, 100], confidence=0.6),
+            self.detection([5, 5, 100, 100], confidence=0.8),
+            self.detection([5, 5, 100, 100], confidence=0.7, class_id=0),
+            # Small damage inside a larger box overlaps it too little to be suppressed
+            self.detection([10, 10, 30, 30], confidence=0.5),
+        ], threshold=0.5)
+
+        self.assertEqual([(d['class_id'], d['confidence']) for d in kept], [(3, 0.8), (0, 0.7), (3, 0.5)])
+
+    def test_detects_on_tiles_and_full_frame(self):
+        detector = FakeDetector()
+        detector.detect = mock.Mock(side_effect=lambda images: [[self.detection([0.0, 0.0, 50.0, 50.0])] for _ in images])
+        tiled = TiledDetector(detector, tile_size=640, overlap=0.2)
+
+        [large, small] = tiled.detect([np.zeros((600, 1000, 3), dtype=np.uint8), np.zeros((300, 400, 3), dtype=np.uint8)])
+
+        # The full frame and the first tile find the same box, the second tile is shifted back
+        self.assertEqual([d['bbox'] for d in large], [[0.0, 0.0, 50.0, 50.0], [360.0, 0.0, 410.0, 50.0]])
+        self.assertEqual([d['bbox'] for d in small], [[0.0, 0.0, 50.0, 50.0]])
+        [(inputs,), _] = detector.detect.call_args
+        self.assertEqual(len(inputs), 4)
+
+    @override_settings(DETECTION_TILE_MAX_TILES=4)
+    def test_limits_tiles_per_image(self):
+        tiling = {'enabled': True, 'tile_size': 640, 'overlap': 0.2}
+        check_tile_count(1000, 1000, tiling)
+        with self.assertRaises(ValueError):
+            check_tile_count(1000, 2000, tiling)
+        check_tile_count(1000, 2000, {**tiling, 'enabled': False})
+
+    @override_settings(DETECTION_TILE_MAX_TILES=4)
+    def test_rejects_uploads_cut_into_too_many_tiles(self):
+        self.client.force_authenticate(User.objects.create_user(
+            username='citizen', email='citizen@example.com', password='password123'
+        ))
+        data, _ = encode_image(make_image(width=1280, height=960))
+        for options in ({'tiled': True, 'tile_size': 128}, {'tiled': True, 'tile_overlap': 0.9}):
+            response = self.client.post('/api/operations/', {
+                'images': [SimpleUploadedFile('road.jpg', data, 'image/jpeg')],
+                'longitude': '3.05',
+                'latitude': '36.75',
+                **options,
+            }, format='multipart')
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Operation.objects.exists())
+
+
+class PipelineTests(TransactionTestCase):
+    def test_runs_items_through_stages_in_order(self):
+        def double(item):
+            return item * 2
+
+        def describe(item):
+            return f'item {item}'
+
+        self.assertEqual(run_pipeline(range(5), [double, describe], queue_size=1), [f'item {n * 2}' for n in range(5)])
+
+    def test_reraises_stage_error(self):
+        seen = []
+
+        def record(item):
+            seen.append(item)
+            return item
+
+        def fail(item):
+            if item == 3:
+                raise ValueError('bad batch')
+            return item
+
+        # The feeder and the first stage stop instead of blocking on full queues
+        with self.assertRaisesMessage(ValueError, 'bad batch'):
+            run_pipeline(range(1000), [record, fail, record], queue_size=1)
+        self.assertLess(len(seen), 1000)
+
+    def test_failed_stage_fails_detection_job(self):
+        operation = Operation.objects.create()
+        OperationImage.objects.create(
+            operation=operation,
+            original_image='operation_images/original/test.jpg',
+            longitude=3.05,
+            latitude=36.75,
+        )
+        job = enqueue_detection_job(operation)
+
+        with mock.patch('operation.services.get_tiled_detector', return_value=FakeDetector()), \
+                mock.patch('operation.services.get_shadow_detector', return_value=None), \
+                mock.patch('operation.services.save_image_batch', side_effect=RuntimeError('database is gone')):
+            job = run_job(claim_next_job(), max_attempts=1)
+
+        self.assertEqual((job.status, job.error), ('FAILED', 'database is gone'))
+        self.assertEqual(operation.images.get().detection_status, 'FAILED')
+
+
+class UploadSessionTests(APITestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root, UPLOAD_SESSION_DIR=f'{media_root}/upload_sessions', DETECTION_ASYNC=True
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.client.force_authenticate(User.objects.create_user(
+            username='citizen', email='citizen@example.com', password='password123'
+        ))
+        self.data, _ = encode_image(make_image())
+        response = self.client.post('/api/uploads/', {
+            'longitude': '3.05',
+            'latitude': '36.75',
+            'files': [{'name': 'road.jpg', 'size': len(self.data)}],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.session_id = response.data['data']['id']
+
+    def put_chunk(self, start, end):
+        return self.client.put(
+            f'/api/uploads/{self.session_id}/files/0/',
+            self.data[start:end],
+            content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {start}-{end - 1}/{len(self.data)}',
+        )
+
+    def finalize(self):
+        return self.client.post(f'/api/uploads/{self.session_id}/finalize/')
+
+    def test_rejects_chunk_leaving_gap(self):
+        self.assertEqual(self.put_chunk(0, 100).data['data']['received'], 100)
+
+        response = self.put_chunk(200, 300)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['errors']['received'], 100)
+
+    def test_resumes_from_received_offset(self):
+        self.put_chunk(0, 100)
+        response = self.client.get(f'/api/uploads/{self.session_id}/')
+        self.assertEqual(response.data['data']['files'][0]['received'], 100)
+
+        # Chunks may repeat bytes already received
+        response = self.put_chunk(50, len(self.data))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['data']['complete'])
+
+        self.assertEqual(self.finalize().status_code, 202)
+        with Operation.objects.get().images.get().original_image.open('rb') as image_file:
+            self.assertEqual(image_file.read(), self.data)
+
+    def test_refuses_to_finalize_incomplete_session(self):
+        self.put_chunk(0, 100)
+
+        self.assertEqual(self.finalize().status_code, 400)
+        self.assertEqual(UploadSession.objects.get().status, 'OPEN')
+        self.assertFalse(Operation.objects.exists())
+
+    def test_finalize_is_idempotent(self):
+        self.put_chunk(0, len(self.data))
+        first = self.finalize()
+        second = self.finalize()
+
+        self.assertEqual((first.status_code, second.status_code), (202, 202))
+        self.assertEqual(second.data['id'], first.data['id'])
+        self.assertEqual(second.data['job_id'], first.data['job_id'])
+        self.assertEqual(Operation.objects.count(), 1)
+        self.assertEqual(self.put_chunk(0, 100).status_code, 409)
+
+
+class DamageSearchTests(APITestCase):
+    CENTER = (36.7525, 3.0420)
+
+    def setUp(self):
+        self.worker = User.objects.create_user(
+            username='worker', email='worker@example.com', password='password123', is_worker=True
+        )
+        self.citizen = User.objects.create_user(username='citizen', email='citizen@example.com', password='password123')
+        self.other = User.objects.create_user(username='other', email='other@example.com', password='password123')
+
+        self.center = self.create_damage(*self.CENTER)
+        self.north_500m = self.create_damage(36.7570, 3.0420)
+        self.north_5km = self.create_damage(36.7975, 3.0420)
+        self.oran = self.create_damage(35.6971, -0.6308)
+        self.other_center = self.create_damage(*self.CENTER, user=self.other)
+
+    def create_damage(self, latitude, longitude, user=None):
+        operation = Operation.objects.create()
+        operation_image = OperationImage.objects.create(
+            operation=operation,
+            original_image='operation_images/original/test.jpg',
+            latitude=Decimal(str(latitude)),
+            longitude=Decimal(str(longitude)),
+            geohash=encode_geohash(latitude, longitude),
+            detection_status='DONE',
+        )
+        Report.objects.create(operation=operation, user=user or self.citizen)
+        return OperationResult.objects.create(
+            operation_image=operation_image,
+            damage_description='Type: Pothole (D40)',
+            damage_type='Pothole (D40)',
+            class_id=3,
+            confidence=0.9,
+            bbox_x1=1, bbox_y1=2, bbox_x2=3, bbox_y2=4,
+        )
+
+    def search(self, user, **params):
+        self.client.force_authenticate(user)
+        response = self.client.get('/api/damage/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.data['data']
+
+    def test_radius_search(self):
+        lat, lon = self.CENTER
+        data = self.search(self.worker, lat=lat, lon=lon, radius=1000)
+
+        self.assertEqual([row['id'] for row in data['results']], [self.other_center.id, self.north_500m.id, self.center.id])
+        self.assertEqual([row['distance'] for row in data['results']], [0.0, 500.4, 0.0])
+
+    def test_bbox_search(self):
+        data = self.search(self.worker, bbox='3.0,36.7,3.1,36.8')
+
+        self.assertEqual(
+            [row['id'] for row in data['results']],
+            [self.other_center.id, self.north_5km.id, self.north_500m.id, self.center.id]
+        )
+        self.assertNotIn('distance', data['results'][0])
+
+    def test_citizens_only_find_their_damage(self):
+        lat, lon = self.CENTER
+        data = self.search(self.citizen, lat=lat, lon=lon, radius=10000)
+
+        self.assertEqual([row['id'] for row in data['results']], [self.north_5km.id, self.north_500m.id, self.center.id])
+
+    def test_pages_follow_cursor(self):
+        seen = []
+        params = {'bbox': '-1,35,4,37', 'page_size': 2}
+        while True:
+            data = self.search(self.worker, **params)
+            seen.extend(row['id'] for row in data['results'])
+            if data['next_cursor'] is None:
+                break
+            params['cursor'] = data['next_cursor']
+
+        self.assertEqual(seen, list(OperationResult.objects.order_by('-id').values_list('id', flat=True)))
+
+    def test_migration_encoder_matches_live_encoder(self):
+        migration = import_module('operation.migrations.0010_image_geohash')
+        generator = random.Random(0)
+        for _ in range(500):
+            latitude, longitude = generator.uniform(-90, 90), generator.uniform(-180, 180)
+            self.assertEqual(migration.encode_geohash(latitude, longitude), encode_geohash(latitude, longitude))
+
+
+class ReportCounterTests(APITestCase):
+    def setUp(self):
+        self.worker = User.objects.create_user(
+            username='worker', email='worker@example.com', password='password123', is_worker=True
+        )
+        self.citizen = User.objects.create_user(username='citizen', email='citizen@example.com', password='password123')
+
+    def create_operation(self, damage_types):
+        operation = Operation.objects.create()
+        operation_image = OperationImage.objects.create(
+            operation=operation,
+            original_image='operation_images/original/test.jpg',
+            longitude=3.05,
+            latitude=36.75,
+            detection_status='DONE',
+        )
+        for damage_type in damage_types:
+            OperationResult.objects.create(
+                operation_image=operation_image,
+                damage_description=f'Type: {damage_type}',
+                damage_type=damage_type,
+                class_id=3,
+                confidence=0.9,
+            )
+        return operation
+
+    def submit(self, damage_types):
+        self.client.force_authenticate(self.citizen)
+        response = self.client.post(
+            '/api/reports/submit/', {'operation_id': self.create_operation(damage_types).id}, format='json'
+        )
+        self.assertEqual(response.status_code, 201)
+        return response.data['data']['id']
+
+    def get_stats(self):
+        self.client.force_authenticate(self.worker)
+        return self.client.get('/api/reports/stats/').data['data']
+
+    def get_total(self, dimension):
+        return dict(
+            ReportCounter.objects
+            .filter(bucket='total', period_start=EPOCH, dimension=dimension)
+            .exclude(count=0)
+            .values_list('key', 'count')
+        )
+
+    def assert_counters_match_reports(self):
+        stored = {
+            (counter.bucket, counter.period_start, counter.dimension, counter.key): counter.count
+            for counter in ReportCounter.objects.exclude(count=0)
+        }
+        self.assertEqual(stored, dict(compute_report_counters()))
+
+    def test_submit_counts_status_and_damage_types(self):
+        self.submit(['Pothole (D40)', 'Pothole (D40)', 'Alligator Crack (D20)'])
+        self.submit(['Pothole (D40)'])
+
+        self.assertEqual(self.get_stats()['total_reports'], 2)
+        self.assertEqual(self.get_stats()['received'], 2)
+        self.assertEqual(self.get_total('damage_type'), {'Pothole (D40)': 2, 'Alligator Crack (D20)': 1})
+        self.assert_counters_match_reports()
+
+    def test_status_change_moves_count(self):
+        report_id = self.submit(['Pothole (D40)'])
+
+        self.client.force_authenticate(self.worker)
+        for new_status in ('IN_PROGRESS', 'IN_PROGRESS', 'COMPLETED'):
+            response = self.client.patch(f'/api/reports/{report_id}/status/', {'status': new_status}, format='json')
+            self.assertEqual(response.status_code, 200)
+
+        stats = self.get_stats()
+        self.assertEqual((stats['total_reports'], stats['received'], stats['completed']), (1, 0, 1))
+        self.assert_counters_match_reports()
+
+    def test_delete_uncounts_report(self):
+        self.submit(['Pothole (D40)'])
+        report_id = self.submit(['Alligator Crack (D20)'])
+
+        self.client.force_authenticate(self.worker)
+        self.assertEqual(self.client.delete(f'/api/reports/{report_id}/').status_code, 204)
+
+        self.assertEqual(self.get_stats()['total_reports'], 1)
+        self.assertEqual(self.get_total('damage_type'), {'Pothole (D40)': 1})
+        self.assert_counters_match_reports()
+
+    def test_reconcile_fixes_drift(self):
+        self.submit(['Pothole (D40)'])
+        ReportCounter.objects.filter(bucket='day', dimension='status').update(count=5)
+        ReportCounter.objects.filter(dimension='damage_type').delete()
+
+        drift = reconcile_report_counters()
+        self.assertEqual(len(drift), 4)
+        self.assertEqual({stored for stored, _ in drift.values()}, {0, 5})
+        with self.assertRaises(CommandError):
+            call_command('reconcile_report_stats', '--fail-on-drift', stdout=io.StringIO())
+
+        self.assertEqual(reconcile_report_counters(fix=True), drift)
+        self.assertEqual(reconcile_report_counters(), {})
+        self.assert_counters_match_reports()
+
+
+class ReportETagTests(APITestCase):
+    def setUp(self):
+        self.worker = User.objects.create_user(
+            username='worker', email='worker@example.com', password='password123', is_worker=True
+        )
+        self.citizen = User.objects.create_user(username='citizen', email='citizen@example.com', password='password123')
+        self.oldest, self.report, self.newest = (
+            Report.objects.create(operation=Operation.objects.create(), user=self.citizen) for _ in range(3)
+        )
+
+    def get(self, url, user=None, etag=None):
+        self.client.force_authenticate(user or self.worker)
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(url, **headers)
+
+    def get_etag(self, url, user=None):
+        response = self.get(url, user)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def test_unchanged_list_is_not_modified(self):
+        etag = self.get_etag('/api/reports/')
+        with CaptureQueriesContext(connection) as context:
+            response = self.get('/api/reports/', etag=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(any('COUNT(' in query['sql'].upper() for query in context.captured_queries))
+        self.assertEqual(self.get('/api/reports/', etag='"stale"').status_code, 200)
+
+    def test_etag_depends_on_viewer_and_query(self):
+        etag = self.get_etag('/api/reports/')
+
+        self.assertNotEqual(self.get_etag('/api/reports/', self.citizen), etag)
+        self.assertNotEqual(self.get_etag('/api/reports/?fields=id'), etag)
+
+    def test_report_changes_bust_list(self):
+        etag = self.get_etag('/api/reports/')
+        self.client.force_authenticate(self.worker)
+        self.client.patch(f'/api/reports/{self.oldest.id}/status/', {'status': 'PENDING'}, format='json')
+
+        self.assertEqual(self.get('/api/reports/', etag=etag).status_code, 200)
+
+    def test_deletion_busts_list(self):
+        etag = self.get_etag('/api/reports/')
+        # The newest updated_at stays the same, only the generation changes
+        self.client.force_authenticate(self.worker)
+        self.assertEqual(self.client.delete(f'/api/reports/{self.oldest.id}/').status_code, 204)
+        self.assertEqual(self.get('/api/reports/', etag=etag).status_code, 200)
+
+        etag = self.get_etag('/api/reports/')
+        self.report.operation.delete()
+        self.assertEqual(self.get('/api/reports/', etag=etag).status_code, 200)
+
+    def test_detail_ignores_other_reports(self):
+        url = f'/api/reports/{self.report.id}/'
+        etag = self.get_etag(url)
+        self.newest.delete()
+        self.assertEqual(self.get(url, etag=etag).status_code, 304)
+
+        self.client.force_authenticate(self.worker)
+        self.client.patch(url, {'description': 'Deeper than it looks'}, format='json')
+        self.assertEqual(self.get(url, etag=etag).status_code, 200)
+
+        self.report.delete()
+        self.assertEqual(self.get(url, etag=etag).status_code, 404)
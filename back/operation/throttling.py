@@ -0,0 +1,31 @@
+import math
+
+from django.http import HttpResponse
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class ClientRateThrottle(SimpleRateThrottle):
+    """Throttle by client address, for views that take no authentication."""
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': self.get_ident(request)}
+
+
+class AnnotatedImageThrottle(ClientRateThrottle):
+    scope = 'annotated_image'
+
+
+class AnnotatedRenderThrottle(ClientRateThrottle):
+    """Annotated images that are not cached yet, each one a decode, draw and encode."""
+    scope = 'annotated_render'
+
+
+def get_throttled_response(request, throttles):
+    """429 response when any of the throttles refuses the request, None otherwise."""
+    for throttle in throttles:
+        if not throttle.allow_request(request, None):
+            response = HttpResponse('Request was throttled.', status=429)
+            wait = throttle.wait()
+            if wait is not None:
+                response['Retry-After'] = str(math.ceil(wait))
+            return response
+    return None
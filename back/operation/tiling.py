@@ -0,0 +1,149 @@
+from django.conf import settings
+import logging
+
+from .inference import box_iou
+from .registry import get_detector, get_model_version
+
+logger = logging.getLogger(__name__)
+
+
+def get_tiling_options(overrides=None):
+    """
+    Resolve sliced-inference options from settings, applying per-request overrides.
+    """
+    options = {
+        'enabled': settings.DETECTION_TILING_ENABLED,
+        'tile_size': settings.DETECTION_TILE_SIZE,
+        'overlap': settings.DETECTION_TILE_OVERLAP,
+    }
+    options.update({key: value for key, value in (overrides or {}).items() if value is not None})
+    return options
+
+def get_detection_version(tiling, model_version=None):
+    """Model version extended with the tiling options, since they change the detections."""
+    model_version = model_version or get_model_version()
+    if not tiling['enabled']:
+        return model_version
+    return f"{model_version}:tiled-nms-{tiling['tile_size']}-{tiling['overlap']:g}"
+
+def get_tile_origins(length, tile_size, stride):
+    """Start offsets along one axis, with the last tile flush against the edge."""
+    if length <= tile_size:
+        return [0]
+    origins = list(range(0, length - tile_size, stride))
+    origins.append(length - tile_size)
+    return origins
+
+def get_stride(tile_size, overlap):
+    return max(1, int(tile_size * (1 - overlap)))
+
+def slice_image(image, tile_size, overlap):
+    """
+    Split an image into overlapping tiles. Returns (x, y, tile) tuples where
+    each tile is a view into image, so no pixels are copied.
+    """
+    height, width = image.shape[:2]
+    stride = get_stride(tile_size, overlap)
+    return [
+        (x, y, image[y:y + tile_size, x:x + tile_size])
+        for y in get_tile_origins(height, tile_size, stride)
+        for x in get_tile_origins(width, tile_size, stride)
+    ]
+
+def count_tiles(height, width, tile_size, overlap):
+    """Number of tiles slice_image() cuts an image of this size into."""
+    stride = get_stride(tile_size, overlap)
+    return len(get_tile_origins(height, tile_size, stride)) * len(get_tile_origins(width, tile_size, stride))
+
+def check_tile_count(height, width, tiling):
+    """
+    Raise ValueError when sliced inference would cut an image into more than
+    DETECTION_TILE_MAX_TILES tiles, each of them a forward pass.
+    """
+    if not tiling['enabled'] or max(height, width) <= tiling['tile_size']:
+        return
+    tiles = count_tiles(height, width, tiling['tile_size'], tiling['overlap'])
+    if tiles > settings.DETECTION_TILE_MAX_TILES:
+        raise ValueError(
+            f"A {width}x{height} image would be cut into {tiles} tiles, at most "
+            f"{settings.DETECTION_TILE_MAX_TILES} are allowed. Use a larger tile size or less overlap."
+        )
+
+def shift_detections(detections, x, y):
+    """Map tile detections back to the coordinates of the original image."""
+    for detection in detections:
+        x1, y1, x2, y2 = detection['bbox']
+        detection['bbox'] = [x1 + x, y1 + y, x2 + x, y2 + y]
+    return detections
+
+def merge_detections(detections, threshold=None):
+    """
+    Class-wise non-maximum suppression across tiles and the full frame. The
+    most confident box is kept as it is and same-class boxes overlapping it
+    by an IoU above threshold are dropped, so small damage found in tiles is
+    not swallowed by a larger box around it.
+    """
+    if threshold is None:
+        threshold = settings.DETECTION_TILE_MERGE_THRESHOLD
+
+    kept = []
+    for detection in sorted(detections, key=lambda d: d['confidence'], reverse=True):
+        if not any(
+            other['class_id'] == detection['class_id'] and box_iou(other['bbox'], detection['bbox']) > threshold
+            for other in kept
+        ):
+            kept.append(detection)
+    return kept
+
+
+class TiledDetector:
+    """
+    Runs sliced inference on top of another detector. Every image larger
+    than a tile is cut into overlapping tiles, and the full frame is kept as
+    one more input so large damage such as potholes is still found. All
+    inputs of a call are batched together through the wrapped detector.
+    """
+    def __init__(self, detector, tile_size, overlap, batch_size=None):
+        self.detector = detector
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.batch_size = batch_size or settings.DETECTION_TILE_BATCH_SIZE
+
+    @property
+    def model_version(self):
+        return self.detector.model_version
+
+    def detect(self, images):
+        """Return one list of detections per decoded BGR image, in original coordinates."""
+        tiling = {'enabled': True, 'tile_size': self.tile_size, 'overlap': self.overlap}
+        for image in images:
+            check_tile_count(*image.shape[:2], tiling)
+
+        inputs = []
+        sliced = set()
+        for index, image in enumerate(images):
+            inputs.append((index, 0, 0, image))
+            if max(image.shape[:2]) > self.tile_size:
+                sliced.add(index)
+                inputs.extend((index, x, y, tile) for x, y, tile in slice_image(image, self.tile_size, self.overlap))
+
+        detections_per_image = [[] for _ in images]
+        for start in range(0, len(inputs), self.batch_size):
+            batch = inputs[start:start + self.batch_size]
+            results = self.detector.detect([tile for _, _, _, tile in batch])
+            for (index, x, y, _), detections in zip(batch, results):
+                detections_per_image[index].extend(shift_detections(detections, x, y))
+
+        logger.debug(f"Ran tiled inference on {len(images)} images as {len(inputs)} inputs")
+        return [
+            merge_detections(detections) if index in sliced else detections
+            for index, detections in enumerate(detections_per_image)
+        ]
+
+
+def get_tiled_detector(tiling, detector=None):
+    """Get a detector, by default the process one, wrapped for sliced inference when tiling is enabled."""
+    detector = detector or get_detector()
+    if not tiling['enabled']:
+        return detector
+    return TiledDetector(detector, tiling['tile_size'], tiling['overlap'])
@@ -0,0 +1,197 @@
+from datetime import timedelta
+import os
+import re
+import shutil
+import logging
+
+import cv2
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from django.core.validators import validate_image_file_extension
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.http import UnreadablePostError
+from django.utils import timezone
+
+from .jobs import enqueue_detection_job
+from .models import Operation, UploadSession, UploadFile
+from .services import apply_cached_detections, create_operation_images, decode_image_bytes, process_uploaded_images, read_upload
+from .tiling import check_tile_count, get_tiling_options
+
+logger = logging.getLogger(__name__)
+
+CONTENT_RANGE_PATTERN = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+STREAM_READ_SIZE = 64 * 1024
+
+
+def create_operation(images, longitude, latitude, tiling=None):
+    """
+    Create an operation from validated uploads. Detection runs inline, or is
+    queued for the workers unless the detection cache covers every image.
+    Returns the operation and its queued job, if any.
+    """
+    if not settings.DETECTION_ASYNC:
+        # Detect on the decoded uploads while the files are written
+        operation = Operation.objects.create()
+        process_uploaded_images(operation, images, longitude, latitude, tiling=tiling)
+        return operation, None
+
+    with transaction.atomic():
+        # Create the operation and store its images
+        operation = Operation.objects.create()
+        operation_images = create_operation_images(operation, images, longitude, latitude)
+
+        # Repeat uploads complete right away, the rest is queued for the workers
+        job = None
+        if apply_cached_detections(operation_images, images, tiling):
+            options = {'tiling': tiling} if tiling else None
+            job = enqueue_detection_job(operation, options)
+
+    return operation, job
+
+def parse_content_range(header):
+    """
+    Parse a `Content-Range: bytes start-end/size` header into
+    (start, end, size), with end exclusive.
+    """
+    match = CONTENT_RANGE_PATTERN.match(header.strip())
+    if not match:
+        raise ValueError("Content-Range header must look like 'bytes start-end/size'")
+    start, last, size = (int(value) for value in match.groups())
+    if last < start or last >= size:
+        raise ValueError("Content-Range is outside the file")
+    return start, last + 1, size
+
+def get_session_dir(session_id):
+    return os.path.join(settings.UPLOAD_SESSION_DIR, str(session_id))
+
+def get_upload_path(upload_file):
+    """Where the received bytes of a session file are kept until finalization."""
+    return os.path.join(get_session_dir(upload_file.session_id), str(upload_file.index))
+
+def write_chunk(upload_file, stream, offset, length):
+    """
+    Stream a chunk of the request body to the session file at offset, without
+    buffering it in memory. Bytes that arrived before a dropped connection
+    still count, so the client resumes right after them.
+    Returns the number of bytes written.
+    """
+    path = get_upload_path(upload_file)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    written = 0
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o600)
+    try:
+        while written < length:
+            buffer = stream.read(min(STREAM_READ_SIZE, length - written))
+            if not buffer:
+                break
+            os.pwrite(fd, buffer, offset + written)
+            written += len(buffer)
+    except UnreadablePostError as e:
+        logger.warning(f"Chunk of upload session {upload_file.session_id} file {upload_file.index} was cut short: {str(e)}")
+    finally:
+        os.close(fd)
+
+    # Chunks never start after the received bytes, so these stay contiguous.
+    # Retried or parallel chunks only ever move the offset forward.
+    UploadFile.objects.filter(id=upload_file.id).update(received=Greatest(F('received'), offset + written))
+    UploadSession.objects.filter(id=upload_file.session_id).update(updated_at=timezone.now())
+    upload_file.refresh_from_db(fields=['received'])
+    return written
+
+def validate_upload_name(name):
+    """
+    Raise ValidationError unless a session file name has an image extension,
+    as stored originals are served under it.
+    """
+    validate_image_file_extension(File(None, name=name))
+
+def open_upload_file(upload_file):
+    """
+    Open a fully received session file as an upload, validated by decoding it
+    the way DecodedImageField validates multipart uploads.
+    Returns None if it is not an image.
+    """
+    try:
+        validate_upload_name(upload_file.name)
+    except ValidationError:
+        return None
+
+    path = get_upload_path(upload_file)
+    image_file = File(open(path, 'rb'), name=upload_file.name)
+    if settings.DETECTION_ASYNC:
+        # Read from disk again when needed rather than holding every file in memory
+        decoded_image, scale = cv2.imread(path, cv2.IMREAD_REDUCED_COLOR_4), 4
+    else:
+        image_file.encoded_data = read_upload(image_file)
+        image_file.decoded_image = decoded_image = decode_image_bytes(image_file.encoded_data)
+        scale = 1
+
+    if decoded_image is None:
+        image_file.close()
+        return None
+    image_file.image_shape = (decoded_image.shape[0] * scale, decoded_image.shape[1] * scale)
+    return image_file
+
+def finalize_upload_session(session):
+    """
+    Turn a fully received session into an operation with its detection job.
+    Finalizing again returns the same operation, so clients may retry.
+    Returns the operation and its queued job, if any.
+    """
+    with transaction.atomic():
+        session = UploadSession.objects.select_for_update().get(id=session.id)
+        if session.status == 'FINALIZED':
+            if session.operation is None:
+                raise ValueError("The operation of this upload session was deleted")
+            return session.operation, session.operation.detection_jobs.order_by('-id').first()
+
+        upload_files = list(session.files.all())
+        incomplete = [upload_file.index for upload_file in upload_files if not upload_file.is_complete]
+        if incomplete:
+            raise ValueError(f"Files {incomplete} have not been fully received")
+
+        tiling = get_tiling_options(session.options.get('tiling'))
+        images = []
+        try:
+            for upload_file in upload_files:
+                image_file = open_upload_file(upload_file)
+                if image_file is None:
+                    raise ValueError(f"File {upload_file.index} ({upload_file.name}) is not a valid image")
+                images.append(image_file)
+                check_tile_count(*image_file.image_shape, tiling)
+
+            operation, job = create_operation(
+                images, session.longitude, session.latitude, session.options.get('tiling')
+            )
+        finally:
+            for image_file in images:
+                image_file.close()
+
+        session.status = 'FINALIZED'
+        session.operation = operation
+        session.save(update_fields=['status', 'operation', 'updated_at'])
+        transaction.on_commit(lambda: shutil.rmtree(get_session_dir(session.id), ignore_errors=True))
+
+    logger.info(f"Finalized upload session {session.id} into operation {operation.id} with {len(images)} images")
+    return operation, job
+
+def clear_upload_sessions(ttl=None):
+    """
+    Delete sessions untouched for ttl seconds, with any bytes left on disk.
+    Returns the number of sessions deleted.
+    """
+    ttl = settings.UPLOAD_SESSION_TTL if ttl is None else ttl
+    cutoff = timezone.now() - timedelta(seconds=ttl)
+    session_ids = list(
+        UploadSession.objects
+        .filter(updated_at__lt=cutoff)
+        .values_list('id', flat=True)
+    )
+    UploadSession.objects.filter(id__in=session_ids).delete()
+    for session_id in session_ids:
+        shutil.rmtree(get_session_dir(session_id), ignore_errors=True)
+    return len(session_ids)
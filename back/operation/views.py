@@ -1,16 +1,29 @@
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
 from django.shortcuts import get_object_or_404
-from django.db.models import Count, Case, When
+from django.http import FileResponse, Http404, HttpResponse
+from django.views.decorators.http import require_GET
+from django.db import transaction
+from django.core.cache import cache
 from django.contrib.auth import get_user_model
 import logging
 
-from .models import Operation, Report
-from .serializers import OperationSerializer, ReportSerializer
+from .models import Operation, OperationImage, OperationResult, Report, DetectionJob, UploadSession, UploadFile, Defect
+from .rendering import RENDER_SIZES, is_rendered, render_annotated_image
+from .throttling import AnnotatedImageThrottle, AnnotatedRenderThrottle, get_throttled_response
+from .serializers import get_field_selection, OperationSerializer, ReportSerializer, DetectionJobSerializer, UploadSessionSerializer, UploadFileSerializer, DamageSearchSerializer, DefectSerializer, ReportSeriesSerializer
+from .uploads import parse_content_range, write_chunk, finalize_upload_session
+from .spatial import filter_in_bbox, filter_in_radius
+from .map_tiles import get_map_tile, invalidate_operation_tiles
+from .defects import refresh_defect_counts
+from .fast_serializers import get_report_values, serialize_report_rows
+from .etags import get_report_version, get_report_etag, get_report_cache_key, get_not_modified_response, set_etag
+from .stats import count_report, count_status_change, get_dashboard_counts, get_report_series
 
 User = get_user_model()
 logger = logging.getLogger(__name__)
@@ -34,9 +47,44 @@ def check_worker_permission(user):
     """Check if user is a worker."""
     return user.is_worker
 
-def get_optimized_queryset(base_queryset):
-    """Get optimized queryset with proper select_related and prefetch_related."""
-    return base_queryset.select_related('user', 'operation').prefetch_related('operation__images__results')
+def create_operation_response(data, job):
+    """Return a created operation, with 202 and its job when detection was queued."""
+    if job is None:
+        # Detection ran inline or came from the cache
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    data['job_id'] = job.id
+    data['job_status'] = job.status
+    return Response(data, status=status.HTTP_202_ACCEPTED)
+
+# select_related and prefetch_related lookups each report field needs
+REPORT_FIELD_RELATIONS = {
+    'user_info': (['user'], []),
+    'operation': (['operation'], ['operation__images__results']),
+    'defects': ([], ['defects']),
+}
+
+def get_optimized_queryset(base_queryset, fields=None):
+    """
+    Get optimized queryset with the select_related and prefetch_related the
+    rendered report fields need, all of them when fields is None.
+    """
+    select_related, prefetch_related = [], []
+    for field, (field_select, field_prefetch) in REPORT_FIELD_RELATIONS.items():
+        if fields is None or field in fields:
+            select_related += field_select
+            prefetch_related += field_prefetch
+    if select_related:
+        base_queryset = base_queryset.select_related(*select_related)
+    if prefetch_related:
+        base_queryset = base_queryset.prefetch_related(*prefetch_related)
+    return base_queryset
+
+def get_selected_fields(view):
+    """Names of the fields a view's serializer renders for this request, None when not pruned."""
+    if not get_field_selection(view.request):
+        return None
+    return set(view.get_serializer().fields)
 
 # ViewSets
 class OperationViewSet(ModelViewSet):
@@ -44,26 +92,103 @@ class OperationViewSet(ModelViewSet):
     serializer_class = OperationSerializer
     queryset = Operation.objects.all()
 
+    def get_queryset(self):
+        fields = get_selected_fields(self)
+        if fields is None or 'processed_results' in fields:
+            return self.queryset.prefetch_related('images__results')
+        return self.queryset
+
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, **get_field_selection(self.request), **kwargs)
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
         return context
 
+    def create(self, request, *args, **kwargs):
+        """Store uploaded images and return 202 with the queued detection job."""
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return create_operation_response(serializer.data, serializer.context.get('detection_job'))
+
+    def perform_destroy(self, instance):
+        invalidate_operation_tiles([instance.id])
+        defect_ids = list(
+            Defect.objects.filter(results__operation_image__operation=instance).values_list('id', flat=True).distinct()
+        )
+        with transaction.atomic():
+            # Reports go with the operation, uncount them while their damage types are known
+            for report in instance.reports.all():
+                count_report(report, -1)
+            super().perform_destroy(instance)
+        refresh_defect_counts(defect_ids)
+
 class ReportViewSet(ModelViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = ReportSerializer
     queryset = Report.objects.all()
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['status']
+    cursor_ordering = ('-date', '-id')
 
     def get_queryset(self):
         """Return reports based on user type."""
-        base_queryset = get_optimized_queryset(self.queryset)
+        base_queryset = get_optimized_queryset(self.queryset, get_selected_fields(self))
         
         if check_worker_permission(self.request.user):
             return base_queryset  # Workers see all reports
         return base_queryset.filter(user=self.request.user)  # Users see only their own
 
+    def get_serializer(self, *args, **kwargs):
+        return super().get_serializer(*args, **get_field_selection(self.request), **kwargs)
+
+    def list(self, request, *args, **kwargs):
+        """
+        List reports from values() rows, see operation.fast_serializers.
+        Unchanged lists get 304 before anything is serialized.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        etag = get_report_etag(request, get_report_version(queryset))
+        not_modified = get_not_modified_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        fields = get_selected_fields(self)
+        queryset = get_report_values(queryset, fields)
+        page = self.paginate_queryset(queryset)
+        if page is None:
+            response = Response(serialize_report_rows(list(queryset), request, fields))
+        else:
+            response = self.get_paginated_response(serialize_report_rows(page, request, fields))
+        return set_etag(response, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            queryset = self.filter_queryset(self.get_queryset()).filter(pk=kwargs['pk'])
+        except (TypeError, ValueError):
+            raise Http404
+        version = get_report_version(queryset, membership=False)
+        if version[0] is None:
+            raise Http404
+        etag = get_report_etag(request, version)
+        not_modified = get_not_modified_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        cache_key = get_report_cache_key(request, version)
+        data = cache.get(cache_key) if settings.CACHE_ENABLED else None
+        if data is None:
+            fields = get_selected_fields(self)
+            rows = list(get_report_values(queryset, fields))
+            if not rows:
+                raise Http404
+            data = serialize_report_rows(rows, request, fields)[0]
+            if settings.CACHE_ENABLED:
+                cache.set(cache_key, data, settings.REPORT_CACHE_TTL)
+        return set_etag(Response(data), etag)
+
     def _check_worker_permissions(self, request):
         """Check if user has worker permissions for updates."""
         if not check_worker_permission(request.user):
@@ -87,6 +212,37 @@ class ReportViewSet(ModelViewSet):
             return error_response
         return super().partial_update(request, *args, **kwargs)
 
+    def perform_destroy(self, instance):
+        invalidate_operation_tiles([instance.operation_id])
+        defect_ids = list(instance.defects.values_list('id', flat=True))
+        with transaction.atomic():
+            count_report(instance, -1)
+            super().perform_destroy(instance)
+        refresh_defect_counts(defect_ids)
+
+class DefectViewSet(ReadOnlyModelViewSet):
+    """Defects merged from detections, most recently seen first - workers only."""
+    permission_classes = [IsAuthenticated]
+    serializer_class = DefectSerializer
+    queryset = Defect.objects.prefetch_related('reports').order_by('-last_seen_at', '-id')
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['damage_type', 'class_id']
+    cursor_ordering = ('-last_seen_at', '-id')
+
+    def _check_worker_permissions(self, request):
+        if not check_worker_permission(request.user):
+            return create_error_response(
+                'Only workers can access defects',
+                status_code=status.HTTP_403_FORBIDDEN
+            )
+        return None
+
+    def list(self, request, *args, **kwargs):
+        return self._check_worker_permissions(request) or super().list(request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self._check_worker_permissions(request) or super().retrieve(request, *args, **kwargs)
+
 # Function-based views
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
@@ -126,22 +282,25 @@ def update_report_status(request, report_id):
             status_code=status.HTTP_403_FORBIDDEN
         )
     
-    # Get report
-    report = get_object_or_404(Report, id=report_id)
-    
-    # Validate status
-    new_status = request.data.get('status')
-    if not new_status:
-        return create_error_response('Status is required')
-    
-    valid_statuses = ['RECEIVED', 'PENDING', 'IN_PROGRESS', 'COMPLETED']
-    if new_status not in valid_statuses:
-        return create_error_response(f'Invalid status. Valid options: {valid_statuses}')
-    
-    # Update report
-    old_status = report.status
-    report.status = new_status
-    report.save()
+    with transaction.atomic():
+        # Get report, locked so concurrent updates count from the status the other one left
+        report = get_object_or_404(Report.objects.select_for_update(), id=report_id)
+        
+        # Validate status
+        new_status = request.data.get('status')
+        if not new_status:
+            return create_error_response('Status is required')
+        
+        valid_statuses = ['RECEIVED', 'PENDING', 'IN_PROGRESS', 'COMPLETED']
+        if new_status not in valid_statuses:
+            return create_error_response(f'Invalid status. Valid options: {valid_statuses}')
+        
+        # Update report
+        old_status = report.status
+        report.status = new_status
+        report.save()
+        count_status_change(report, old_status, new_status)
+    invalidate_operation_tiles([report.operation_id])
     
     logger.info(f"Report #{report.id} status updated from {old_status} to {new_status} by {request.user.username}")
     
@@ -154,6 +313,225 @@ def update_report_status(request, report_id):
         }
     )
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_detection_job_status(request, job_id):
+    """Get the status of a detection job and each of its images."""
+    job = get_object_or_404(
+        DetectionJob.objects.select_related('operation').prefetch_related('operation__images'),
+        id=job_id
+    )
+    serializer = DetectionJobSerializer(job)
+    return create_success_response('Detection job status retrieved successfully', data=serializer.data)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def create_upload_session(request):
+    """
+    Start a resumable upload of operation images. The client declares each
+    file's name and size, then PUTs chunks of them and finalizes the session.
+    """
+    serializer = UploadSessionSerializer(data=request.data, context={'request': request})
+    if not serializer.is_valid():
+        return create_error_response('Failed to create upload session', errors=serializer.errors)
+
+    session = serializer.save()
+    logger.info(f"Upload session #{session.id} with {len(serializer.data['files'])} files started by {request.user.username}")
+    return create_success_response(
+        'Upload session created successfully',
+        data=serializer.data,
+        status_code=status.HTTP_201_CREATED
+    )
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_upload_session(request, session_id):
+    """Get the progress of an upload session, i.e. the bytes received of each file."""
+    session = get_object_or_404(UploadSession.objects.prefetch_related('files'), id=session_id, user=request.user)
+    serializer = UploadSessionSerializer(session)
+    return create_success_response('Upload session retrieved successfully', data=serializer.data)
+
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated])
+def upload_session_chunk(request, session_id, index):
+    """
+    Write a chunk of a session file. The raw body holds the bytes given by a
+    `Content-Range: bytes start-end/size` header and is streamed to disk.
+    Chunks may repeat bytes already received but must not leave a gap.
+    """
+    upload_file = get_object_or_404(
+        UploadFile.objects.select_related('session'),
+        session_id=session_id,
+        session__user=request.user,
+        index=index
+    )
+    if upload_file.session.status != 'OPEN':
+        return create_error_response('Upload session is already finalized', status_code=status.HTTP_409_CONFLICT)
+
+    try:
+        start, end, size = parse_content_range(request.headers.get('Content-Range', ''))
+    except ValueError as e:
+        return create_error_response(str(e))
+
+    length = end - start
+    if size != upload_file.size:
+        return create_error_response(f'Content-Range size does not match the declared size of {upload_file.size} bytes')
+    if length > settings.UPLOAD_CHUNK_MAX_SIZE:
+        return create_error_response(
+            f'Chunks can be at most {settings.UPLOAD_CHUNK_MAX_SIZE} bytes',
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+    if int(request.META.get('CONTENT_LENGTH') or 0) != length:
+        return create_error_response('Content-Length does not match Content-Range')
+    if start > upload_file.received:
+        return create_error_response(
+            'Chunk starts after the received bytes, resume from the received offset',
+            errors=UploadFileSerializer(upload_file).data,
+            status_code=status.HTTP_409_CONFLICT
+        )
+
+    written = write_chunk(upload_file, request.stream, start, length)
+    data = UploadFileSerializer(upload_file).data
+    if written < length:
+        return create_error_response('Chunk was cut short, resume from the received offset', errors=data)
+    return create_success_response('Chunk received', data=data)
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def finalize_upload(request, session_id):
+    """Create the operation of a fully received upload session and queue its detection."""
+    session = get_object_or_404(UploadSession, id=session_id, user=request.user)
+    try:
+        operation, job = finalize_upload_session(session)
+    except ValueError as e:
+        return create_error_response(str(e))
+
+    serializer = OperationSerializer(operation, context={'request': request})
+    return create_operation_response(serializer.data, job)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_damage(request):
+    """
+    Find detected damage within a radius of a point or inside a bounding box,
+    newest first. Pages are keyset based: pass `next_cursor` back as `cursor`.
+    Users only see damage from their own reports.
+    """
+    params = DamageSearchSerializer(data=request.query_params)
+    if not params.is_valid():
+        return create_error_response('Invalid damage search', errors=params.errors)
+    params = params.validated_data
+
+    # Report conditions go in one filter() so they share a single join
+    report_filter = {}
+    if not check_worker_permission(request.user):
+        report_filter['operation_image__operation__reports__user'] = request.user
+    if params.get('status'):
+        report_filter['operation_image__operation__reports__status__in'] = params['status']
+
+    queryset = OperationResult.objects.filter(**report_filter)
+    if 'bbox' in params:
+        queryset = filter_in_bbox(queryset, *params['bbox'], prefix='operation_image__')
+    else:
+        queryset = filter_in_radius(queryset, params['lat'], params['lon'], params['radius'], prefix='operation_image__')
+
+    if params.get('damage_type'):
+        queryset = queryset.filter(damage_type__in=params['damage_type'])
+    if params.get('class_id'):
+        queryset = queryset.filter(class_id__in=params['class_id'])
+    if 'min_confidence' in params:
+        queryset = queryset.filter(confidence__gte=params['min_confidence'])
+    if 'cursor' in params:
+        queryset = queryset.filter(id__lt=params['cursor'])
+
+    fields = [
+        'id', 'damage_type', 'class_id', 'confidence', 'operation_image_id',
+        'operation_image__latitude', 'operation_image__longitude',
+        'operation_image__operation_id', 'operation_image__operation__reports__id',
+        'operation_image__operation__reports__status',
+    ]
+    if 'bbox' not in params:
+        fields.append('distance')
+    page_size = params['page_size']
+    rows = list(queryset.order_by('-id').values(*fields)[:page_size + 1])
+
+    results = [
+        {
+            'id': row['id'],
+            'damage_type': row['damage_type'],
+            'class_id': row['class_id'],
+            'confidence': row['confidence'],
+            'image_id': row['operation_image_id'],
+            'latitude': float(row['operation_image__latitude']),
+            'longitude': float(row['operation_image__longitude']),
+            'operation_id': row['operation_image__operation_id'],
+            'report_id': row['operation_image__operation__reports__id'],
+            'report_status': row['operation_image__operation__reports__status'],
+            **({'distance': round(row['distance'], 1)} if 'distance' in row else {}),
+        }
+        for row in rows[:page_size]
+    ]
+    return create_success_response('Damage retrieved successfully', data={
+        'results': results,
+        'next_cursor': results[-1]['id'] if len(rows) > page_size else None,
+    })
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_damage_map_tile(request, z, x, y):
+    """
+    Damage in a web mercator tile as compact GeoJSON, served without the
+    usual response envelope so map clients can load it directly.
+    Low zooms get clusters with counts per class, high zooms single detections.
+    """
+    if z > settings.DAMAGE_MAP_MAX_ZOOM or x >= 2 ** z or y >= 2 ** z:
+        return create_error_response(
+            f'Invalid tile, zoom goes up to {settings.DAMAGE_MAP_MAX_ZOOM}',
+            status_code=status.HTTP_404_NOT_FOUND
+        )
+    content = get_map_tile(request.user, z, x, y)
+    return HttpResponse(content, content_type='application/geo+json')
+
+@require_GET
+def get_annotated_image(request, image_id):
+    """
+    Serve an image with its detections drawn on, rendered on first request.
+    Plain Django view so image clients are not subject to DRF auth or content negotiation,
+    matching the public media URLs annotated images used to have. Throttled per
+    client instead, renders more tightly than cached images.
+    """
+    throttled = get_throttled_response(request, [AnnotatedImageThrottle()])
+    if throttled is not None:
+        return throttled
+
+    size = request.GET.get('size', 'full')
+    if size not in RENDER_SIZES:
+        raise Http404(f"Invalid size. Valid options: {list(RENDER_SIZES)}")
+
+    operation_image = get_object_or_404(OperationImage.objects.prefetch_related('results'), id=image_id)
+    if not operation_image.results.all():
+        raise Http404("Image has no detections")
+    if not is_rendered(operation_image, size):
+        throttled = get_throttled_response(request, [AnnotatedRenderThrottle()])
+        if throttled is not None:
+            return throttled
+
+    try:
+        try:
+            image_file = open(render_annotated_image(operation_image, size), 'rb')
+        except FileNotFoundError:
+            # Evicted by another worker before it was opened, render it once more
+            image_file = open(render_annotated_image(operation_image, size), 'rb')
+    except (OSError, ValueError) as e:
+        logger.error(f"Error rendering annotated image {image_id}: {str(e)}")
+        raise Http404("Annotated image unavailable")
+
+    response = FileResponse(image_file, content_type='image/jpeg')
+    if request.GET.get('v'):
+        # Versioned URLs never change content
+        response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_dashboard_stats(request):
@@ -165,13 +543,36 @@ def get_dashboard_stats(request):
             status_code=status.HTTP_403_FORBIDDEN
         )
         
-    # Get statistics
-    stats = Report.objects.aggregate(
-        total_reports=Count('id'),
-        received=Count(Case(When(status='RECEIVED', then=1))),
-        pending=Count(Case(When(status='PENDING', then=1))),
-        in_progress=Count(Case(When(status='IN_PROGRESS', then=1))),
-        completed=Count(Case(When(status='COMPLETED', then=1)))
-    )
+    # Read the counters maintained on report changes instead of scanning reports
+    counts = get_dashboard_counts()
+    stats = {
+        'total_reports': sum(counts.values()),
+        'received': counts['RECEIVED'],
+        'pending': counts['PENDING'],
+        'in_progress': counts['IN_PROGRESS'],
+        'completed': counts['COMPLETED'],
+    }
     
     return create_success_response('Dashboard stats retrieved successfully', data=stats)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_report_series_stats(request):
+    """Reports per day or week by status or damage type - workers only."""
+    if not check_worker_permission(request.user):
+        return create_error_response(
+            'Only workers can access dashboard stats',
+            status_code=status.HTTP_403_FORBIDDEN
+        )
+
+    params = ReportSeriesSerializer(data=request.query_params)
+    if not params.is_valid():
+        return create_error_response('Invalid report series', errors=params.errors)
+    params = params.validated_data
+
+    series = get_report_series(params['bucket'], params['dimension'], params['start'], params['end'])
+    return create_success_response('Report series retrieved successfully', data={
+        'bucket': params['bucket'],
+        'dimension': params['dimension'],
+        'series': series,
+    })
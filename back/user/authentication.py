@@ -0,0 +1,41 @@
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from api.cache import get_or_compute
+from .cache import get_user_cache_name
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication loading the user of the token from the cache instead of
+    the database on every request, with the same checks. Saves, deletes and
+    bulk updates of users invalidate it.
+    """
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        def load_user():
+            # The password hash stays out of the cache, saving a user without it leaves it unchanged.
+            # Only its digest is kept, for CHECK_REVOKE_TOKEN.
+            users = self.user_model.objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+            user = users.defer('password').first()
+            if user is not None:
+                user.password_digest = get_md5_hash_password(users.values_list('password', flat=True).first())
+            return user
+
+        user = get_or_compute(get_user_cache_name(user_id), load_user, settings.USER_CACHE_TTL)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != user.password_digest:
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
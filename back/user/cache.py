@@ -0,0 +1,9 @@
+from api.cache import invalidate_on_commit
+
+
+def get_user_cache_name(user_id):
+    return f'user:{user_id}'
+
+def invalidate_user_cache(user_id):
+    """Drop the cached copy of a user requests authenticate with, once the change commits."""
+    invalidate_on_commit(get_user_cache_name(user_id))
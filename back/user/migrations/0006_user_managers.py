@@ -0,0 +1,20 @@
+# Generated by Django 5.1 on 2026-10-18 02:47
+
+import user.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0005_remove_fcm_token'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', user.models.CachedUserManager()),
+            ],
+        ),
+    ]
@@ -1,6 +1,24 @@
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
 
+from .cache import invalidate_user_cache
+
+
+class UserQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # Bulk updates skip post_save, drop the cached copies of the users they change
+        user_ids = list(self.values_list('pk', flat=True))
+        updated = super().update(**kwargs)
+        for user_id in user_ids:
+            invalidate_user_cache(user_id)
+        return updated
+
+
+class CachedUserManager(UserManager):
+    """UserManager whose querysets invalidate the cached users they update."""
+    def get_queryset(self):
+        return UserQuerySet(self.model, using=self._db)
+
 
 class User(AbstractUser):
     username = models.CharField(max_length=150, unique=True)
@@ -23,6 +41,10 @@ class User(AbstractUser):
         blank=True,
     )
 
+    # Requests authenticate with a cached copy of the user, see user.authentication.
+    # Saves and deletes invalidate it in user.signals, bulk updates in UserQuerySet.
+    objects = CachedUserManager()
+
     def __str__(self):
         return f"{self.username} ({'Worker' if self.is_worker else 'User'})"
 
@@ -60,20 +60,6 @@ class LoginSerializer(serializers.Serializer):
         }
 
 
-class UserReportsSerializer(serializers.Serializer):
-    def __init__(self, *args, **kwargs):
-        self.user = kwargs.pop('user', None)
-        super().__init__(*args, **kwargs)
-
-    def to_representation(self, instance):
-        from operation.models import Report
-        from operation.serializers import ReportSerializer
-        
-        reports = Report.objects.filter(user=self.user).order_by('-date')
-        request = self.context.get('request')
-        return ReportSerializer(reports, many=True, context={'request': request}).data
-
-
 class UpdateUserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
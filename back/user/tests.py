@@ -1,3 +1,145 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from operation.models import Operation, OperationImage, OperationResult, Report
+from .models import User
+
+
+class UserReportsViewTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='citizen', email='citizen@example.com', password='password123')
+        self.client.force_authenticate(self.user)
+        self.url = reverse('user-reports')
+
+    def create_reports(self, count):
+        for index in range(count):
+            operation = Operation.objects.create()
+            for _ in range(2):
+                operation_image = OperationImage.objects.create(
+                    operation=operation,
+                    original_image='operation_images/original/test.jpg',
+                    longitude=3.05,
+                    latitude=36.75,
+                    detection_status='DONE',
+                )
+                OperationResult.objects.create(
+                    operation_image=operation_image,
+                    damage_description='Type: Pothole (D40), Confidence: 0.90',
+                    damage_type='Pothole (D40)',
+                    class_id=3,
+                    confidence=0.9,
+                    bbox_x1=1, bbox_y1=2, bbox_x2=3, bbox_y2=4,
+                )
+            Report.objects.create(operation=operation, user=self.user, description=f'Report {index}')
+
+    def count_queries(self, page_size):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, {'page_size': page_size})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['data']), page_size)
+        return len(context.captured_queries)
+
+    def test_query_count_does_not_depend_on_reports(self):
+        self.create_reports(3)
+        few = self.count_queries(page_size=3)
+
+        self.create_reports(20)
+        many = self.count_queries(page_size=20)
+
+        self.assertEqual(few, many)
+
+    def test_pages_follow_cursor(self):
+        self.create_reports(7)
+        other_user = User.objects.create_user(username='other', email='other@example.com', password='password123')
+        Report.objects.create(operation=Operation.objects.create(), user=other_user)
+
+        seen = []
+        url, params = self.url, {'page_size': 3}
+        while url:
+            response = self.client.get(url, params)
+            self.assertTrue(response.data['success'])
+            seen.extend(report['id'] for report in response.data['data'])
+            url, params = response.data['next'], None
+
+        expected = list(Report.objects.filter(user=self.user).order_by('-date', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+
+@override_settings(CACHE_ENABLED=True)
+class CachedAuthenticationTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='citizen', email='citizen@example.com', password='password123')
+        self.url = reverse('user-detail')
+        self.authenticate()
+
+    def authenticate(self):
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def get_user(self):
+        response = self.client.get(self.url)
+        return response.status_code, response.data.get('data')
+
+    def count_user_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        return sum(User._meta.db_table in query['sql'] for query in context.captured_queries)
+
+    def test_user_is_loaded_once(self):
+        self.assertEqual(self.count_user_queries(), 2)
+        self.assertEqual(self.count_user_queries(), 0)
+
+    def test_saving_cached_user_keeps_password(self):
+        self.get_user()
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.put(reverse('update-user'), {'phone_number': '0555 12 34 56'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('password123'))
+
+    def test_save_invalidates_cached_user(self):
+        self.get_user()
+        self.user.phone_number = '0555 12 34 56'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+
+        status_code, data = self.get_user()
+        self.assertEqual((status_code, data['phone_number']), (200, '0555 12 34 56'))
+
+    def test_bulk_update_invalidates_cached_user(self):
+        self.get_user()
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(id=self.user.id).update(is_active=False)
+
+        self.assertEqual(self.get_user()[0], 401)
+
+    def test_delete_invalidates_cached_user(self):
+        self.get_user()
+        with self.captureOnCommitCallbacks(execute=True):
+            User.objects.filter(id=self.user.id).delete()
+
+        self.assertEqual(self.get_user()[0], 401)
+
+    def test_password_change_revokes_tokens(self):
+        # override_settings(SIMPLE_JWT=...) rebinds api_settings, missing modules that imported it
+        with mock.patch.object(api_settings, 'CHECK_REVOKE_TOKEN', True):
+            self.authenticate()
+            self.assertEqual(self.get_user()[0], 200)
+
+            self.user.set_password('new-password123')
+            with self.captureOnCommitCallbacks(execute=True):
+                self.user.save()
+            self.assertEqual(self.get_user()[0], 401)
+
+            self.authenticate()
+            self.assertEqual(self.get_user()[0], 200)
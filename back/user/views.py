@@ -7,9 +7,13 @@ from .serializers import (
     UserSerializer, 
     CreateUserSerializer, 
     UpdateUserSerializer, 
-    LoginSerializer,
-    UserReportsSerializer
+    LoginSerializer
 )
+from api.pagination import KeysetPagination
+from operation.models import Report
+from operation.serializers import ReportSerializer, get_field_selection
+from operation.fast_serializers import get_report_values, serialize_report_rows
+from operation.etags import get_report_version, get_report_etag, get_not_modified_response, set_etag, touch_reports
 
 
 class RegisterView(generics.CreateAPIView):
@@ -74,11 +78,33 @@ def user_detail_view(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def user_reports_view(request):
-    serializer = UserReportsSerializer(user=request.user, context={'request': request})
-    return Response({
+    """
+    The user's reports, newest first, a page at a time. Follow `next` for
+    more. Related rows are loaded with one query per nested field, so the
+    query count does not grow with the page size. ?fields= and ?expand=
+    prune the reports as in /api/reports/.
+    """
+    reports = Report.objects.filter(user=request.user)
+    report_status = request.query_params.get('status')
+    if report_status:
+        reports = reports.filter(status=report_status)
+
+    # Unchanged reports get 304 before anything is serialized
+    etag = get_report_etag(request, get_report_version(reports))
+    not_modified = get_not_modified_response(request, etag)
+    if not_modified is not None:
+        return not_modified
+
+    selection = get_field_selection(request)
+    fields = set(ReportSerializer(**selection).fields) if selection else None
+    paginator = KeysetPagination(('-date', '-id'))
+    page = paginator.paginate_queryset(get_report_values(reports, fields), request)
+    return set_etag(Response({
         'success': True,
-        'data': serializer.to_representation(None)
-    })
+        'data': serialize_report_rows(page, request, fields),
+        'next': paginator.get_next_link(),
+        'previous': paginator.get_previous_link(),
+    }), etag)
 
 
 @api_view(['PUT'])
@@ -88,6 +114,8 @@ def update_user_view(request):
     
     if serializer.is_valid():
         serializer.save()
+        # Reports embed their user's details
+        touch_reports(Report.objects.filter(user=request.user))
         return Response({
             'success': True,
             'message': 'User updated successfully.',